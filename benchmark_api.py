@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+API 負載效能測試
+以暫存的 SQLite 資料庫執行主要端點，在行程內（httpx ASGITransport 直接呼叫 app）
+或行程外（uvicorn workers）以指定的並行數量送出請求，回報每個端點的 RPS 與 p50 / p95 / p99 延遲，
+結果可存成 JSON 並與之前的結果比較
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STORY_ID = "forest_adventure"
+
+# 測試的端點：名稱、方法、路徑、請求內容
+SCENARIOS: List[Tuple[str, str, str, Optional[Dict[str, Any]]]] = [
+    ("health", "GET", "/health", None),
+    ("list_stories", "GET", "/api/stories", None),
+    ("story_info", "GET", f"/api/stories/{STORY_ID}", None),
+    ("story_chapters", "GET", f"/api/stories/{STORY_ID}/chapters", None),
+    ("story_engine", "POST", f"/api/story_engine/{STORY_ID}/1",
+     {"game_state": {"health": 80, "has_map": True, "courage": 12}}),
+    ("story_engine_legacy", "POST", "/api/story_engine/2", {"game_state": {"has_key": True}}),
+    ("roll_dice", "POST", "/api/roll_dice", {"dice_count": 2, "dice_sides": 20, "modifier": 3})
+]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序數列的百分位數（nearest rank）"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """單一端點的統計（延遲以毫秒表示）"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": round(count / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3)
+    }
+
+async def run_scenario(client: httpx.AsyncClient, method: str, path: str, body: Optional[Dict[str, Any]],
+                       requests: int, concurrency: int) -> Dict[str, float]:
+    """以 concurrency 個並行的工作送出共 requests 個請求"""
+    latencies: List[float] = []
+    errors = [0]
+    remaining = [requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+async def run_all(client: httpx.AsyncClient, requests: int, concurrency: int, warmup: int,
+                  only: Optional[List[str]]) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, method, path, body in SCENARIOS:
+        if only and name not in only:
+            continue
+        for _ in range(warmup):
+            await client.request(method, path, json=body)
+        results[name] = await run_scenario(client, method, path, body, requests, concurrency)
+        stats = results[name]
+        print(f"   • {name:<20} {stats['rps']:>9.1f} req/s   p50 {stats['p50_ms']:>8.2f}   "
+              f"p95 {stats['p95_ms']:>8.2f}   p99 {stats['p99_ms']:>8.2f} 毫秒   錯誤 {stats['errors']}")
+    return results
+
+def seed_database(env: Dict[str, str]):
+    """在暫存資料庫建立資料表與預設故事"""
+    subprocess.run([sys.executable, os.path.join(PROJECT_DIR, "seed_data.py")], env=env, cwd=PROJECT_DIR,
+                   check=True, stdout=subprocess.DEVNULL)
+
+def benchmark_in_process(requests: int, concurrency: int, warmup: int, only: Optional[List[str]]):
+    """行程內：httpx 的 ASGITransport 直接呼叫 app，不經過網路與 uvicorn"""
+    sys.path.insert(0, PROJECT_DIR)
+    from main import app  # DATABASE_URL 已指向暫存資料庫
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await run_all(client, requests, concurrency, warmup, only)
+
+    return asyncio.run(run())
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn 啟動失敗（結束代碼 {process.returncode}）")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"uvicorn 在 {timeout} 秒內沒有回應")
+
+def benchmark_uvicorn(env: Dict[str, str], workers: int, requests: int, concurrency: int, warmup: int,
+                      only: Optional[List[str]]):
+    """行程外：啟動 uvicorn（workers 個行程），經由 HTTP 送出請求"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=env, cwd=PROJECT_DIR
+    )
+    try:
+        wait_for_server(base_url, process)
+
+        async def run():
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+                return await run_all(client, requests, concurrency, warmup, only)
+
+        return asyncio.run(run())
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """與之前的結果比較，回傳 p95 延遲增加或 RPS 下降超過 max_regression（比例）的端點"""
+    regressions = []
+    print(f"📊 與 {baseline.get('timestamp', '之前的結果')} 比較:")
+    for name, stats in current["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        p95_change = (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0.0
+        rps_change = (stats["rps"] - previous["rps"]) / previous["rps"] if previous["rps"] else 0.0
+        regressed = p95_change > max_regression or rps_change < -max_regression
+        marker = "❌" if regressed else "✅"
+        print(f"   {marker} {name:<20} RPS {rps_change:+7.1%}   p95 {p95_change:+7.1%}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="API 負載效能測試（暫存 SQLite 資料庫）")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="inprocess",
+                        help="行程內（ASGITransport）、行程外（uvicorn）或兩者（預設 inprocess）")
+    parser.add_argument("-n", "--requests", type=int, default=500, help="每個端點的請求數（預設 500）")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="並行的請求數（預設 10）")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 數量（預設 1）")
+    parser.add_argument("--warmup", type=int, default=20, help="每個端點正式計時前的暖身請求數（預設 20）")
+    parser.add_argument("--endpoint", action="append", choices=[name for name, *_ in SCENARIOS],
+                        help="只測試指定的端點（可重複指定）")
+    parser.add_argument("-o", "--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--compare", help="與之前存下的 JSON 結果比較")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="比較時允許的 p95 延遲增加 / RPS 下降比例，超過時以錯誤結束（預設 0.2）")
+
+    args = parser.parse_args()
+
+    print("⏱️ Story Engine API Benchmark")
+    print("=" * 50)
+    print(f"📨 每個端點 {args.requests} 個請求，並行 {args.concurrency}")
+
+    with tempfile.TemporaryDirectory(prefix="story_benchmark_") as temp_dir:
+        # 在匯入 main / models 之前設定資料庫，所有端點都使用暫存的 SQLite 資料庫
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir, 'benchmark.db')}"
+        os.environ.setdefault("JOB_OUTPUT_DIR", os.path.join(temp_dir, "job_outputs"))
+        env = dict(os.environ)
+        seed_database(env)
+
+        results: Dict[str, Any] = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "runs": {}
+        }
+        if args.mode in ("inprocess", "both"):
+            print("🧪 行程內（httpx ASGITransport）:")
+            results["runs"]["inprocess"] = {
+                "endpoints": benchmark_in_process(args.requests, args.concurrency, args.warmup, args.endpoint)
+            }
+        if args.mode in ("uvicorn", "both"):
+            print(f"🌐 uvicorn（{args.workers} 個 worker）:")
+            results["runs"]["uvicorn"] = {
+                "workers": args.workers,
+                "endpoints": benchmark_uvicorn(env, args.workers, args.requests, args.concurrency,
+                                               args.warmup, args.endpoint)
+            }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 結果已寫入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for mode, run in results["runs"].items():
+            if mode in baseline.get("runs", {}):
+                print(f"[{mode}]")
+                regressions += compare_results(run, {"timestamp": baseline.get("timestamp"), **baseline["runs"][mode]},
+                                               args.max_regression)
+        if regressions:
+            print(f"❌ 效能退步超過 {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ 沒有超過門檻的效能退步")
+
+if __name__ == "__main__":
+    main()
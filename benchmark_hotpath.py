@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+章節請求熱路徑微效能測試
+計時 process_conditional_content（不同章節長度、條件密度與遊戲狀態大小）、選項 JSON 解析與 StoryEngineResponse 建立，
+所有項目輪流執行多輪，以中位數與 benchmark_hotpath_baseline.json 比較（雜訊較大的項目依基準的離散程度放寬門檻），超過門檻時以錯誤結束
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+# 微效能測試不存取資料庫；main 匯入時會建立資料表，改用記憶體中的 SQLite
+os.environ["DATABASE_URL"] = "sqlite://"
+
+from main import parse_options, process_conditional_content
+from schemas import StoryEngineResponse
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(PROJECT_DIR, "benchmark_hotpath_baseline.json")
+
+# 章節長度（字元）、條件密度（每多少字元一個條件，0 表示沒有條件）、遊戲狀態變數數量
+CONTENT_SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+CONDITION_DENSITIES = {"none": 0, "sparse": 1_000, "dense": 100}
+STATE_SIZES = {"state10": 10, "state1000": 1_000}
+OPTION_COUNTS = (2, 10, 50)
+# 基準耗時低於此值（奈秒）的項目受計時誤差影響太大，只顯示變化，不判定退步
+MIN_COMPARE_NS = 1_000
+# 雜訊較大的項目門檻放寬到基準的離散程度，但最多放寬到這個比例
+MAX_NOISE_THRESHOLD = 0.5
+
+SENTENCE = "你沿著蜿蜒的小徑前進，樹葉在風中沙沙作響。"
+
+def make_game_state(size: int) -> Dict[str, Any]:
+    """產生指定變數數量的遊戲狀態（一半布林值、一半數值）"""
+    state: Dict[str, Any] = {}
+    for index in range(size):
+        if index % 2 == 0:
+            state[f"flag_{index}"] = index % 4 == 0
+        else:
+            state[f"stat_{index}"] = index % 20
+    return state
+
+def make_content(length: int, density: int, state: Dict[str, Any], seed: int = 42) -> str:
+    """產生指定長度的章節內容，每 density 個字元插入一個條件（布林、NOT 與數值比較各佔三分之一）"""
+    rng = random.Random(seed)
+    flags = [name for name in state if name.startswith("flag_")]
+    stats = [name for name in state if name.startswith("stat_")]
+    parts: List[str] = []
+    size = 0
+    next_condition = density
+    while size < length:
+        if density and size >= next_condition:
+            kind = rng.randrange(3)
+            if kind == 0:
+                condition = rng.choice(flags)
+            elif kind == 1:
+                condition = f"NOT {rng.choice(flags)}"
+            else:
+                condition = f"{rng.choice(stats)} >= {rng.randint(0, 20)}"
+            part = f"[[IF {condition}]]{SENTENCE}[[ENDIF]]"
+            next_condition += density
+        else:
+            part = SENTENCE
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+def make_options(count: int) -> List[Dict[str, Any]]:
+    return [
+        {"text": f"選擇第 {index + 1} 條路", "next_id": index + 2, "game_state": {"flag_0": True, "stat_1": 1}}
+        for index in range(count)
+    ]
+
+def build_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    """所有測試項目：名稱與要計時的函數"""
+    cases: List[Tuple[str, Callable[[], Any]]] = []
+    for state_name, state_size in STATE_SIZES.items():
+        state = make_game_state(state_size)
+        for size_name, length in CONTENT_SIZES.items():
+            for density_name, density in CONDITION_DENSITIES.items():
+                content = make_content(length, density, state)
+                cases.append((
+                    f"render/{size_name}/{density_name}/{state_name}",
+                    lambda content=content, state=state: process_conditional_content(content, state)
+                ))
+
+    for count in OPTION_COUNTS:
+        options = make_options(count)
+        raw = json.dumps(options, ensure_ascii=False)
+        cases.append((f"options_decode/json/{count}", lambda raw=raw: parse_options(raw)))
+        cases.append((f"options_decode/native/{count}", lambda options=options: parse_options(options)))
+
+        content = make_content(2_000, 200, make_game_state(10))
+
+        def build_response(options=options, content=content):
+            return StoryEngineResponse(
+                story_id="forest_adventure", story_title="森林冒險", chapter_id=1,
+                title="森林入口", content=content, options=options
+            )
+
+        response = build_response()
+        cases.append((f"response_model/build/{count}", build_response))
+        cases.append((f"response_model/serialize/{count}", response.model_dump_json))
+    return cases
+
+def measure(timer: timeit.Timer, number: int, samples: int) -> List[float]:
+    """每次呼叫的耗時（奈秒），共 samples 個樣本，每個樣本連續呼叫 number 次"""
+    return [total / number * 1e9 for total in timer.repeat(repeat=samples, number=number)]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """樣本的中位數與範圍（範圍即這台機器上的雜訊帶）"""
+    return {
+        "median_ns": round(statistics.median(samples), 1),
+        "min_ns": round(min(samples), 1),
+        "max_ns": round(max(samples), 1),
+        "samples": len(samples)
+    }
+
+def run_benchmarks(rounds: int, samples: int, only: List[str]) -> Dict[str, Any]:
+    """所有項目輪流執行 rounds 輪，機器負載的短暫變化會分散到各個項目，而不是集中在少數幾個"""
+    cases = [
+        (name, timeit.Timer(func)) for name, func in build_cases()
+        if not only or any(name.startswith(prefix) for prefix in only)
+    ]
+    # 以 autorange 決定每個樣本的呼叫次數（約 0.2 秒），之後每一輪都使用相同的次數
+    numbers = {name: timer.autorange()[0] for name, timer in cases}
+    collected: Dict[str, List[float]] = {name: [] for name, _ in cases}
+    for round_index in range(rounds):
+        print(f"🔁 第 {round_index + 1}/{rounds} 輪")
+        for name, timer in cases:
+            collected[name].extend(measure(timer, numbers[name], samples))
+
+    benchmarks = {name: summarize(values) for name, values in collected.items()}
+    for name, stats in benchmarks.items():
+        spread = (stats["max_ns"] - stats["min_ns"]) / stats["median_ns"]
+        print(f"   • {name:<36} {stats['median_ns'] / 1000:>10.2f} 微秒  ±{spread / 2:.0%}")
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "rounds": rounds,
+        "samples": samples,
+        "benchmarks": benchmarks
+    }
+
+def regression_threshold(previous: Dict[str, float], max_regression: float) -> float:
+    """項目的退步門檻：max_regression，基準的離散程度（最慢樣本比中位數慢的比例）較大時放寬，最多到 MAX_NOISE_THRESHOLD"""
+    spread = previous["max_ns"] / previous["median_ns"] - 1
+    return max(max_regression, min(spread, MAX_NOISE_THRESHOLD))
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """比較中位數，比基準中位數慢超過門檻（見 regression_threshold）的項目視為退步"""
+    regressions = []
+    print(f"📊 與基準（{baseline.get('timestamp', '未知時間')}，Python {baseline.get('python', '?')}）比較:")
+    if (baseline.get("python"), baseline.get("platform")) != (current["python"], current["platform"]):
+        print("⚠️  基準來自不同的 Python 版本或平台，結果僅供參考，請在這台機器上以 --update-baseline 重新建立基準")
+    for name, stats in current["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or "median_ns" not in previous:
+            print(f"   ➕ {name:<36} 基準中沒有這個項目")
+            continue
+        change = stats["median_ns"] / previous["median_ns"] - 1
+        threshold = regression_threshold(previous, max_regression)
+        regressed = change > threshold and previous["median_ns"] >= MIN_COMPARE_NS
+        if regressed:
+            regressions.append(name)
+        print(f"   {'❌' if regressed else '✅'} {name:<36} {change:+7.1%}（門檻 {threshold:+.0%}）")
+    return regressions
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="章節請求熱路徑微效能測試")
+    parser.add_argument("--rounds", type=int, default=3, help="所有項目輪流執行的輪數（預設 3，建立基準時建議 5 以上）")
+    parser.add_argument("--samples", type=int, default=3, help="每個項目每一輪的樣本數（預設 3）")
+    parser.add_argument("--only", action="append", default=[], help="只執行名稱以此開頭的項目，例如 render/100k（可重複指定）")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基準結果檔案（預設 benchmark_hotpath_baseline.json）")
+    parser.add_argument("--update-baseline", action="store_true", help="將這次的結果寫入基準檔案")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="中位數比基準中位數慢的允許比例，基準雜訊較大的項目最多放寬到 50%%，超過時以錯誤結束（預設 0.25）")
+    parser.add_argument("-o", "--output", help="將結果另外寫入 JSON 檔案")
+
+    args = parser.parse_args()
+
+    print("⏱️ Story Engine Hot Path Benchmark")
+    print("=" * 50)
+    results = run_benchmarks(args.rounds, args.samples, args.only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 結果已寫入 {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"💾 基準已更新: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  找不到基準檔案 {args.baseline}，以 --update-baseline 建立")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression)
+    if regressions:
+        print(f"❌ {len(regressions)} 個項目退步超過 {args.max_regression:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"✅ 沒有項目退步超過 {args.max_regression:.0%}")
+
+if __name__ == "__main__":
+    main()
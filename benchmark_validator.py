@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+故事驗證效能測試
+產生大型故事並計時 StoryValidator 的每一項驗證，確認所有驗證都是線性時間
+"""
+
+import argparse
+import sys
+import time
+from typing import Dict
+
+from story_generator import generate_chapters
+from story_incremental import IncrementalValidator
+from story_validator import StoryValidator
+
+def run_benchmark(count: int, seed: int) -> Dict[str, float]:
+    """執行每一項驗證並回傳耗時（秒）"""
+    chapters = generate_chapters(count, seed)
+
+    validator = StoryValidator()
+    validator.story_info = {
+        "story_id": "benchmark_story",
+        "title": "效能測試故事",
+        "description": "自動產生的大型故事",
+        "author": "benchmark",
+        "version": "1.0"
+    }
+    validator.chapters = chapters
+    validator.chapter_ids = {chapter['id'] for chapter in chapters}
+
+    passes = [
+        ("validate_story_info", validator.validate_story_info),
+        ("validate_structure", validator.validate_structure),
+        ("validate_references", validator.validate_references),
+        ("validate_logic_structure", validator.validate_logic_structure),
+        ("validate_conditional_content", validator.validate_conditional_content),
+        ("validate_condition_reachability", validator.validate_condition_reachability),
+        ("validate_content_quality", validator.validate_content_quality),
+        ("generate_statistics", validator.generate_statistics)
+    ]
+
+    timings = {}
+    for name, func in passes:
+        started = time.perf_counter()
+        func()
+        timings[name] = time.perf_counter() - started
+
+    timings["errors"] = len(validator.errors)
+    timings["warnings"] = len(validator.warnings)
+    return timings
+
+def run_incremental_benchmark(count: int, seed: int) -> Dict[str, float]:
+    """計時增量驗證：第一次完整驗證、修改一個章節的文字、修改一個選項的目標"""
+    chapters = generate_chapters(count, seed)
+    story_info = {"story_id": "benchmark_story", "title": "效能測試故事"}
+    validator = IncrementalValidator()
+    timings = {}
+
+    started = time.perf_counter()
+    validator.validate(chapters, story_info)
+    timings["initial_validation"] = time.perf_counter() - started
+
+    edited = chapters[count // 2]
+    chapters[count // 2] = {**edited, "content": edited["content"] + "（已修改）"}
+    started = time.perf_counter()
+    validator.validate(chapters, story_info)
+    timings["text_edit"] = time.perf_counter() - started
+
+    edited = next(chapter for chapter in chapters if chapter["options"])
+    options = [dict(option) for option in edited["options"]]
+    options[0]["next_id"] = count
+    chapters[chapters.index(edited)] = {**edited, "options": options}
+    started = time.perf_counter()
+    validator.validate(chapters, story_info)
+    timings["graph_edit"] = time.perf_counter() - started
+    return timings
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="故事驗證效能測試")
+    parser.add_argument("-n", "--chapters", type=int, default=200_000, help="產生的章節數量（預設 200000）")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子（預設 42）")
+    parser.add_argument("--incremental", action="store_true", help="同時計時增量驗證（修改單一章節後重新驗證）")
+    parser.add_argument("--max-seconds", type=float, default=30.0, help="驗證總耗時上限，超過時以錯誤結束（預設 30 秒）")
+    
+    args = parser.parse_args()
+    
+    print("⏱️ Story Validator Benchmark")
+    print("=" * 50)
+    print(f"📚 章節數量: {args.chapters:,}（seed: {args.seed}）")
+    
+    timings = run_benchmark(args.chapters, args.seed)
+    errors = timings.pop("errors")
+    warnings = timings.pop("warnings")
+    total = sum(timings.values())
+    
+    for name, seconds in timings.items():
+        print(f"   • {name:<32} {seconds:8.3f} 秒")
+    print(f"🧮 總耗時: {total:.3f} 秒（{errors} 個錯誤，{warnings} 個警告）")
+    
+    if args.incremental:
+        print("♻️ 增量驗證:")
+        for name, seconds in run_incremental_benchmark(args.chapters, args.seed).items():
+            print(f"   • {name:<32} {seconds * 1000:8.1f} 毫秒")
+    
+    if total > args.max_seconds:
+        print(f"❌ 超過上限 {args.max_seconds} 秒")
+        sys.exit(1)
+    print(f"✅ 在 {args.max_seconds} 秒內完成")
+
+if __name__ == "__main__":
+    main()
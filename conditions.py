@@ -0,0 +1,95 @@
+"""
+條件運算模組
+解析並評估 [[IF condition]] 條件與選項的 condition 欄位
+供 API 服務、模擬器與分析工具共用，確保各處的條件語意一致
+"""
+
+import operator
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# 條件內容標記
+CONDITION_PATTERN = re.compile(r'\[\[IF\s+([^\]]+)\]\](.*?)\[\[ENDIF\]\]', re.DOTALL)
+
+# 比較運算子（順序很重要：先檢查兩個字元的運算子）
+COMPARISON_OPERATORS = ['>=', '<=', '>', '<', '==', '!=']
+
+_OPERATOR_FUNCTIONS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+class ParsedCondition(NamedTuple):
+    """解析後的單一條件"""
+    kind: str                  # compare、not 或 bool
+    var_name: str
+    op: Optional[str] = None
+    value: Optional[str] = None
+    number: Optional[float] = None   # 比較值可轉為數字時的數值
+
+@lru_cache(maxsize=4096)
+def parse_condition(condition: str) -> ParsedCondition:
+    """解析單一條件（結果會被快取）"""
+    condition = condition.strip()
+
+    # 檢查是否為數值比較條件
+    for op in COMPARISON_OPERATORS:
+        if op in condition:
+            var_name, value = (part.strip() for part in condition.split(op, 1))
+            try:
+                number = float(value)
+            except ValueError:
+                number = None
+            return ParsedCondition("compare", var_name, op, value, number)
+
+    # 支援 NOT 條件（布林值）
+    if condition.startswith("NOT "):
+        return ParsedCondition("not", condition[4:].strip())
+
+    # 基本的布林條件
+    return ParsedCondition("bool", condition)
+
+def evaluate_parsed(parsed: ParsedCondition, game_state: Dict[str, Any]) -> bool:
+    """評估已解析的條件"""
+    if parsed.kind == "compare":
+        # 變數不存在時，數值變數預設為 0，布林變數預設為 False
+        var_value = game_state.get(parsed.var_name, 0)
+
+        if parsed.number is not None:
+            try:
+                left = float(var_value) if var_value is not None else 0
+                right = parsed.number
+            except (ValueError, TypeError):
+                # 如果無法轉換為數字，則進行字串比較
+                left = str(var_value) if var_value is not None else ""
+                right = parsed.value
+        else:
+            left = str(var_value) if var_value is not None else ""
+            right = parsed.value
+
+        return _OPERATOR_FUNCTIONS[parsed.op](left, right)
+
+    if parsed.kind == "not":
+        # 變數不存在視為 false，所以 NOT false = true
+        return not game_state.get(parsed.var_name, False)
+
+    return bool(game_state.get(parsed.var_name, False))
+
+def evaluate_condition(condition: str, game_state: Dict[str, Any]) -> bool:
+    """評估單一條件，支援布林值、NOT 與數值比較"""
+    return evaluate_parsed(parse_condition(condition), game_state)
+
+def split_option_condition(condition: str) -> List[str]:
+    """將選項條件依 AND 拆分為單一條件"""
+    return [part for part in (p.strip() for p in condition.split(" AND ")) if part]
+
+def evaluate_option_condition(condition: Optional[str], game_state: Dict[str, Any]) -> bool:
+    """評估選項的 condition 欄位，沒有條件時視為可選，多個條件以 AND 連接"""
+    if not condition:
+        return True
+    return all(evaluate_condition(part, game_state) for part in split_option_condition(condition))
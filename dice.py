@@ -0,0 +1,364 @@
+"""
+擲骰引擎
+提供單次擲骰、大量批次擲骰與擲骰表達式功能
+批次擲骰使用 NumPy 向量化運算（NumPy 列在 requirements.txt 中；未安裝時退回 random.choices）
+擲骰表達式會先編譯為評估計畫並快取，之後只需執行計畫
+技能檢定結合擲骰、遊戲狀態中的屬性修正與難度，決定成功或失敗的分支
+指定 seed 時使用由 seed 與串流名稱衍生的獨立亂數串流，結果可完整重現
+"""
+
+import hashlib
+import heapq
+import random
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 未安裝 NumPy 時退回純 Python 實作（指定 seed 的結果與安裝 NumPy 時不同）
+    np = None
+
+# 批次擲骰時每個區塊最多產生的骰子數，用來限制記憶體用量
+BULK_CHUNK_DICE = 1_000_000
+
+def derive_stream_key(seed: int, stream: Optional[str] = None) -> int:
+    """由 seed 與串流名稱衍生 128 位元的串流金鑰"""
+    material = f"{seed}:{stream or ''}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(material, digest_size=16).digest(), "big")
+
+def create_rng(seed: Optional[int] = None, stream: Optional[str] = None):
+    """建立擲骰用的亂數產生器，相同的 seed 與 stream 必定產生相同結果"""
+    # 未指定 seed 時回傳 None，表示使用預設（不可重現）的亂數來源
+    if seed is None:
+        return None
+    key = derive_stream_key(seed, stream)
+    # Philox 是以計數器為基礎的產生器，建立成本低且各串流互相獨立；
+    # 重播的結果取決於 NumPy 的實作，因此 requirements.txt 固定了 NumPy 的版本
+    if np is not None:
+        return np.random.Generator(np.random.Philox(key=key))
+    return random.Random(key)
+
+def _is_numpy_rng(rng) -> bool:
+    """判斷是否為 NumPy 的亂數產生器"""
+    return np is not None and isinstance(rng, np.random.Generator)
+
+def _randints(rng, dice_sides: int, count: int) -> List[int]:
+    """由指定的亂數來源產生 count 個 1 到 dice_sides 的整數"""
+    if rng is None:
+        return [random.randint(1, dice_sides) for _ in range(count)]
+    if _is_numpy_rng(rng):
+        return rng.integers(1, dice_sides + 1, size=count).tolist()
+    return [rng.randint(1, dice_sides) for _ in range(count)]
+
+def roll(dice_count: int, dice_sides: int, rng=None) -> List[int]:
+    """擲出一組骰子，回傳每顆骰子的結果"""
+    return _randints(rng, dice_sides, dice_count)
+
+def describe(dice_count: int, dice_sides: int, modifier: int = 0) -> str:
+    """產生擲骰規格描述，例如 2D6+3"""
+    description = f"{dice_count}D{dice_sides}"
+    if modifier > 0:
+        description += f"+{modifier}"
+    elif modifier < 0:
+        description += f"{modifier}"
+    return description
+
+def _iter_total_chunks(dice_count: int, dice_sides: int, rolls: int, rng=None) -> Iterator:
+    """分區塊產生每次檢定的骰子總和（不含修正值）"""
+    rows_per_chunk = max(1, BULK_CHUNK_DICE // dice_count)
+    remaining = rolls
+
+    if np is not None and (rng is None or _is_numpy_rng(rng)):
+        generator = rng if rng is not None else np.random.default_rng()
+        while remaining > 0:
+            rows = min(rows_per_chunk, remaining)
+            faces = generator.integers(1, dice_sides + 1, size=(rows, dice_count), dtype=np.int64)
+            yield faces.sum(axis=1)
+            remaining -= rows
+        return
+
+    # 無 NumPy 時使用 random.choices 一次產生整個區塊，避免逐顆呼叫 randint
+    source = rng if rng is not None else random
+    population = range(1, dice_sides + 1)
+    while remaining > 0:
+        rows = min(rows_per_chunk, remaining)
+        faces = source.choices(population, k=rows * dice_count)
+        if dice_count == 1:
+            yield faces
+        else:
+            yield [sum(faces[i:i + dice_count]) for i in range(0, len(faces), dice_count)]
+        remaining -= rows
+
+def roll_bulk(dice_count: int, dice_sides: int, modifier: int, rolls: int, rng=None) -> List[int]:
+    """執行多次相同規格的獨立擲骰，回傳每次的總和（包含修正值）"""
+    totals: List[int] = []
+    for chunk in _iter_total_chunks(dice_count, dice_sides, rolls, rng):
+        if np is not None and not isinstance(chunk, list):
+            totals.extend((chunk + modifier).tolist())
+        else:
+            totals.extend(total + modifier for total in chunk)
+    return totals
+
+def roll_bulk_histogram(dice_count: int, dice_sides: int, modifier: int, rolls: int, rng=None) -> Dict[int, int]:
+    """執行多次相同規格的獨立擲骰，只回傳各總和出現次數的直方圖"""
+    if np is not None and (rng is None or _is_numpy_rng(rng)):
+        counts = np.zeros(dice_count * (dice_sides - 1) + 1, dtype=np.int64)
+        for chunk in _iter_total_chunks(dice_count, dice_sides, rolls, rng):
+            counts += np.bincount(chunk - dice_count, minlength=len(counts))
+        return {
+            int(offset) + dice_count + modifier: int(counts[offset])
+            for offset in np.flatnonzero(counts)
+        }
+
+    histogram: Counter = Counter()
+    for chunk in _iter_total_chunks(dice_count, dice_sides, rolls, rng):
+        histogram.update(chunk)
+    return {total + modifier: histogram[total] for total in sorted(histogram)}
+
+def histogram_statistics(histogram: Dict[int, int]) -> Dict[str, float]:
+    """由直方圖計算平均值、最小值與最大值"""
+    rolls = sum(histogram.values())
+    if rolls == 0:
+        return {"mean": 0.0, "min": 0, "max": 0}
+
+    return {
+        "mean": sum(total * count for total, count in histogram.items()) / rolls,
+        "min": min(histogram),
+        "max": max(histogram)
+    }
+
+# ---------------------------------------------------------------------------
+# 擲骰表達式，例如 "2d20kh1+1d4+3"、"4d6dl1"、"3d6!"
+# ---------------------------------------------------------------------------
+
+# 表達式限制，避免單次請求產生過量骰子
+MAX_EXPRESSION_TERMS = 20
+MAX_TERM_DICE = 100
+MAX_TERM_SIDES = 1000
+# 爆骰時每顆骰子最多追加的次數
+MAX_EXPLOSIONS_PER_DIE = 100
+
+_DICE_TERM_PATTERN = re.compile(r'^(\d*)d(\d+)(!?)(?:(kh|kl|k|dh|dl|d)(\d+))?$')
+
+class DiceTerm(NamedTuple):
+    """已編譯的骰子項目"""
+    sign: int
+    count: int
+    sides: int
+    explode: bool
+    keep: Optional[int]      # 保留的骰子數量，None 表示依 drop 決定
+    drop: int                # 捨棄的骰子數量（爆骰追加的骰子也一併計入）
+    keep_highest: bool
+    text: str
+
+class DicePlan(NamedTuple):
+    """已編譯的擲骰表達式評估計畫"""
+    expression: str
+    dice_terms: Tuple[DiceTerm, ...]
+    constant: int
+
+class DiceTermResult(NamedTuple):
+    """單一骰子項目的擲骰結果"""
+    term: str
+    rolls: List[int]
+    kept: List[int]
+    subtotal: int
+
+def _compile_dice_term(sign: int, text: str) -> DiceTerm:
+    """編譯單一骰子項目"""
+    match = _DICE_TERM_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"無效的骰子項目: '{text}'")
+
+    count_str, sides_str, explode, selector, selector_count = match.groups()
+    count = int(count_str) if count_str else 1
+    sides = int(sides_str)
+
+    if not 1 <= count <= MAX_TERM_DICE:
+        raise ValueError(f"骰子數量必須介於 1 到 {MAX_TERM_DICE}: '{text}'")
+    if not 2 <= sides <= MAX_TERM_SIDES:
+        raise ValueError(f"骰子面數必須介於 2 到 {MAX_TERM_SIDES}: '{text}'")
+
+    keep = None
+    drop = 0
+    keep_highest = True
+    if selector:
+        amount = int(selector_count)
+        if amount > count:
+            raise ValueError(f"保留或捨棄的骰子數量不能超過骰子數量: '{text}'")
+        if selector in ("k", "kh"):
+            keep = amount
+        elif selector == "kl":
+            keep, keep_highest = amount, False
+        elif selector in ("d", "dl"):
+            drop = amount
+        else:  # dh
+            drop, keep_highest = amount, False
+
+    return DiceTerm(sign, count, sides, bool(explode), keep, drop, keep_highest, text)
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> DicePlan:
+    """將擲骰表達式編譯為評估計畫（結果會被快取）"""
+    normalized = re.sub(r'\s+', '', expression).lower()
+    if not normalized:
+        raise ValueError("擲骰表達式不能為空")
+
+    tokens = re.split(r'([+-])', normalized)
+    if tokens[0] == "":
+        tokens = tokens[1:]
+    else:
+        tokens = ["+"] + tokens
+
+    if len(tokens) % 2 != 0 or len(tokens) // 2 > MAX_EXPRESSION_TERMS:
+        raise ValueError(f"無效的擲骰表達式: '{expression}'")
+
+    dice_terms = []
+    constant = 0
+    for i in range(0, len(tokens), 2):
+        sign = 1 if tokens[i] == "+" else -1
+        text = tokens[i + 1]
+        if not text:
+            raise ValueError(f"無效的擲骰表達式: '{expression}'")
+        if text.isdigit():
+            constant += sign * int(text)
+        else:
+            dice_terms.append(_compile_dice_term(sign, text))
+
+    if not dice_terms:
+        raise ValueError(f"擲骰表達式至少需要一個骰子項目: '{expression}'")
+
+    return DicePlan(normalized, tuple(dice_terms), constant)
+
+def _select_kept(rolls: List[int], keep: int, highest: bool) -> List[int]:
+    """以部分選取挑出要保留的骰子，避免完整排序"""
+    if keep >= len(rolls):
+        return rolls
+    if keep <= len(rolls) - keep:
+        return heapq.nlargest(keep, rolls) if highest else heapq.nsmallest(keep, rolls)
+
+    # 要捨棄的骰子較少時，只選出捨棄的部分
+    dropped = Counter(heapq.nsmallest(len(rolls) - keep, rolls) if highest
+                      else heapq.nlargest(len(rolls) - keep, rolls))
+    kept = []
+    for value in rolls:
+        if dropped[value]:
+            dropped[value] -= 1
+        else:
+            kept.append(value)
+    return kept
+
+def _roll_term(term: DiceTerm, rng=None) -> List[int]:
+    """擲出骰子項目中的所有骰子（包含爆骰追加的骰子）"""
+    rolls = _randints(rng, term.sides, term.count)
+    if term.explode:
+        for i in range(term.count):
+            value = rolls[i]
+            explosions = 0
+            while value == term.sides and explosions < MAX_EXPLOSIONS_PER_DIE:
+                value = _randints(rng, term.sides, 1)[0]
+                rolls.append(value)
+                explosions += 1
+    return rolls
+
+def evaluate_plan(plan: DicePlan, rng=None) -> Tuple[int, List[DiceTermResult]]:
+    """執行已編譯的評估計畫，回傳總和與各項目的結果"""
+    total = plan.constant
+    term_results = []
+    for term in plan.dice_terms:
+        rolls = _roll_term(term, rng)
+        keep = term.keep if term.keep is not None else len(rolls) - term.drop
+        kept = _select_kept(rolls, keep, term.keep_highest)
+        subtotal = term.sign * sum(kept)
+        total += subtotal
+        term_results.append(DiceTermResult(term.text, rolls, kept, subtotal))
+    return total, term_results
+
+def roll_expression(expression: str, rng=None) -> Tuple[DicePlan, int, List[DiceTermResult]]:
+    """編譯（或取用快取）並執行擲骰表達式"""
+    plan = compile_expression(expression)
+    total, term_results = evaluate_plan(plan, rng)
+    return plan, total, term_results
+
+# ---------------------------------------------------------------------------
+# 技能檢定：選項中以 check 欄位宣告，例如
+# {"dice": "1d20", "stat": "dexterity", "modifier": 0, "difficulty": 15,
+#  "success_id": 5, "failure_id": 6}
+# ---------------------------------------------------------------------------
+
+DEFAULT_CHECK_DICE = "1d20"
+
+class CheckResult(NamedTuple):
+    """技能檢定結果"""
+    expression: str
+    terms: List[DiceTermResult]
+    stat: Optional[str]
+    stat_modifier: int
+    modifier: int
+    total: int
+    difficulty: int
+    success: bool
+    next_id: int
+
+def check_errors(check: Any) -> List[str]:
+    """檢查技能檢定宣告的格式，回傳錯誤訊息列表"""
+    if not isinstance(check, dict):
+        return ["'check' 必須是物件"]
+
+    errors = []
+    try:
+        compile_expression(str(check.get("dice", DEFAULT_CHECK_DICE)))
+    except ValueError as e:
+        errors.append(f"'check.dice' 無效: {e}")
+
+    for field in ("difficulty", "success_id", "failure_id"):
+        if field not in check:
+            errors.append(f"'check' 缺少 '{field}' 欄位")
+        elif not isinstance(check[field], int) or isinstance(check[field], bool):
+            errors.append(f"'check.{field}' 必須是整數")
+
+    if "stat" in check and not isinstance(check["stat"], str):
+        errors.append("'check.stat' 必須是字串")
+    if "modifier" in check and (not isinstance(check["modifier"], int) or isinstance(check["modifier"], bool)):
+        errors.append("'check.modifier' 必須是整數")
+
+    return errors
+
+def stat_modifier(game_state: Dict[str, Any], stat: Optional[str]) -> int:
+    """由遊戲狀態取得屬性修正值，變數不存在或不是數值時視為 0"""
+    if not stat:
+        return 0
+    value = game_state.get(stat, 0)
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+def resolve_check(check: Dict[str, Any], game_state: Dict[str, Any], rng=None) -> CheckResult:
+    """執行技能檢定：擲骰加上屬性與固定修正值後與難度比較，決定下一章節"""
+    errors = check_errors(check)
+    if errors:
+        raise ValueError("；".join(errors))
+
+    plan = compile_expression(str(check.get("dice", DEFAULT_CHECK_DICE)))
+    rolled, term_results = evaluate_plan(plan, rng)
+
+    stat = check.get("stat")
+    stat_bonus = stat_modifier(game_state, stat)
+    modifier = check.get("modifier", 0)
+    total = rolled + stat_bonus + modifier
+    success = total >= check["difficulty"]
+
+    return CheckResult(
+        expression=plan.expression,
+        terms=term_results,
+        stat=stat,
+        stat_modifier=stat_bonus,
+        modifier=modifier,
+        total=total,
+        difficulty=check["difficulty"],
+        success=success,
+        next_id=check["success_id"] if success else check["failure_id"]
+    )
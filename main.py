@@ -4,27 +4,48 @@ FastAPI 主程式
 支援多表設計的故事管理
 """
 
+import asyncio
 import json
-import random
+import os
 import re
+import secrets
+import time
+import uuid
+import zlib
+from collections import Counter
 from datetime import datetime
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from sqlalchemy import text
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+import dice
+import story_metrics
+import story_timing
+import story_slow_log
+from story_loop_monitor import LOOP_MONITOR_ENABLED, monitor as loop_monitor
+from story_profiler import MAX_PROFILE_SECONDS, ProfilerBusy, StackSampler, acquire_profiler, release_profiler
+from conditions import CONDITION_PATTERN, evaluate_condition, parse_condition
+from story_analytics import StoryAnalysis
+from story_import import IMPORT_FEED_SIZE, StoryImporter, StoryImportError
+from story_jobs import job_output_path, job_queue, remove_file
+from story_stream import StoryStreamParser, StoryStreamError
 from models import (
-    SessionLocal, StoryRegistry, create_tables, get_story_table, 
+    SessionLocal, StoryRegistry, engine, create_tables, get_story_table, 
     get_story_info, register_story, get_all_story_tables, get_db
 )
 from schemas import (
     StoryEngineRequest, StoryEngineResponse, RollDiceRequest, RollDiceResponse,
+    BulkRollDiceRequest, BulkRollDiceResponse, DiceExpressionRequest, DiceExpressionResponse,
+    DiceTermDetail, SkillCheckRequest, SkillCheckResponse, ChapterAnalytics, StoryAnalyticsResponse,
     StoryInfo, StoryListResponse, ChapterInfo, StoryChaptersResponse,
     CreateStoryRequest, CreateStoryResponse, ImportStoryRequest, ImportStoryResponse,
-    ExportStoryResponse, ErrorResponse
+    ExportStoryResponse, JobCreateRequest, JobInfo, JobListResponse, ErrorResponse
 )
 
 # 建立 FastAPI 應用程式
@@ -69,9 +90,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 請求階段計時（Server-Timing 標頭，SERVER_TIMING=true 或請求帶 X-Server-Timing: 1 時啟用）
+app.add_middleware(story_timing.ServerTimingMiddleware)
+
+# 效能指標：請求延遲、資料庫查詢與快取命中率（GET /metrics）
+app.add_middleware(story_metrics.MetricsMiddleware)
+story_metrics.instrument_engine(engine)
+story_metrics.register_cache("parse_condition", parse_condition)
+story_metrics.register_cache("compile_expression", dice.compile_expression)
+
+# 慢查詢與慢請求日誌（SLOW_QUERY_MS / SLOW_REQUEST_MS 設定門檻，SLOW_LOG=false 停用）
+if story_slow_log.SLOW_LOG_ENABLED:
+    app.add_middleware(story_slow_log.SlowRequestMiddleware)
+    story_slow_log.instrument_engine(engine)
+
 # 初始化資料庫
 create_tables()
 
+# 背景工作執行緒隨伺服器啟動與關閉
+@app.on_event("startup")
+def start_job_workers():
+    job_queue.start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    job_queue.stop()
+
+# 事件迴圈延遲監控（LOOP_MONITOR=false 時停用）
+@app.on_event("startup")
+async def start_loop_monitor():
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    loop_monitor.stop()
+
+# 慢日誌的背景寫入執行緒
+@app.on_event("startup")
+def start_slow_log():
+    if story_slow_log.SLOW_LOG_ENABLED:
+        story_slow_log.slow_log.start()
+
+@app.on_event("shutdown")
+def stop_slow_log():
+    story_slow_log.slow_log.stop()
+
 def process_conditional_content(content: str, game_state: Dict[str, Any]) -> str:
     """處理條件內容標記，支援布林值和數值比較"""
     if not content:
@@ -83,78 +147,21 @@ def process_conditional_content(content: str, game_state: Dict[str, Any]) -> str
         conditional_content = match.group(2)
         
         try:
-            # 檢查是否為數值比較條件
-            comparison_operators = ['>=', '<=', '>', '<', '==', '!=']
-            for op in comparison_operators:
-                if op in condition:
-                    parts = condition.split(op, 1)
-                    if len(parts) == 2:
-                        var_name = parts[0].strip()
-                        value_str = parts[1].strip()
-                        
-                        # 取得變數值
-                        if var_name in game_state:
-                            var_value = game_state[var_name]
-                        else:
-                            # 變數不存在時，數值變數預設為 0，布林變數預設為 False
-                            var_value = 0
-                        
-                        # 嘗試將比較值轉換為數字
-                        try:
-                            compare_value = float(value_str)
-                            var_value = float(var_value) if var_value is not None else 0
-                        except (ValueError, TypeError):
-                            # 如果無法轉換為數字，則進行字串比較
-                            compare_value = value_str
-                            var_value = str(var_value) if var_value is not None else ""
-                        
-                        # 執行比較
-                        if op == '>':
-                            result = var_value > compare_value
-                        elif op == '<':
-                            result = var_value < compare_value
-                        elif op == '>=':
-                            result = var_value >= compare_value
-                        elif op == '<=':
-                            result = var_value <= compare_value
-                        elif op == '==':
-                            result = var_value == compare_value
-                        elif op == '!=':
-                            result = var_value != compare_value
-                        
-                        return conditional_content if result else ""
-                    break
-            
-            # 支援 NOT 條件（布林值）
-            if condition.startswith("NOT "):
-                var_name = condition[4:].strip()
-                if var_name in game_state:
-                    if not game_state[var_name]:
-                        return conditional_content
-                else:
-                    # 變數不存在視為 false，所以 NOT false = true
-                    return conditional_content
-            
-            # 支援基本的布林條件
-            elif condition in game_state:
-                if game_state[condition]:
-                    return conditional_content
-            
+            if evaluate_condition(condition, game_state):
+                return conditional_content
         except Exception as e:
             # 條件評估失敗時，記錄錯誤但不中斷處理
             print(f"條件評估錯誤: {condition} - {str(e)}")
         
         return ""
     
-    # 使用正則表達式處理條件內容
-    pattern = r'\[\[IF\s+([^\]]+)\]\](.*?)\[\[ENDIF\]\]'
-    processed_content = re.sub(pattern, replace_condition, content, flags=re.DOTALL)
-    
-    return processed_content
+    # 使用預先編譯的正則表達式處理條件內容
+    return CONDITION_PATTERN.sub(replace_condition, content)
 
 # 故事管理 API
 @app.get("/api/stories", response_model=StoryListResponse, tags=["故事管理"])
-async def list_stories(db: Session = Depends(get_db)):
+@story_metrics.query_budget(1)
+def list_stories(db: Session = Depends(get_db)):
     """取得所有可用的故事列表"""
     try:
         stories = db.query(StoryRegistry).filter(StoryRegistry.is_active == "true").all()
@@ -180,7 +187,8 @@ async def list_stories(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"取得故事列表失敗: {str(e)}")
 
 @app.get("/api/stories/{story_id}", response_model=StoryInfo, tags=["故事管理"])
-async def get_story(story_id: str, db: Session = Depends(get_db)):
+@story_metrics.query_budget(1)
+def get_story(story_id: str, db: Session = Depends(get_db)):
     """取得特定故事的詳細資訊"""
     story = db.query(StoryRegistry).filter(
         StoryRegistry.story_id == story_id,
@@ -203,7 +211,8 @@ async def get_story(story_id: str, db: Session = Depends(get_db)):
     )
 
 @app.get("/api/stories/{story_id}/chapters", response_model=StoryChaptersResponse, tags=["故事管理"])
-async def get_story_chapters(story_id: str, db: Session = Depends(get_db)):
+@story_metrics.query_budget(2)
+def get_story_chapters(story_id: str, db: Session = Depends(get_db)):
     """取得故事的所有章節"""
     # 驗證故事存在
     story = db.query(StoryRegistry).filter(
@@ -247,17 +256,15 @@ async def get_story_chapters(story_id: str, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"取得章節列表失敗: {str(e)}")
 
-# 故事引擎 API
-@app.post("/api/story_engine/{story_id}/{chapter_id}", response_model=StoryEngineResponse, tags=["故事引擎"])
-async def get_story_chapter(
+@app.get("/api/stories/{story_id}/analytics", response_model=StoryAnalyticsResponse, tags=["故事管理"])
+@story_metrics.query_budget(2)
+def get_story_analytics(
     story_id: str,
-    chapter_id: int,
-    request: StoryEngineRequest,
+    start_id: int = Query(1, description="起始章節ID"),
+    chapter_id: Optional[int] = Query(None, description="額外回傳指定章節的分析結果"),
     db: Session = Depends(get_db)
 ):
-    """載入指定故事的章節內容"""
-    
-    # 驗證故事存在
+    """分析故事的遊玩路徑數、結局可達性與循環"""
     story = db.query(StoryRegistry).filter(
         StoryRegistry.story_id == story_id,
         StoryRegistry.is_active == "true"
@@ -266,44 +273,182 @@ async def get_story_chapter(
     if not story:
         raise HTTPException(status_code=404, detail="故事不存在")
     
-    # 查詢章節
     try:
-        table_name = story.table_name
+        result = db.execute(text(f"SELECT id, options FROM {story.table_name} ORDER BY id"))
+        chapters = [{"id": row.id, "options": parse_options(row.options)} for row in result]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"讀取章節失敗: {str(e)}")
+    
+    analysis = StoryAnalysis(chapters, start_id)
+    
+    chapter = None
+    if chapter_id is not None:
+        if not analysis.has_chapter(chapter_id):
+            raise HTTPException(status_code=404, detail="章節不存在")
+        report = analysis.chapter_report(chapter_id)
+        report["paths_from_start"] = str(report["paths_from_start"])
+        report["paths_to_ending"] = str(report["paths_to_ending"])
+        chapter = ChapterAnalytics(**report)
+    
+    summary = analysis.summary()
+    summary["total_paths"] = str(summary["total_paths"])
+    summary["paths_per_ending"] = {
+        ending_id: str(count) for ending_id, count in summary["paths_per_ending"].items()
+    }
+    
+    return StoryAnalyticsResponse(story_id=story_id, chapter=chapter, **summary)
+
+def parse_options(raw_options) -> List[Dict[str, Any]]:
+    """解析章節選項 - 檢查類型後決定是否需要解析 JSON"""
+    if isinstance(raw_options, str):
+        return json.loads(raw_options) if raw_options else []
+    return raw_options if raw_options else []
+
+def fetch_chapter(db: Session, table_name: str, chapter_id: int):
+    """查詢單一章節，不存在時回傳 404"""
+    with story_timing.phase("chapter_query"):
         result = db.execute(
             text(f"SELECT * FROM {table_name} WHERE id = :chapter_id"),
             {"chapter_id": chapter_id}
         )
         chapter = result.fetchone()
-        
-        if not chapter:
-            raise HTTPException(status_code=404, detail="章節不存在")
-        
-        # 處理條件內容
-        processed_content = process_conditional_content(chapter.content, request.game_state)
-        
-        # 解析選項 - 檢查類型後決定是否需要解析 JSON
-        if isinstance(chapter.options, str):
-            options = json.loads(chapter.options) if chapter.options else []
-        else:
-            options = chapter.options if chapter.options else []
-        
+    
+    if not chapter:
+        raise HTTPException(status_code=404, detail="章節不存在")
+    
+    return chapter
+
+def render_chapter(story: StoryRegistry, chapter, game_state: Dict[str, Any]) -> StoryEngineResponse:
+    """依遊戲狀態處理條件內容並組成章節回應"""
+    started = time.perf_counter()
+    content = process_conditional_content(chapter.content, game_state)
+    elapsed = time.perf_counter() - started
+    story_metrics.CONDITION_RENDER.observe(elapsed)
+    story_timing.record("render", elapsed)
+    
+    with story_timing.phase("options_decode"):
+        options = parse_options(chapter.options)
+    
+    with story_timing.phase("response_model"):
         return StoryEngineResponse(
-            story_id=story_id,
+            story_id=story.story_id,
             story_title=story.title,
-            chapter_id=chapter_id,
+            chapter_id=chapter.id,
             title=chapter.title,
-            content=processed_content,
+            content=content,
             options=options
         )
+
+# 故事引擎 API
+@app.post("/api/story_engine/{story_id}/{chapter_id}", response_model=StoryEngineResponse, tags=["故事引擎"])
+@story_metrics.query_budget(2)
+def get_story_chapter(
+    story_id: str,
+    chapter_id: int,
+    request: StoryEngineRequest,
+    db: Session = Depends(get_db)
+):
+    """載入指定故事的章節內容"""
+    
+    # 驗證故事存在
+    with story_timing.phase("registry"):
+        story = db.query(StoryRegistry).filter(
+            StoryRegistry.story_id == story_id,
+            StoryRegistry.is_active == "true"
+        ).first()
+    
+    if not story:
+        raise HTTPException(status_code=404, detail="故事不存在")
+    
+    # 查詢章節
+    try:
+        chapter = fetch_chapter(db, story.table_name, chapter_id)
+        return render_chapter(story, chapter, request.game_state)
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"載入章節失敗: {str(e)}")
 
+@app.post(
+    "/api/story_engine/{story_id}/{chapter_id}/check/{option_index}",
+    response_model=SkillCheckResponse,
+    tags=["故事引擎"]
+)
+@story_metrics.query_budget(3)
+def resolve_skill_check(
+    story_id: str,
+    chapter_id: int,
+    option_index: int,
+    request: SkillCheckRequest,
+    db: Session = Depends(get_db)
+):
+    """執行選項宣告的技能檢定，並直接回傳成功或失敗分支的章節內容"""
+    
+    # 驗證故事存在
+    with story_timing.phase("registry"):
+        story = db.query(StoryRegistry).filter(
+            StoryRegistry.story_id == story_id,
+            StoryRegistry.is_active == "true"
+        ).first()
+    
+    if not story:
+        raise HTTPException(status_code=404, detail="故事不存在")
+    
+    try:
+        chapter = fetch_chapter(db, story.table_name, chapter_id)
+        options = parse_options(chapter.options)
+        
+        if not 0 <= option_index < len(options):
+            raise HTTPException(status_code=404, detail="選項不存在")
+        
+        option = options[option_index]
+        check = option.get("check") if isinstance(option, dict) else None
+        if not check:
+            raise HTTPException(status_code=400, detail="此選項沒有宣告技能檢定")
+        
+        # 執行檢定
+        try:
+            rng = dice.create_rng(request.seed, request.stream)
+            result = dice.resolve_check(check, request.game_state, rng)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"技能檢定設定錯誤: {str(e)}")
+        
+        # 載入檢定結果對應的章節
+        next_chapter = fetch_chapter(db, story.table_name, result.next_id)
+        
+        description = f"{result.expression}"
+        if result.stat:
+            description += f" + {result.stat}({result.stat_modifier})"
+        if result.modifier:
+            description += f" {'+' if result.modifier > 0 else '-'} {abs(result.modifier)}"
+        description += f" = {result.total} vs 難度 {result.difficulty}：{'成功' if result.success else '失敗'}"
+        
+        return SkillCheckResponse(
+            success=result.success,
+            expression=result.expression,
+            terms=[DiceTermDetail(**term._asdict()) for term in result.terms],
+            stat=result.stat,
+            stat_modifier=result.stat_modifier,
+            modifier=result.modifier,
+            total=result.total,
+            difficulty=result.difficulty,
+            next_chapter_id=result.next_id,
+            description=description,
+            chapter=render_chapter(story, next_chapter, request.game_state),
+            seed=request.seed,
+            stream=request.stream
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"技能檢定失敗: {str(e)}")
+
 # 向後相容的 API（使用預設故事）
 @app.post("/api/story_engine/{chapter_id}", response_model=StoryEngineResponse, tags=["故事引擎"])
-async def get_chapter_legacy(
+@story_metrics.query_budget(3)
+def get_chapter_legacy(
     chapter_id: int,
     request: StoryEngineRequest,
     db: Session = Depends(get_db)
@@ -315,7 +460,7 @@ async def get_chapter_legacy(
     if not default_story:
         raise HTTPException(status_code=404, detail="沒有可用的故事")
     
-    return await get_story_chapter(default_story.story_id, chapter_id, request, db)
+    return get_story_chapter(default_story.story_id, chapter_id, request, db)
 
 # 擲骰 API
 @app.post("/api/roll_dice", response_model=RollDiceResponse, tags=["擲骰系統"])
@@ -323,26 +468,14 @@ async def roll_dice(request: RollDiceRequest):
     """執行擲骰子檢定"""
     
     # 執行擲骰
-    results = []
-    for _ in range(request.dice_count):
-        roll = random.randint(1, request.dice_sides)
-        results.append(roll)
+    rng = dice.create_rng(request.seed, request.stream)
+    results = dice.roll(request.dice_count, request.dice_sides, rng)
     
     # 計算總和
     total = sum(results) + request.modifier
     
     # 生成描述
-    if request.dice_count == 1:
-        description = f"1D{request.dice_sides}"
-    else:
-        description = f"{request.dice_count}D{request.dice_sides}"
-    
-    if request.modifier != 0:
-        if request.modifier > 0:
-            description += f"+{request.modifier}"
-        else:
-            description += f"{request.modifier}"
-    
+    description = dice.describe(request.dice_count, request.dice_sides, request.modifier)
     description += f" = {total}"
     
     return RollDiceResponse(
@@ -351,12 +484,71 @@ async def roll_dice(request: RollDiceRequest):
         modifier=request.modifier,
         results=results,
         total=total,
-        description=description
+        description=description,
+        seed=request.seed,
+        stream=request.stream
+    )
+
+# 回傳每次總和時的擲骰次數上限，避免回應過大
+MAX_BULK_RESULTS = 100_000
+
+@app.post("/api/roll_dice/bulk", response_model=BulkRollDiceResponse, tags=["擲骰系統"])
+def roll_dice_bulk(request: BulkRollDiceRequest):
+    """批次執行多次相同規格的獨立擲骰，供模擬與平衡測試使用"""
+    # 批次擲骰屬於 CPU 密集運算，使用同步函式讓 FastAPI 交由執行緒池處理
+    if request.output == "results" and request.rolls > MAX_BULK_RESULTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"output=results 時擲骰次數不能超過 {MAX_BULK_RESULTS}，請改用 histogram"
+        )
+    
+    rng = dice.create_rng(request.seed, request.stream)
+    totals = None
+    if request.output == "results":
+        totals = dice.roll_bulk(request.dice_count, request.dice_sides, request.modifier, request.rolls, rng)
+        statistics = dice.histogram_statistics(Counter(totals))
+        histogram = None
+    else:
+        histogram = dice.roll_bulk_histogram(request.dice_count, request.dice_sides, request.modifier, request.rolls, rng)
+        statistics = dice.histogram_statistics(histogram)
+    
+    return BulkRollDiceResponse(
+        dice_count=request.dice_count,
+        dice_sides=request.dice_sides,
+        modifier=request.modifier,
+        rolls=request.rolls,
+        totals=totals,
+        histogram=histogram,
+        mean=statistics["mean"],
+        min=statistics["min"],
+        max=statistics["max"],
+        description=dice.describe(request.dice_count, request.dice_sides, request.modifier),
+        seed=request.seed,
+        stream=request.stream
+    )
+
+@app.post("/api/roll_dice/expression", response_model=DiceExpressionResponse, tags=["擲骰系統"])
+async def roll_dice_expression(request: DiceExpressionRequest):
+    """依擲骰表達式執行檢定，支援保留/捨棄最高最低與爆骰"""
+    try:
+        rng = dice.create_rng(request.seed, request.stream)
+        plan, total, term_results = dice.roll_expression(request.expression, rng)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return DiceExpressionResponse(
+        expression=plan.expression,
+        terms=[DiceTermDetail(**result._asdict()) for result in term_results],
+        modifier=plan.constant,
+        total=total,
+        description=f"{plan.expression} = {total}",
+        seed=request.seed,
+        stream=request.stream
     )
 
 # 故事建立 API
 @app.post("/api/stories", response_model=CreateStoryResponse, tags=["故事管理"])
-async def create_story(request: CreateStoryRequest, db: Session = Depends(get_db)):
+def create_story(request: CreateStoryRequest, db: Session = Depends(get_db)):
     """建立新故事"""
     
     # 驗證 story_id 格式
@@ -401,9 +593,74 @@ async def create_story(request: CreateStoryRequest, db: Session = Depends(get_db
         story_info=story_info
     )
 
+# 視為 NDJSON（每行一個章節）的 Content-Type
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+
+# 故事匯入 API
+@app.post(
+    "/api/stories/import",
+    response_model=ImportStoryResponse,
+    tags=["故事管理"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": ImportStoryRequest.model_json_schema()},
+                "application/x-ndjson": {"schema": {"type": "string", "description": "每行一個章節，章節之前可以有一行故事資訊"}}
+            }
+        }
+    }
+)
+async def import_story(
+    request: Request,
+    story_id: Optional[str] = Query(None, description="故事ID（未指定時使用資料中的 story_id）"),
+    overwrite: bool = Query(False, description="是否覆蓋現有故事"),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="資料格式，未指定時依 Content-Type 判斷"),
+    db: Session = Depends(get_db)
+):
+    """以串流方式匯入故事：邊接收邊驗證章節，並分批寫入資料庫
+    
+    請求內容可以是 JSON（ImportStoryRequest、story_info 或匯出格式）或 NDJSON，
+    Content-Encoding 為 gzip 時自動解壓縮；驗證失敗時不會寫入任何章節
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    ndjson = format == "ndjson" if format else content_type in NDJSON_CONTENT_TYPES
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    
+    parser = StoryStreamParser(ndjson=ndjson)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    importer = StoryImporter(db, story_id=story_id, overwrite=overwrite)
+    
+    try:
+        async for chunk in request.stream():
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            for start in range(0, len(chunk), IMPORT_FEED_SIZE):
+                chapters = parser.feed(chunk[start:start + IMPORT_FEED_SIZE])
+                if chapters:
+                    # 資料庫操作在執行緒中進行，不阻塞事件迴圈
+                    await run_in_threadpool(importer.add_chapters, chapters, parser.metadata)
+        
+        chapters = parser.feed(decompressor.flush()) if decompressor is not None else []
+        chapters.extend(parser.close())
+        await run_in_threadpool(importer.add_chapters, chapters, parser.metadata)
+        success = await run_in_threadpool(importer.finish, parser.metadata)
+    except (StoryStreamError, zlib.error) as e:
+        await run_in_threadpool(importer.abort)
+        raise HTTPException(status_code=400, detail=f"故事資料格式錯誤: {e}")
+    except StoryImportError as e:
+        await run_in_threadpool(importer.abort)
+        return ImportStoryResponse(success=False, message=str(e), story_id=story_id)
+    except Exception as e:
+        await run_in_threadpool(importer.abort)
+        raise HTTPException(status_code=500, detail=f"匯入故事失敗: {str(e)}")
+    
+    return ImportStoryResponse(**importer.report(success))
+
 # 故事匯出 API
 @app.get("/api/stories/{story_id}/export", response_model=ExportStoryResponse, tags=["故事管理"])
-async def export_story(story_id: str, db: Session = Depends(get_db)):
+@story_metrics.query_budget(2)
+def export_story(story_id: str, db: Session = Depends(get_db)):
     """匯出故事為 JSON 格式"""
     
     # 驗證故事存在
@@ -450,14 +707,110 @@ async def export_story(story_id: str, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"匯出故事失敗: {str(e)}")
 
+# 背景工作 API
+@app.post("/api/jobs", response_model=JobInfo, status_code=202, tags=["背景工作"])
+def create_job(request: JobCreateRequest, db: Session = Depends(get_db)):
+    """建立匯出或路徑分析的背景工作，立即回傳工作ID"""
+    story = db.query(StoryRegistry).filter(
+        StoryRegistry.story_id == request.story_id,
+        StoryRegistry.is_active == "true"
+    ).first()
+    
+    if not story:
+        raise HTTPException(status_code=404, detail="故事不存在")
+    
+    params = {"story_id": request.story_id}
+    if request.job_type == "analyze_story":
+        params["start_id"] = request.start_id
+    job = job_queue.submit(request.job_type, params, story_id=request.story_id)
+    return JobInfo.model_validate(job)
+
+@app.post("/api/jobs/import", response_model=JobInfo, status_code=202, tags=["背景工作"])
+async def create_import_job(
+    request: Request,
+    story_id: Optional[str] = Query(None, description="故事ID（未指定時使用資料中的 story_id）"),
+    overwrite: bool = Query(False, description="是否覆蓋現有故事"),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="資料格式，未指定時依 Content-Type 判斷")
+):
+    """上傳故事檔案並以背景工作匯入（格式與 POST /api/stories/import 相同），立即回傳工作ID
+    
+    上傳的資料先原樣寫入暫存檔，驗證與寫入資料庫都在工作執行緒中進行
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    upload_path = job_output_path(f"upload_{uuid.uuid4().hex}")
+    try:
+        with open(upload_path, "wb") as f:
+            async for chunk in request.stream():
+                await run_in_threadpool(f.write, chunk)
+    except Exception as e:
+        remove_file(upload_path)
+        raise HTTPException(status_code=500, detail=f"接收上傳資料失敗: {str(e)}")
+    
+    params = {
+        "upload_path": upload_path,
+        "story_id": story_id,
+        "overwrite": overwrite,
+        "ndjson": format == "ndjson" if format else content_type in NDJSON_CONTENT_TYPES,
+        "gzipped": request.headers.get("content-encoding", "").lower() == "gzip"
+    }
+    job = await run_in_threadpool(job_queue.submit, "import_story", params, story_id)
+    return JobInfo.model_validate(job)
+
+@app.get("/api/jobs", response_model=JobListResponse, tags=["背景工作"])
+def list_jobs(
+    status: Optional[str] = Query(None, pattern="^(queued|running|succeeded|failed|cancelled)$", description="只列出指定狀態的工作"),
+    story_id: Optional[str] = Query(None, description="只列出指定故事的工作"),
+    limit: int = Query(50, ge=1, le=500, description="最多回傳的工作數")
+):
+    """列出最近的背景工作"""
+    jobs = [JobInfo.model_validate(job) for job in job_queue.list(status, story_id, limit)]
+    return JobListResponse(jobs=jobs, total=len(jobs))
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo, tags=["背景工作"])
+def get_job(job_id: str):
+    """查詢背景工作的狀態與進度"""
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="工作不存在")
+    return JobInfo.model_validate(job)
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=JobInfo, tags=["背景工作"])
+def cancel_job(job_id: str):
+    """取消背景工作（已結束的工作不受影響）"""
+    job = job_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="工作不存在")
+    return JobInfo.model_validate(job)
+
+@app.get("/api/jobs/{job_id}/download", tags=["背景工作"])
+def download_job_result(job_id: str):
+    """下載匯出工作產生的 JSON 檔案"""
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="工作不存在")
+    if job.status != "succeeded" or not (job.result or {}).get("file"):
+        raise HTTPException(status_code=409, detail="工作尚未完成或沒有可下載的檔案")
+    if not os.path.exists(job.result["file"]):
+        raise HTTPException(status_code=410, detail="匯出檔案已不存在")
+    return FileResponse(job.result["file"], media_type="application/json", filename=f"{job.story_id}.json")
+
 # 隱私權政策
-@app.get("/privacy", response_class=HTMLResponse, tags=["隱私權政策"])
-async def privacy_policy():
-    """隱私權政策頁面"""
+@lru_cache(maxsize=1)
+def load_privacy_policy() -> Optional[str]:
+    """讀取隱私權政策頁面，只在第一次請求時讀取檔案（之後不再阻塞事件迴圈）"""
     try:
         with open("privacy-policy.html", "r", encoding="utf-8") as f:
             return f.read()
     except FileNotFoundError:
+        return None
+
+@app.get("/privacy", response_class=HTMLResponse, tags=["隱私權政策"])
+async def privacy_policy():
+    """隱私權政策頁面"""
+    try:
+        content = load_privacy_policy()
+        if content is not None:
+            return content
         # 如果檔案不存在，回傳簡化版
         return """
         <!DOCTYPE html>
@@ -546,6 +899,48 @@ async def root():
         "redoc": "/redoc"
     }
 
+# 效能指標
+@app.get("/metrics", tags=["系統資訊"], include_in_schema=False)
+def metrics():
+    """Prometheus 格式的效能指標"""
+    return Response(content=story_metrics.registry.render(), media_type=story_metrics.CONTENT_TYPE)
+
+# 管理端點的權杖；未設定時管理端點停用
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None, description="管理者權杖（環境變數 ADMIN_TOKEN）")):
+    """管理端點的權限檢查"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="管理端點未啟用")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="管理者權杖錯誤")
+
+# 取樣分析
+@app.post("/api/admin/profile", tags=["系統資訊"], include_in_schema=False, dependencies=[Depends(require_admin)])
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS, description="取樣時間（秒）"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="取樣間隔（毫秒）"),
+    include_idle: bool = Query(False, description="是否包含閒置中的執行緒（等待 I/O 或等待工作）"),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$", description="collapsed：flamegraph 格式；json：最常出現的函數")
+):
+    """在指定時間內取樣這個伺服器行程所有執行緒的呼叫堆疊，回傳 collapsed stacks（可用 flamegraph.pl 或 speedscope 開啟）"""
+    try:
+        acquire_profiler()
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    sampler = StackSampler(interval_ms / 1000, include_idle)
+    try:
+        sampler.start()
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+        release_profiler()
+    
+    if format == "json":
+        return sampler.summary()
+    return Response(content=sampler.collapsed(), media_type="text/plain", headers={"X-Profile-Samples": str(sampler.samples)})
+
 # 健康檢查
 @app.get("/health", tags=["系統資訊"])
 async def health_check():
@@ -5,7 +5,7 @@ SQLAlchemy
 支援多表設計：每個故事使用獨立的資料表
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, JSON, DateTime, MetaData, Table
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, JSON, DateTime, MetaData, Table
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.sql import func
 from typing import Dict, List, Optional
@@ -29,6 +29,14 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 # 建立資料庫引擎
 engine = create_engine(DATABASE_URL)
 
+# SQLite 使用 WAL 模式：長時間的匯入交易進行中，遊戲請求與背景工作查詢仍然可以讀取
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def set_sqlite_journal_mode(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
 # 建立 Session 類別
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -49,6 +57,25 @@ class StoryRegistry(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+class BackgroundJob(Base):
+    """背景工作表 - 記錄匯入、匯出與分析等長時間工作的狀態與進度"""
+    __tablename__ = "background_jobs"
+    
+    job_id = Column(String(36), primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False)
+    story_id = Column(String(50), index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued / running / succeeded / failed / cancelled
+    progress = Column(Integer, nullable=False, default=0)  # 0 ~ 100
+    message = Column(Text)
+    params = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    cancel_requested = Column(String(10), default="false")  # 使用字串避免 SQLite 布林值問題
+    worker_id = Column(String(100))  # 執行工作的行程（主機名稱:PID）
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
 def create_story_table(story_id: str) -> Table:
     """動態建立故事表格"""
     table_name = f"story_{story_id}"
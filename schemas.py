@@ -33,12 +33,20 @@ class StoryEngineResponse(BaseModel):
     content: str = Field(..., description="章節內容（已處理條件內容）")
     options: List[Dict[str, Any]] = Field(..., description="可選擇的行動選項")
 
+class SkillCheckRequest(BaseModel):
+    """技能檢定請求"""
+    game_state: Dict[str, Any] = Field(default_factory=dict, description="遊戲狀態物件（屬性修正值由此取得）")
+    seed: Optional[int] = Field(None, description="亂數種子；指定後相同 seed 與 stream 會得到相同結果，可用於重播")
+    stream: Optional[str] = Field(None, max_length=200, description="亂數串流名稱，例如 session 與擲骰序號，搭配 seed 使用")
+
 # 擲骰相關
 class RollDiceRequest(BaseModel):
     """擲骰請求"""
     dice_count: int = Field(..., ge=1, le=100, description="骰子數量 (1-100)")
     dice_sides: int = Field(..., ge=2, le=100, description="骰子面數 (2-100)")
     modifier: int = Field(default=0, description="修正值")
+    seed: Optional[int] = Field(None, description="亂數種子；指定後相同 seed 與 stream 會得到相同結果，可用於重播")
+    stream: Optional[str] = Field(None, max_length=200, description="亂數串流名稱，例如 session 與擲骰序號，搭配 seed 使用")
 
 class RollDiceResponse(BaseModel):
     """擲骰回應"""
@@ -48,6 +56,72 @@ class RollDiceResponse(BaseModel):
     results: List[int] = Field(..., description="每顆骰子的結果")
     total: int = Field(..., description="總和（包含修正值）")
     description: str = Field(..., description="結果描述")
+    seed: Optional[int] = Field(None, description="使用的亂數種子")
+    stream: Optional[str] = Field(None, description="使用的亂數串流名稱")
+
+class BulkRollDiceRequest(BaseModel):
+    """批次擲骰請求"""
+    dice_count: int = Field(..., ge=1, le=100, description="骰子數量 (1-100)")
+    dice_sides: int = Field(..., ge=2, le=100, description="骰子面數 (2-100)")
+    modifier: int = Field(default=0, description="修正值")
+    rolls: int = Field(..., ge=1, le=1_000_000, description="獨立擲骰次數 (1-1,000,000)")
+    output: str = Field(default="histogram", pattern="^(histogram|results)$", description="回傳格式：histogram（直方圖）或 results（每次總和）")
+    seed: Optional[int] = Field(None, description="亂數種子；指定後相同 seed 與 stream 會得到相同結果，可用於重播")
+    stream: Optional[str] = Field(None, max_length=200, description="亂數串流名稱，例如 session 與擲骰序號，搭配 seed 使用")
+
+class BulkRollDiceResponse(BaseModel):
+    """批次擲骰回應"""
+    dice_count: int = Field(..., description="骰子數量")
+    dice_sides: int = Field(..., description="骰子面數")
+    modifier: int = Field(..., description="修正值")
+    rolls: int = Field(..., description="擲骰次數")
+    totals: Optional[List[int]] = Field(None, description="每次擲骰的總和（output=results 時提供）")
+    histogram: Optional[Dict[int, int]] = Field(None, description="各總和的出現次數（output=histogram 時提供）")
+    mean: float = Field(..., description="平均總和")
+    min: int = Field(..., description="最小總和")
+    max: int = Field(..., description="最大總和")
+    description: str = Field(..., description="擲骰規格描述")
+    seed: Optional[int] = Field(None, description="使用的亂數種子")
+    stream: Optional[str] = Field(None, description="使用的亂數串流名稱")
+
+class DiceExpressionRequest(BaseModel):
+    """擲骰表達式請求"""
+    expression: str = Field(..., min_length=1, max_length=200, description="擲骰表達式，例如 2d20kh1+1d4+3、4d6dl1、3d6!")
+    seed: Optional[int] = Field(None, description="亂數種子；指定後相同 seed 與 stream 會得到相同結果，可用於重播")
+    stream: Optional[str] = Field(None, max_length=200, description="亂數串流名稱，例如 session 與擲骰序號，搭配 seed 使用")
+
+class DiceTermDetail(BaseModel):
+    """擲骰表達式中單一骰子項目的結果"""
+    term: str = Field(..., description="骰子項目")
+    rolls: List[int] = Field(..., description="所有擲出的骰子（包含爆骰）")
+    kept: List[int] = Field(..., description="保留計入總和的骰子")
+    subtotal: int = Field(..., description="此項目的小計（已套用正負號）")
+
+class DiceExpressionResponse(BaseModel):
+    """擲骰表達式回應"""
+    expression: str = Field(..., description="正規化後的擲骰表達式")
+    terms: List[DiceTermDetail] = Field(..., description="各骰子項目的結果")
+    modifier: int = Field(..., description="常數修正值總和")
+    total: int = Field(..., description="總和（包含修正值）")
+    description: str = Field(..., description="結果描述")
+    seed: Optional[int] = Field(None, description="使用的亂數種子")
+    stream: Optional[str] = Field(None, description="使用的亂數串流名稱")
+
+class SkillCheckResponse(BaseModel):
+    """技能檢定回應（包含檢定結果與對應分支的章節）"""
+    success: bool = Field(..., description="檢定是否成功")
+    expression: str = Field(..., description="擲骰表達式")
+    terms: List[DiceTermDetail] = Field(..., description="各骰子項目的結果")
+    stat: Optional[str] = Field(None, description="使用的屬性名稱")
+    stat_modifier: int = Field(..., description="屬性修正值")
+    modifier: int = Field(..., description="固定修正值")
+    total: int = Field(..., description="檢定總值")
+    difficulty: int = Field(..., description="難度")
+    next_chapter_id: int = Field(..., description="檢定結果對應的章節ID")
+    description: str = Field(..., description="結果描述")
+    chapter: StoryEngineResponse = Field(..., description="檢定結果對應的章節內容（已處理條件內容）")
+    seed: Optional[int] = Field(None, description="使用的亂數種子")
+    stream: Optional[str] = Field(None, description="使用的亂數串流名稱")
 
 # 故事管理相關
 class StoryInfo(BaseModel):
@@ -82,6 +156,32 @@ class StoryChaptersResponse(BaseModel):
     chapters: List[ChapterInfo] = Field(..., description="章節列表")
     total: int = Field(..., description="章節總數")
 
+class ChapterAnalytics(BaseModel):
+    """單一章節的路徑分析結果"""
+    chapter_id: int = Field(..., description="章節ID")
+    is_ending: bool = Field(..., description="是否為結局章節")
+    in_cycle: bool = Field(..., description="是否位於循環中")
+    reachable_from_start: bool = Field(..., description="是否可從起始章節到達")
+    paths_from_start: str = Field(..., description="從起始章節到此章節的路徑數（十進位字串；無限時為 infinite）")
+    paths_to_ending: str = Field(..., description="從此章節到任一結局的路徑數（十進位字串；無限時為 infinite）")
+    reachable_endings: List[int] = Field(..., description="從此章節可到達的結局章節ID")
+
+class StoryAnalyticsResponse(BaseModel):
+    """故事路徑分析回應"""
+    story_id: str = Field(..., description="故事ID")
+    start_id: int = Field(..., description="起始章節ID")
+    total_chapters: int = Field(..., description="章節總數")
+    total_endings: int = Field(..., description="結局章節數量")
+    total_paths: str = Field(..., description="不同遊玩路徑數（十進位字串，避免超出 JSON 數值範圍；存在可到達結局的循環時為 infinite）")
+    paths_per_ending: Dict[int, str] = Field(..., description="從起始章節到各結局的路徑數")
+    reachable_endings: List[int] = Field(..., description="從起始章節可到達的結局")
+    unreachable_endings: List[int] = Field(..., description="無法到達的結局")
+    unreachable_chapters: List[int] = Field(..., description="從起始章節無法到達的章節")
+    trap_chapters: List[int] = Field(..., description="可到達但無法通往任何結局的章節")
+    cycles: List[List[int]] = Field(..., description="循環（強連通分量）中的章節，依大小排序")
+    missing_references: int = Field(..., description="引用不存在章節的次數")
+    chapter: Optional[ChapterAnalytics] = Field(None, description="指定 chapter_id 時該章節的分析結果")
+
 # 故事建立和更新
 class CreateStoryRequest(BaseModel):
     """建立故事請求"""
@@ -110,6 +210,13 @@ class ImportStoryResponse(BaseModel):
     success: bool = Field(..., description="是否成功")
     message: str = Field(..., description="回應訊息")
     imported_chapters: int = Field(default=0, description="匯入的章節數量")
+    added_chapters: int = Field(default=0, description="新增的章節數量")
+    changed_chapters: int = Field(default=0, description="內容有變更而更新的章節數量（覆蓋既有故事時）")
+    removed_chapters: int = Field(default=0, description="已從故事中移除而刪除的章節數量（覆蓋既有故事時）")
+    story_id: Optional[str] = Field(None, description="故事ID")
+    errors: List[Dict[str, Any]] = Field(default_factory=list, description="驗證錯誤（問題代碼、訊息與章節位置，最多列出 50 個）")
+    error_count: int = Field(default=0, description="驗證錯誤總數")
+    warning_count: int = Field(default=0, description="驗證警告數量")
 
 class ExportStoryResponse(BaseModel):
     """匯出故事回應"""
@@ -121,6 +228,35 @@ class ExportStoryResponse(BaseModel):
     exported_at: datetime = Field(..., description="匯出時間")
     chapters: List[Dict[str, Any]] = Field(..., description="章節資料")
 
+# 背景工作
+class JobCreateRequest(BaseModel):
+    """建立背景工作請求（匯入請使用 POST /api/jobs/import 上傳檔案）"""
+    job_type: str = Field(..., pattern="^(export_story|analyze_story)$", description="工作類型：export_story（匯出故事）或 analyze_story（路徑分析）")
+    story_id: str = Field(..., description="故事ID")
+    start_id: int = Field(default=1, description="路徑分析的起始章節ID")
+
+class JobInfo(BaseModel):
+    """背景工作狀態"""
+    job_id: str = Field(..., description="工作ID")
+    job_type: str = Field(..., description="工作類型")
+    story_id: Optional[str] = Field(None, description="故事ID")
+    status: str = Field(..., description="狀態：queued / running / succeeded / failed / cancelled")
+    progress: int = Field(..., description="進度（0 ~ 100）")
+    message: Optional[str] = Field(None, description="目前進度說明")
+    result: Optional[Dict[str, Any]] = Field(None, description="工作結果（完成後才有）")
+    error: Optional[str] = Field(None, description="失敗原因")
+    created_at: Optional[datetime] = Field(None, description="建立時間")
+    started_at: Optional[datetime] = Field(None, description="開始時間")
+    finished_at: Optional[datetime] = Field(None, description="結束時間")
+
+    class Config:
+        from_attributes = True
+
+class JobListResponse(BaseModel):
+    """背景工作列表回應"""
+    jobs: List[JobInfo] = Field(..., description="工作列表（由新到舊）")
+    total: int = Field(..., description="工作數量")
+
 # 錯誤回應
 class ErrorResponse(BaseModel):
     """錯誤回應"""
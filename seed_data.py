@@ -17,9 +17,55 @@ from models import (
     get_story_info, create_story_table_in_db
 )
 from default_story_data import create_default_story_data
+from story_incremental import chapter_digest
 
-def import_story_from_json(file_path: str, story_id: str = None, overwrite: bool = False) -> bool:
-    """從 JSON 檔案匯入故事"""
+def chapter_row_digest(chapter: Dict[str, Any]) -> str:
+    """章節資料列的內容雜湊（只包含會寫入資料庫的欄位）"""
+    options = chapter.get('options') or []
+    if isinstance(options, str):
+        options = json.loads(options)
+    return chapter_digest({
+        'id': chapter['id'],
+        'title': chapter['title'],
+        'content': chapter['content'],
+        'options': options
+    })
+
+def load_chapter_digests(db: Session, table_name: str) -> Dict[int, str]:
+    """讀取資料庫中現有章節的內容雜湊"""
+    result = db.execute(text(f"SELECT id, title, content, options FROM {table_name}"))
+    return {row.id: chapter_row_digest(row._asdict()) for row in result}
+
+def diff_chapters(chapters: List[Dict[str, Any]], stored_digests: Dict[int, str]) -> Dict[str, List]:
+    """比較檔案章節與資料庫中的雜湊，找出新增、變更與刪除的章節"""
+    added, changed = [], []
+    file_ids = set()
+    for chapter in chapters:
+        file_ids.add(chapter['id'])
+        stored = stored_digests.get(chapter['id'])
+        if stored is None:
+            added.append(chapter)
+        elif stored != chapter_row_digest(chapter):
+            changed.append(chapter)
+    
+    removed = sorted(chapter_id for chapter_id in stored_digests if chapter_id not in file_ids)
+    return {'added': added, 'changed': changed, 'removed': removed}
+
+def chapter_row(chapter: Dict[str, Any]) -> Dict[str, Any]:
+    """章節寫入資料庫時的參數"""
+    return {
+        'id': chapter['id'],
+        'title': chapter['title'],
+        'content': chapter['content'],
+        'options': json.dumps(chapter.get('options', []), ensure_ascii=False)
+    }
+
+def import_story_from_json(file_path: str, story_id: str = None, overwrite: bool = False) -> Optional[Dict[str, List]]:
+    """從 JSON 檔案匯入故事
+    
+    覆蓋現有故事時只寫入內容雜湊不同的章節並刪除檔案中已移除的章節，
+    成功時回傳差異（added / changed / removed），失敗時回傳 None
+    """
     
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -49,19 +95,10 @@ def import_story_from_json(file_path: str, story_id: str = None, overwrite: bool
         existing_story = get_story_info(story_info['story_id'])
         if existing_story and not overwrite:
             print(f"❌ 故事 '{story_info['story_id']}' 已存在，使用 --overwrite 參數強制覆蓋")
-            return False
+            return None
         
-        # 註冊或更新故事
         if existing_story and overwrite:
             print(f"🔄 覆蓋現有故事: {story_info['story_id']}")
-            # 清空現有章節
-            db = SessionLocal()
-            try:
-                table_name = f"story_{story_info['story_id']}"
-                db.execute(text(f"DELETE FROM {table_name}"))
-                db.commit()
-            finally:
-                db.close()
         else:
             # 註冊新故事
             success = register_story(
@@ -72,43 +109,49 @@ def import_story_from_json(file_path: str, story_id: str = None, overwrite: bool
             )
             if not success:
                 print(f"❌ 註冊故事失敗: {story_info['story_id']}")
-                return False
+                return None
         
-        # 匯入章節資料
+        # 匯入章節資料：與現有章節比對雜湊，只寫入差異
         db = SessionLocal()
         try:
             table_name = f"story_{story_info['story_id']}"
-            imported_count = 0
+            stored_digests = load_chapter_digests(db, table_name) if existing_story else {}
+            diff = diff_chapters(story_info['chapters'], stored_digests)
             
-            for chapter in story_info['chapters']:
-                insert_sql = text(f"""
+            if diff['added']:
+                db.execute(text(f"""
                     INSERT INTO {table_name} (id, title, content, options)
                     VALUES (:id, :title, :content, :options)
-                """)
-                
-                db.execute(insert_sql, {
-                    'id': chapter['id'],
-                    'title': chapter['title'],
-                    'content': chapter['content'],
-                    'options': json.dumps(chapter.get('options', []), ensure_ascii=False)
-                })
-                imported_count += 1
+                """), [chapter_row(chapter) for chapter in diff['added']])
+            if diff['changed']:
+                db.execute(text(f"""
+                    UPDATE {table_name} SET title = :title, content = :content, options = :options
+                    WHERE id = :id
+                """), [chapter_row(chapter) for chapter in diff['changed']])
+            if diff['removed']:
+                db.execute(text(f"DELETE FROM {table_name} WHERE id = :id"),
+                           [{'id': chapter_id} for chapter_id in diff['removed']])
             
             db.commit()
             print(f"✅ 成功匯入故事 '{story_info['title']}' ({story_info['story_id']})")
-            print(f"   匯入章節數: {imported_count}")
-            return True
+            if existing_story:
+                unchanged = len(story_info['chapters']) - len(diff['added']) - len(diff['changed'])
+                print(f"   新增 {len(diff['added'])} 章，更新 {len(diff['changed'])} 章，"
+                      f"刪除 {len(diff['removed'])} 章，{unchanged} 章未變更")
+            else:
+                print(f"   匯入章節數: {len(diff['added'])}")
+            return diff
             
         except Exception as e:
             db.rollback()
             print(f"❌ 匯入章節失敗: {e}")
-            return False
+            return None
         finally:
             db.close()
             
     except Exception as e:
         print(f"❌ 讀取檔案失敗: {e}")
-        return False
+        return None
 
 def export_story_to_json(story_id: str, output_file: str = None) -> bool:
     """匯出故事到 JSON 檔案"""
@@ -0,0 +1,362 @@
+"""
+故事分析模組
+計算故事有多少種不同的遊玩路徑，以及每個章節還能到達哪些結局
+先以強連通分量（SCC）壓縮循環，再在壓縮後的有向無環圖上做記憶化動態規劃，
+路徑數使用 Python 大整數，可到達的結局以整數位元集合表示，整體為線性時間
+"""
+
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+# 路徑數無限（可到達結局的循環）時的表示方式
+INFINITE = "infinite"
+# 超過此位元數的路徑數以科學記號近似輸出（Python 預設限制整數轉字串最多 4300 位數）
+MAX_EXACT_COUNT_BITS = 12_000
+# 報告中預設列出的結局數量
+MAX_LISTED_ENDINGS = 10
+
+def option_targets(option: Dict[str, Any]) -> List[Any]:
+    """取得選項可能前往的所有章節 ID（包含技能檢定的成功與失敗分支）"""
+    targets = []
+    if 'next_id' in option:
+        targets.append(option['next_id'])
+    check = option.get('check')
+    if isinstance(check, dict):
+        for field in ('success_id', 'failure_id'):
+            if field in check and check[field] not in targets:
+                targets.append(check[field])
+    return targets
+
+def strongly_connected_components(edges: List[List[int]]) -> Tuple[List[int], List[List[int]]]:
+    """以非遞迴的 Tarjan 演算法找出強連通分量（分量依反向拓撲順序編號，終點在前）"""
+    count = len(edges)
+    order = [-1] * count
+    low = [0] * count
+    on_stack = [False] * count
+    component_of = [-1] * count
+    components: List[List[int]] = []
+    stack: List[int] = []
+    counter = 0
+
+    for root in range(count):
+        if order[root] != -1:
+            continue
+
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+
+        while work:
+            node, position = work[-1]
+            successors = edges[node]
+
+            if position < len(successors):
+                work[-1] = (node, position + 1)
+                target = successors[position]
+                if order[target] == -1:
+                    order[target] = low[target] = counter
+                    counter += 1
+                    stack.append(target)
+                    on_stack[target] = True
+                    work.append((target, 0))
+                elif on_stack[target] and order[target] < low[node]:
+                    low[node] = order[target]
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[node] < low[parent]:
+                    low[parent] = low[node]
+
+            if low[node] == order[node]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component_of[member] = len(components)
+                    members.append(member)
+                    if member == node:
+                        break
+                components.append(members)
+
+    return component_of, components
+
+def _add_counts(left: Optional[int], right: Optional[int]) -> Optional[int]:
+    """相加路徑數（None 代表無限）"""
+    if left is None or right is None:
+        return None
+    return left + right
+
+def approximate_count(count: int) -> str:
+    """以科學記號近似表示極大的路徑數"""
+    shift = max(count.bit_length() - 64, 0)
+    exponent_estimate = math.log10(count >> shift) + shift * math.log10(2)
+    exponent = math.floor(exponent_estimate)
+    return f"~{10 ** (exponent_estimate - exponent):.3f}e+{exponent}"
+
+def format_count(count: Optional[int]) -> Any:
+    """將路徑數轉為輸出格式（無限時為 'infinite'，位數過多無法轉為十進位時以科學記號近似）"""
+    if count is None:
+        return INFINITE
+    if count.bit_length() > MAX_EXACT_COUNT_BITS:
+        return approximate_count(count)
+    return count
+
+class StoryAnalysis:
+    """故事路徑與結局可達性分析"""
+
+    def __init__(self, chapters: List[Dict[str, Any]], start_id: int = 1):
+        self.start_id = start_id
+        self.ids: List[int] = []
+        self.index: Dict[int, int] = {}
+        self.missing_references: List[Tuple[int, Any]] = []
+
+        for chapter in chapters:
+            chapter_id = chapter.get('id')
+            if isinstance(chapter_id, int) and chapter_id not in self.index:
+                self.index[chapter_id] = len(self.ids)
+                self.ids.append(chapter_id)
+
+        # 每個選項結果一條邊（同一目標的多個選項算作不同的選擇）
+        self.edges: List[List[int]] = [[] for _ in self.ids]
+        is_ending = [False] * len(self.ids)
+        compiled = set()
+        for chapter in chapters:
+            position = self.index.get(chapter.get('id')) if isinstance(chapter.get('id'), int) else None
+            # 重複的章節 ID 只採用第一個
+            if position is None or position in compiled:
+                continue
+            compiled.add(position)
+            options = chapter.get('options') or []
+            if not options:
+                is_ending[position] = True
+            for option in options:
+                if not isinstance(option, dict):
+                    continue
+                for target in option_targets(option):
+                    target_position = self.index.get(target) if isinstance(target, int) else None
+                    if target_position is None:
+                        self.missing_references.append((chapter['id'], target))
+                    else:
+                        self.edges[position].append(target_position)
+
+        self.is_ending = is_ending
+        self.endings = [position for position, ending in enumerate(is_ending) if ending]
+        self.component_of, self.components = strongly_connected_components(self.edges)
+        self.cyclic = [
+            len(members) > 1 or members[0] in self.edges[members[0]]
+            for members in self.components
+        ]
+
+        self._compute_reachable_endings(is_ending)
+        self._compute_paths_to_ending()
+        self._compute_paths_from_start()
+
+    def _compute_reachable_endings(self, is_ending: List[bool]):
+        """計算每個分量可到達的結局（位元 i 代表第 i 個結局）"""
+        ending_bit = {position: 1 << bit for bit, position in enumerate(self.endings)}
+        component_of = self.component_of
+        reach = [0] * len(self.components)
+
+        # 分量依反向拓撲順序編號，後繼分量一定先算好
+        for component, members in enumerate(self.components):
+            bits = 0
+            for node in members:
+                if is_ending[node]:
+                    bits |= ending_bit[node]
+                for target in self.edges[node]:
+                    target_component = component_of[target]
+                    if target_component != component:
+                        bits |= reach[target_component]
+            reach[component] = bits
+
+        self.reach = reach
+
+    def _compute_paths_to_ending(self):
+        """計算從每個分量出發能到達結局的路徑數（可到達結局的循環為無限）"""
+        component_of = self.component_of
+        counts: List[Optional[int]] = [0] * len(self.components)
+
+        for component, members in enumerate(self.components):
+            if self.cyclic[component]:
+                counts[component] = None if self.reach[component] else 0
+                continue
+
+            node = members[0]
+            total: Optional[int] = 1 if self.is_ending[node] else 0
+            for target in self.edges[node]:
+                total = _add_counts(total, counts[component_of[target]])
+                if total is None:
+                    break
+            counts[component] = total
+
+        self.paths_to_ending_counts = counts
+
+    def _compute_paths_from_start(self):
+        """計算從起始章節到每個分量的路徑數（經過循環後為無限）"""
+        counts: List[Optional[int]] = [0] * len(self.components)
+        start = self.index.get(self.start_id)
+        if start is not None:
+            counts[self.component_of[start]] = 1
+
+        component_of = self.component_of
+        # 反向走訪分量編號即為拓撲順序
+        for component in range(len(self.components) - 1, -1, -1):
+            count = counts[component]
+            if count == 0:
+                continue
+            if self.cyclic[component]:
+                count = counts[component] = None
+            for node in self.components[component]:
+                for target in self.edges[node]:
+                    target_component = component_of[target]
+                    if target_component != component:
+                        counts[target_component] = _add_counts(counts[target_component], count)
+
+        self.paths_from_start_counts = counts
+
+    def _decode_endings(self, bits: int) -> List[int]:
+        """將結局位元集合轉為章節 ID 列表"""
+        endings = []
+        while bits:
+            lowest = bits & -bits
+            endings.append(self.ids[self.endings[lowest.bit_length() - 1]])
+            bits ^= lowest
+        return endings
+
+    def has_chapter(self, chapter_id: int) -> bool:
+        """章節是否存在"""
+        return chapter_id in self.index
+
+    def reachable_endings(self, chapter_id: int) -> List[int]:
+        """從指定章節可到達的結局章節 ID"""
+        return self._decode_endings(self.reach[self.component_of[self.index[chapter_id]]])
+
+    def paths_to_ending(self, chapter_id: int) -> Optional[int]:
+        """從指定章節到任一結局的路徑數（None 代表無限）"""
+        return self.paths_to_ending_counts[self.component_of[self.index[chapter_id]]]
+
+    def paths_from_start(self, chapter_id: int) -> Optional[int]:
+        """從起始章節到指定章節的路徑數（None 代表無限）"""
+        return self.paths_from_start_counts[self.component_of[self.index[chapter_id]]]
+
+    def chapter_report(self, chapter_id: int) -> Dict[str, Any]:
+        """單一章節的分析結果"""
+        position = self.index[chapter_id]
+        component = self.component_of[position]
+        return {
+            "chapter_id": chapter_id,
+            "is_ending": self.is_ending[position],
+            "in_cycle": self.cyclic[component],
+            "reachable_from_start": self.paths_from_start_counts[component] != 0,
+            "paths_from_start": format_count(self.paths_from_start_counts[component]),
+            "paths_to_ending": format_count(self.paths_to_ending_counts[component]),
+            "reachable_endings": self._decode_endings(self.reach[component])
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """整體分析結果"""
+        start = self.index.get(self.start_id)
+        reachable = [count != 0 for count in self.paths_from_start_counts]
+
+        paths_per_ending = {}
+        for position in self.endings:
+            count = self.paths_from_start_counts[self.component_of[position]]
+            if count != 0:
+                paths_per_ending[self.ids[position]] = format_count(count)
+
+        ending_ids = [self.ids[position] for position in self.endings]
+        start_endings = self.reachable_endings(self.start_id) if start is not None else []
+        start_ending_set = set(start_endings)
+
+        unreachable_chapters = [
+            chapter_id for position, chapter_id in enumerate(self.ids)
+            if not reachable[self.component_of[position]]
+        ]
+        # 從起始章節可到達，但無論怎麼選都到不了任何結局的章節
+        trap_chapters = [
+            chapter_id for position, chapter_id in enumerate(self.ids)
+            if reachable[self.component_of[position]] and not self.reach[self.component_of[position]]
+        ]
+        cycles = sorted(
+            (sorted(self.ids[node] for node in members)
+             for component, members in enumerate(self.components) if self.cyclic[component]),
+            key=lambda members: (-len(members), members[0])
+        )
+
+        return {
+            "start_id": self.start_id,
+            "total_chapters": len(self.ids),
+            "total_endings": len(ending_ids),
+            "total_paths": format_count(self.paths_to_ending_counts[self.component_of[start]]) if start is not None else 0,
+            "paths_per_ending": paths_per_ending,
+            "reachable_endings": start_endings,
+            "unreachable_endings": [chapter_id for chapter_id in ending_ids if chapter_id not in start_ending_set],
+            "unreachable_chapters": unreachable_chapters,
+            "trap_chapters": trap_chapters,
+            "cycles": cycles,
+            "missing_references": len(self.missing_references)
+        }
+
+def analyze_story(chapters: List[Dict[str, Any]], start_id: int = 1) -> Dict[str, Any]:
+    """分析故事並回傳整體結果"""
+    return StoryAnalysis(chapters, start_id).summary()
+
+def _format_list(values: List[Any], limit: int = 10) -> str:
+    """格式化列表，過長時只顯示前幾項"""
+    text = ", ".join(str(value) for value in values[:limit])
+    if len(values) > limit:
+        text += f" …（共 {len(values)} 個）"
+    return text
+
+def _display_count(count: Any) -> str:
+    """顯示用的路徑數"""
+    if count == INFINITE:
+        return "無限"
+    if isinstance(count, int):
+        return f"{count:,}"
+    return count
+
+def print_analysis(analysis: StoryAnalysis, verbose: bool = False):
+    """顯示分析報告"""
+    summary = analysis.summary()
+
+    print("\n" + "=" * 70)
+    print("🧭 路徑分析")
+    print("=" * 70)
+    print(f"🚩 起始章節: {summary['start_id']}")
+    print(f"🏁 結局數量: {summary['total_endings']}（可到達 {len(summary['reachable_endings'])} 個）")
+
+    if summary['total_paths'] == INFINITE:
+        print("🔀 不同遊玩路徑數: 無限（存在可到達結局的循環）")
+    else:
+        print(f"🔀 不同遊玩路徑數: {_display_count(summary['total_paths'])}")
+
+    if summary['paths_per_ending']:
+        print("\n🏁 各結局的路徑數:")
+        listed = list(summary['paths_per_ending'].items())
+        for ending_id, count in (listed if verbose else listed[:MAX_LISTED_ENDINGS]):
+            print(f"   • 第 {ending_id} 章: {_display_count(count)}")
+        if not verbose and len(listed) > MAX_LISTED_ENDINGS:
+            print(f"   …（共 {len(listed)} 個結局，使用 -v 查看全部）")
+
+    if summary['unreachable_endings']:
+        print(f"\n⚠️ 無法到達的結局: {_format_list(summary['unreachable_endings'])}")
+    if summary['unreachable_chapters']:
+        print(f"⚠️ 從起始章節無法到達的章節: {_format_list(summary['unreachable_chapters'])}")
+    if summary['trap_chapters']:
+        print(f"⚠️ 無法到達任何結局的章節: {_format_list(summary['trap_chapters'])}")
+    if summary['cycles']:
+        print(f"🔁 循環數量: {len(summary['cycles'])}（最大 {len(summary['cycles'][0])} 個章節）")
+        for members in summary['cycles'][:5]:
+            print(f"   • {_format_list(members)}")
+
+    if verbose:
+        print("\n📚 各章節可到達的結局:")
+        for chapter_id in analysis.ids:
+            report = analysis.chapter_report(chapter_id)
+            print(f"   • 第 {chapter_id} 章: 路徑數 {_display_count(report['paths_to_ending'])}，"
+                  f"結局 {_format_list(report['reachable_endings'])}")
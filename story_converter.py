@@ -13,6 +13,8 @@ import re
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from story_stream import StoryStream, StoryStreamError
+
 class StoryConverter:
     """故事格式轉換器"""
     
@@ -27,67 +29,56 @@ class StoryConverter:
         if self.verbose:
             print(f"🔍 {message}")
     
-    def load_story(self, file_path: str) -> bool:
-        """載入故事檔案"""
+    def load_story(self, file_path: str, stream: bool = False) -> bool:
+        """載入故事檔案（stream=True 時不把章節放進記憶體，每次輸出都重新逐章讀取）"""
+        story_stream = StoryStream(file_path)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.story_data = json.load(f)
+            if stream:
+                # 先完整掃描一次，取得檔案格式、故事資訊與章節數
+                self.log(f"串流模式：掃描 {file_path}")
+                len(story_stream)
+                chapters = story_stream
+            else:
+                chapters = list(story_stream)
+            
+            self.story_data = story_stream.metadata
             
             # 檢查檔案格式
-            if isinstance(self.story_data, list):
+            if story_stream.format == "list":
                 # 舊格式：直接是章節陣列
                 self.log("偵測到舊格式故事檔案")
-                self.chapters = self.story_data
+                self.chapters = chapters
+                self.story_info = self._default_story_info()
+            elif story_stream.format == "story_info":
+                # 格式1：包含 story_info 和 chapters
+                self.log("偵測到新格式故事檔案（story_info 結構）")
+                self.story_info = self.story_data["story_info"]
+                self.chapters = chapters
+            elif story_stream.format in ("export", "ndjson"):
+                # 格式2：seed_data.py 匯出格式（直接包含故事資訊）；NDJSON 的故事資訊行格式相同
+                self.log("偵測到 NDJSON 故事檔案" if story_stream.format == "ndjson" else "偵測到匯出格式故事檔案")
                 self.story_info = {
-                    "story_id": "unknown",
-                    "title": "未命名故事",
-                    "description": "",
-                    "author": "",
-                    "version": "1.0",
-                    "created_at": datetime.now().isoformat()
+                    "story_id": self.story_data.get("story_id", "unknown"),
+                    "title": self.story_data.get("title", "未命名故事"),
+                    "description": self.story_data.get("description", ""),
+                    "author": self.story_data.get("author", ""),
+                    "version": self.story_data.get("version", "1.0"),
+                    "created_at": self.story_data.get("exported_at", datetime.now().isoformat())
                 }
-                
-            elif isinstance(self.story_data, dict):
-                # 檢查不同的格式
-                if "story_info" in self.story_data and "chapters" in self.story_data:
-                    # 格式1：包含 story_info 和 chapters
-                    self.log("偵測到新格式故事檔案（story_info 結構）")
-                    self.story_info = self.story_data["story_info"]
-                    self.chapters = self.story_data["chapters"]
-                elif "story_id" in self.story_data and "chapters" in self.story_data:
-                    # 格式2：seed_data.py 匯出格式（直接包含故事資訊）
-                    self.log("偵測到匯出格式故事檔案")
-                    self.story_info = {
-                        "story_id": self.story_data.get("story_id", "unknown"),
-                        "title": self.story_data.get("title", "未命名故事"),
-                        "description": self.story_data.get("description", ""),
-                        "author": self.story_data.get("author", ""),
-                        "version": self.story_data.get("version", "1.0"),
-                        "created_at": self.story_data.get("exported_at", datetime.now().isoformat())
-                    }
-                    self.chapters = self.story_data["chapters"]
-                elif "id" in self.story_data and "title" in self.story_data:
-                    # 格式3：單一章節格式
-                    self.log("偵測到單章節格式")
-                    self.chapters = [self.story_data]
-                    self.story_info = {
-                        "story_id": "unknown",
-                        "title": "未命名故事",
-                        "description": "",
-                        "author": "",
-                        "version": "1.0",
-                        "created_at": datetime.now().isoformat()
-                    }
-                else:
-                    print("❌ 無法識別的故事檔案格式")
-                    print("🔍 支援的格式：")
-                    print("   1. 章節陣列格式：[{章節1}, {章節2}, ...]")
-                    print("   2. story_info 格式：{\"story_info\": {...}, \"chapters\": [...]}")
-                    print("   3. 匯出格式：{\"story_id\": \"...\", \"title\": \"...\", \"chapters\": [...]}")
-                    print("   4. 單章節格式：{\"id\": 1, \"title\": \"...\", ...}")
-                    return False
+                self.chapters = chapters
+            elif story_stream.format == "single_chapter":
+                # 格式3：單一章節格式
+                self.log("偵測到單章節格式")
+                self.chapters = chapters
+                self.story_info = self._default_story_info()
             else:
-                print("❌ 故事檔案格式錯誤")
+                print("❌ 無法識別的故事檔案格式")
+                print("🔍 支援的格式：")
+                print("   1. 章節陣列格式：[{章節1}, {章節2}, ...]")
+                print("   2. story_info 格式：{\"story_info\": {...}, \"chapters\": [...]}")
+                print("   3. 匯出格式：{\"story_id\": \"...\", \"title\": \"...\", \"chapters\": [...]}")
+                print("   4. 單章節格式：{\"id\": 1, \"title\": \"...\", ...}")
+                print("   5. NDJSON 格式：每行一個章節（.ndjson / .jsonl，可加上 .gz）")
                 return False
             
             print(f"✅ 成功載入故事: {self.story_info.get('title', '未命名')}")
@@ -97,16 +88,34 @@ class StoryConverter:
         except FileNotFoundError:
             print(f"❌ 找不到檔案: {file_path}")
             return False
-        except json.JSONDecodeError as e:
+        except StoryStreamError as e:
             print(f"❌ JSON 格式錯誤: {e}")
             return False
         except Exception as e:
             print(f"❌ 載入檔案時發生錯誤: {e}")
             return False
     
+    def _default_story_info(self) -> Dict[str, Any]:
+        """沒有故事資訊時使用的預設值"""
+        return {
+            "story_id": "unknown",
+            "title": "未命名故事",
+            "description": "",
+            "author": "",
+            "version": "1.0",
+            "created_at": datetime.now().isoformat()
+        }
+    
     def save_json(self, file_path: str, format_type: str = "new") -> bool:
         """儲存為 JSON 檔案"""
         try:
+            if not isinstance(self.chapters, list):
+                # 串流模式：逐章寫出，不需要把所有章節放進記憶體
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    self._write_json_stream(f, format_type)
+                print(f"✅ 儲存為 JSON ({format_type} 格式): {file_path}")
+                return True
+            
             if format_type == "new":
                 # 新格式
                 output_data = {
@@ -126,6 +135,25 @@ class StoryConverter:
             print(f"❌ 儲存 JSON 失敗: {e}")
             return False
     
+    def _write_json_stream(self, f, format_type: str):
+        """逐章寫出 JSON，輸出與 json.dump(indent=2) 相同"""
+        if format_type == "new":
+            story_info = json.dumps(self.story_info, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write(f'{{\n  "story_info": {story_info},\n  "chapters": [')
+            indent = '    '
+        else:
+            f.write('[')
+            indent = '  '
+        
+        first = True
+        for chapter in self.chapters:
+            chapter_json = json.dumps(chapter, ensure_ascii=False, indent=2).replace('\n', '\n' + indent)
+            f.write(f"{'' if first else ','}\n{indent}{chapter_json}")
+            first = False
+        
+        closing = '' if first else '\n' + indent[:-2]
+        f.write(f"{closing}]\n}}" if format_type == "new" else f"{closing}]")
+    
     def save_csv(self, file_path: str) -> bool:
         """儲存為 CSV 檔案"""
         try:
@@ -477,6 +505,7 @@ def main():
     parser.add_argument("input", help="輸入的故事檔案路徑")
     parser.add_argument("-v", "--verbose", action="store_true", help="顯示詳細資訊")
     parser.add_argument("--stats", action="store_true", help="顯示統計資訊")
+    parser.add_argument("--stream", action="store_true", help="串流模式：不把章節放進記憶體，每次輸出都重新逐章讀取（適合超大型故事檔案）")
     
     # 輸出格式選項
     parser.add_argument("--json", help="輸出為 JSON 檔案")
@@ -495,7 +524,7 @@ def main():
     converter = StoryConverter(verbose=args.verbose)
     
     # 載入故事檔案
-    if not converter.load_story(args.input):
+    if not converter.load_story(args.input, stream=args.stream):
         sys.exit(1)
     
     # 顯示統計資訊
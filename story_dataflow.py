@@ -0,0 +1,421 @@
+"""
+條件可達性分析模組
+以抽象解釋在故事圖上傳遞遊戲狀態：布林與字串值以有限集合表示，數值以區間表示，
+使用工作佇列演算法計算到不動點，找出永遠不會顯示的條件內容、永遠無法選擇的選項，
+以及因條件限制而無法到達的章節
+"""
+
+import heapq
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from conditions import CONDITION_PATTERN, ParsedCondition, evaluate_parsed, parse_condition, split_option_condition
+from story_analytics import option_targets, strongly_connected_components
+
+INF = float('inf')
+
+# 抽象值：(數值區間或 None, 非數值的可能值集合或 None 表示任意值)
+Interval = Optional[Tuple[float, float]]
+AbstractValue = Tuple[Interval, Optional[FrozenSet[Any]]]
+
+# 未設定的變數在條件中等同 0 / False
+UNSET: AbstractValue = ((0, 0), frozenset())
+# 未知的數值屬性（例如由玩家提供的初始 health）
+UNKNOWN_NUMBER: AbstractValue = ((-INF, INF), frozenset())
+
+# 非數值集合超過此大小時視為任意值
+MAX_ATOMS = 8
+# 同一章節更新超過此次數後對數值區間做加寬（widening），確保循環會收斂
+WIDEN_AFTER = 3
+
+class CompiledOption(NamedTuple):
+    """預先解析好條件與狀態變更的選項"""
+    index: int
+    condition: Optional[str]
+    parts: Tuple[ParsedCondition, ...]
+    numeric_deltas: Tuple[Tuple[str, float], ...]
+    assignments: Tuple[Tuple[str, Any], ...]
+    targets: Tuple[int, ...]
+
+def join_values(left: AbstractValue, right: AbstractValue) -> AbstractValue:
+    """合併兩個抽象值"""
+    if left == right:
+        return left
+
+    left_interval, left_atoms = left
+    right_interval, right_atoms = right
+    if left_interval is None:
+        interval = right_interval
+    elif right_interval is None:
+        interval = left_interval
+    else:
+        interval = (min(left_interval[0], right_interval[0]), max(left_interval[1], right_interval[1]))
+
+    if left_atoms is None or right_atoms is None:
+        atoms = None
+    else:
+        atoms = left_atoms | right_atoms
+        if len(atoms) > MAX_ATOMS:
+            atoms = None
+    return interval, atoms
+
+def widen_values(old: AbstractValue, new: AbstractValue) -> AbstractValue:
+    """加寬：區間仍在擴大的一側直接推到無限大"""
+    joined = join_values(old, new)
+    old_interval, _ = old
+    interval, atoms = joined
+    if old_interval is None or interval is None:
+        return joined
+    low = -INF if interval[0] < old_interval[0] else interval[0]
+    high = INF if interval[1] > old_interval[1] else interval[1]
+    return (low, high), atoms
+
+def join_states(old: Dict[str, AbstractValue], new: Dict[str, AbstractValue],
+                widen: bool) -> Optional[Dict[str, AbstractValue]]:
+    """合併兩個抽象狀態，沒有變化時回傳 None"""
+    if old is new:
+        return None
+
+    merge = widen_values if widen else join_values
+    result = None
+    shared = 0
+    for key, new_value in new.items():
+        old_value = old.get(key)
+        if old_value is None:
+            old_value = UNSET
+        else:
+            shared += 1
+        # 狀態多半沿路徑共用同一個值物件，可直接略過
+        if old_value is new_value:
+            continue
+        value = merge(old_value, new_value)
+        if value != old_value:
+            if result is None:
+                result = dict(old)
+            result[key] = value
+
+    if shared < len(old):
+        for key in old.keys() - new.keys():
+            value = merge(old[key], UNSET)
+            if value != old[key]:
+                if result is None:
+                    result = dict(old)
+                result[key] = value
+    return result
+
+def _interval_outcomes(parsed: ParsedCondition, interval: Tuple[float, float]) -> Tuple[bool, bool]:
+    """數值區間下條件可能為真、可能為假"""
+    low, high = interval
+    if parsed.kind == "bool":
+        return not (low == high == 0), low <= 0 <= high
+    if parsed.kind == "not":
+        return low <= 0 <= high, not (low == high == 0)
+
+    number = parsed.number
+    if number is None:
+        # 數值轉為字串後與非數值比較：不可能相等，大小關係無法判斷
+        if parsed.op == '==':
+            return False, True
+        if parsed.op == '!=':
+            return True, False
+        return True, True
+
+    op = parsed.op
+    if op == '>':
+        return high > number, low <= number
+    if op == '>=':
+        return high >= number, low < number
+    if op == '<':
+        return low < number, high >= number
+    if op == '<=':
+        return low <= number, high > number
+    exact = low == high == number
+    contains = low <= number <= high
+    if op == '==':
+        return contains, not exact
+    return not exact, contains
+
+def condition_outcomes(parsed: ParsedCondition, value: AbstractValue) -> Tuple[bool, bool]:
+    """抽象值下條件可能為真、可能為假"""
+    interval, atoms = value
+    can_true = can_false = False
+
+    if interval is not None:
+        can_true, can_false = _interval_outcomes(parsed, interval)
+
+    if atoms is None:
+        return True, True
+    for atom in atoms:
+        if can_true and can_false:
+            break
+        if evaluate_parsed(parsed, {parsed.var_name: atom}):
+            can_true = True
+        else:
+            can_false = True
+    return can_true, can_false
+
+def refine_value(parsed: ParsedCondition, value: AbstractValue) -> Optional[AbstractValue]:
+    """依條件成立縮小抽象值，條件不可能成立時回傳 None"""
+    interval, atoms = value
+
+    if interval is not None:
+        can_true, _ = _interval_outcomes(parsed, interval)
+        if not can_true:
+            interval = None
+        elif parsed.kind == "not":
+            interval = (0, 0)
+        elif parsed.kind == "compare" and parsed.number is not None:
+            number = parsed.number
+            if parsed.op in ('>', '>='):
+                interval = (max(interval[0], number), interval[1])
+            elif parsed.op in ('<', '<='):
+                interval = (interval[0], min(interval[1], number))
+            elif parsed.op == '==':
+                interval = (number, number)
+
+    if atoms is not None:
+        atoms = frozenset(atom for atom in atoms if evaluate_parsed(parsed, {parsed.var_name: atom}))
+        if interval is None and not atoms:
+            return None
+    return interval, atoms
+
+def _atom_value(value: Any) -> AbstractValue:
+    """將指定的非數值轉為抽象值"""
+    try:
+        return None, frozenset([value])
+    except TypeError:
+        # 無法雜湊的值（陣列、物件）視為任意值
+        return None, None
+
+def apply_delta(value: AbstractValue, delta: float) -> AbstractValue:
+    """數值累加：非數值的現值視為 0（布林值為 0 或 1）"""
+    interval, atoms = value
+    result: Interval = None
+    if interval is not None:
+        result = (interval[0] + delta, interval[1] + delta)
+
+    if atoms is None:
+        bases = [(0, 1)]
+    else:
+        bases = [(int(atom), int(atom)) if isinstance(atom, bool) else (0, 0) for atom in atoms]
+    for low, high in bases:
+        shifted = (low + delta, high + delta)
+        result = shifted if result is None else (min(result[0], shifted[0]), max(result[1], shifted[1]))
+    return result, frozenset()
+
+def compile_option(index: int, option: Dict[str, Any], positions: Dict[int, int]) -> CompiledOption:
+    """解析選項的條件、狀態變更與目標章節"""
+    condition = option.get('condition') or None
+    parts = ()
+    if isinstance(condition, str):
+        parts = tuple(parse_condition(part) for part in split_option_condition(condition))
+
+    numeric_deltas = assignments = ()
+    game_state = option.get('game_state')
+    if game_state and isinstance(game_state, dict):
+        numeric_deltas = tuple((key, value) for key, value in game_state.items()
+                               if isinstance(value, (int, float)) and not isinstance(value, bool))
+        assignments = tuple((key, value) for key, value in game_state.items()
+                            if not isinstance(value, (int, float)) or isinstance(value, bool))
+
+    if 'check' in option:
+        targets = tuple(positions[target] for target in option_targets(option)
+                        if isinstance(target, int) and target in positions)
+    else:
+        # 一般選項只有 next_id，直接查詢
+        next_id = option.get('next_id')
+        position = positions.get(next_id) if isinstance(next_id, int) else None
+        targets = () if position is None else (position,)
+
+    return CompiledOption(index, condition, parts, numeric_deltas, assignments, targets)
+
+class ConditionReachability:
+    """條件感知的可達性分析"""
+
+    def __init__(self, chapters: List[Dict[str, Any]], start_id: int = 1,
+                 initial_state: Optional[Dict[str, Any]] = None):
+        self.start_id = start_id
+        self.ids: List[int] = []
+        positions: Dict[int, int] = {}
+        for chapter in chapters:
+            chapter_id = chapter.get('id')
+            if isinstance(chapter_id, int) and chapter_id not in positions:
+                positions[chapter_id] = len(self.ids)
+                self.ids.append(chapter_id)
+        self.positions = positions
+
+        self.options: List[Tuple[CompiledOption, ...]] = [() for _ in self.ids]
+        self.content_conditions: List[Tuple[Tuple[str, ParsedCondition], ...]] = [() for _ in self.ids]
+        numeric_vars = set()
+        compiled = set()
+
+        for chapter in chapters:
+            chapter_id = chapter.get('id')
+            position = positions.get(chapter_id) if isinstance(chapter_id, int) else None
+            if position is None or position in compiled:
+                continue
+            compiled.add(position)
+
+            options = chapter.get('options')
+            self.options[position] = tuple(
+                compile_option(index, option, positions)
+                for index, option in enumerate(options if isinstance(options, list) else [])
+                if isinstance(option, dict)
+            )
+            content = chapter.get('content')
+            if isinstance(content, str) and '[[IF' in content:
+                self.content_conditions[position] = tuple(
+                    (condition.strip(), parse_condition(condition))
+                    for condition, _ in CONDITION_PATTERN.findall(content)
+                )
+
+            # 以數值累加或數值比較使用的變數視為數值屬性
+            for option in self.options[position]:
+                for key, _ in option.numeric_deltas:
+                    numeric_vars.add(key)
+                for part in option.parts:
+                    if part.number is not None:
+                        numeric_vars.add(part.var_name)
+            for _, parsed in self.content_conditions[position]:
+                if parsed.number is not None:
+                    numeric_vars.add(parsed.var_name)
+
+        # 沒有指定初始狀態時，數值屬性（例如 health）由玩家提供，視為任意值；其餘變數視為未設定
+        if initial_state is None:
+            self.initial_state = {name: UNKNOWN_NUMBER for name in numeric_vars}
+        else:
+            self.initial_state = {}
+            for key, value in initial_state.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.initial_state[key] = ((value, value), frozenset())
+                else:
+                    self.initial_state[key] = _atom_value(value)
+
+        component_of, components = strongly_connected_components(
+            [[target for option in options for target in option.targets] for options in self.options]
+        )
+        # 依拓撲順序處理，減少同一章節被重複處理的次數
+        self.rank = [len(components) - 1 - component for component in component_of]
+        self.states: List[Optional[Dict[str, AbstractValue]]] = [None] * len(self.ids)
+        self.iterations = 0
+        self._run()
+
+    def _apply_option(self, state: Dict[str, AbstractValue],
+                      option: CompiledOption) -> Optional[Dict[str, AbstractValue]]:
+        """在條件成立的前提下套用選項，條件不可能成立時回傳 None"""
+        result = state
+        for parsed in option.parts:
+            value = refine_value(parsed, result.get(parsed.var_name, UNSET))
+            if value is None:
+                return None
+            if result is state:
+                result = dict(state)
+            result[parsed.var_name] = value
+
+        if option.numeric_deltas or option.assignments:
+            if result is state:
+                result = dict(state)
+            for key, delta in option.numeric_deltas:
+                result[key] = apply_delta(result.get(key, UNSET), delta)
+            for key, value in option.assignments:
+                result[key] = _atom_value(value)
+        return result
+
+    def _run(self):
+        """以工作佇列計算不動點"""
+        start = self.positions.get(self.start_id)
+        if start is None:
+            return
+
+        states = self.states
+        rank = self.rank
+        visits = [0] * len(self.ids)
+        states[start] = dict(self.initial_state)
+        queued = {start}
+        worklist = [(rank[start], start)]
+
+        while worklist:
+            _, node = heapq.heappop(worklist)
+            queued.discard(node)
+            self.iterations += 1
+            state = states[node]
+
+            for option in self.options[node]:
+                out_state = self._apply_option(state, option)
+                if out_state is None:
+                    continue
+                for target in option.targets:
+                    if states[target] is None:
+                        states[target] = out_state
+                    else:
+                        visits[target] += 1
+                        merged = join_states(states[target], out_state, visits[target] > WIDEN_AFTER)
+                        if merged is None:
+                            continue
+                        states[target] = merged
+                    if target not in queued:
+                        queued.add(target)
+                        heapq.heappush(worklist, (rank[target], target))
+
+    def _structurally_reachable(self) -> List[bool]:
+        """忽略條件時可從起始章節到達的章節"""
+        reachable = [False] * len(self.ids)
+        start = self.positions.get(self.start_id)
+        if start is None:
+            return reachable
+        reachable[start] = True
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for option in self.options[node]:
+                for target in option.targets:
+                    if not reachable[target]:
+                        reachable[target] = True
+                        queue.append(target)
+        return reachable
+
+    def unreachable_chapters(self) -> List[int]:
+        """選項引用可到達，但因條件永遠無法進入的章節"""
+        return [
+            self.ids[position]
+            for position, reachable in enumerate(self._structurally_reachable())
+            if reachable and self.states[position] is None
+        ]
+
+    def unreachable_options(self) -> List[Dict[str, Any]]:
+        """可到達的章節中，條件永遠不成立的選項"""
+        results = []
+        for position, state in enumerate(self.states):
+            if state is None:
+                continue
+            for option in self.options[position]:
+                if option.parts and self._apply_option(state, option) is None:
+                    results.append({
+                        "chapter_id": self.ids[position],
+                        "option": option.index + 1,
+                        "condition": option.condition
+                    })
+        return results
+
+    def dead_content(self) -> List[Dict[str, Any]]:
+        """可到達的章節中，條件永遠不成立而不會顯示的條件內容"""
+        results = []
+        for position, state in enumerate(self.states):
+            if state is None:
+                continue
+            for condition, parsed in self.content_conditions[position]:
+                can_true, _ = condition_outcomes(parsed, state.get(parsed.var_name, UNSET))
+                if not can_true:
+                    results.append({"chapter_id": self.ids[position], "condition": condition})
+        return results
+
+    def summary(self) -> Dict[str, Any]:
+        """整體分析結果"""
+        return {
+            "start_id": self.start_id,
+            "reached_chapters": sum(1 for state in self.states if state is not None),
+            "iterations": self.iterations,
+            "unreachable_chapters": self.unreachable_chapters(),
+            "unreachable_options": self.unreachable_options(),
+            "dead_content": self.dead_content()
+        }
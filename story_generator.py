@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+合成故事產生工具
+以亂數種子產生可重現、結構合法的大型故事（分支、循環、條件內容、遊戲狀態變更），
+可輸出為 JSON 或 NDJSON（可加上 .gz 壓縮），章節逐一產生與寫出，百萬章的故事也不需要整個放進記憶體
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# 填充章節內容的句子
+SENTENCES = [
+    "你站在岔路口，思考下一步該怎麼走。",
+    "遠處傳來低沉的鼓聲，空氣中瀰漫著潮濕的氣味。",
+    "腳下的石板路布滿青苔，每一步都要格外小心。",
+    "一陣冷風吹過，火把的光影在牆上搖晃。",
+    "你想起出發前長老的叮嚀，握緊了手中的行囊。"
+]
+
+def variable_names(count: int) -> Dict[str, List[str]]:
+    """遊戲狀態變數名稱：一半布林值（flag_*）、一半數值（stat_*），至少各一個"""
+    flags = max(1, count // 2)
+    stats = max(1, count - flags)
+    return {
+        "flags": [f"flag_{index}" for index in range(flags)],
+        "stats": [f"stat_{index}" for index in range(stats)]
+    }
+
+def make_content(rng: random.Random, chapter_id: int, length: int, conditions: float,
+                 variables: Dict[str, List[str]]) -> str:
+    """產生約 length 個字元的章節內容，平均包含 conditions 個條件區塊（布林與數值比較各半）"""
+    parts = [f"第 {chapter_id} 章。"]
+    size = len(parts[0])
+    while size < length:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        size += len(sentence)
+
+    count = int(conditions) + (rng.random() < conditions - int(conditions))
+    for _ in range(count):
+        if rng.random() < 0.5:
+            condition = rng.choice(variables["flags"])
+            block = f"[[IF {condition}]]你想起了之前的發現。[[ENDIF]]"
+        else:
+            condition = f"{rng.choice(variables['stats'])} >= {rng.randint(5, 20)}"
+            block = f"[[IF {condition}]]你感到充滿力量。[[ENDIF]]"
+        parts.insert(rng.randint(1, len(parts)), block)
+    return "".join(parts)
+
+def resolve_endings(count: int, endings: Optional[int]) -> int:
+    """結局數量：預設為章節數的 1%（至少 1 個）；最多為章節數的一半，每個結局才能有前面章節的選項通往"""
+    if endings is None:
+        return max(1, count // 100)
+    max_endings = max(1, count // 2)
+    if not 1 <= endings <= max_endings:
+        raise ValueError(f"結局數量必須介於 1 到 {max_endings} 之間（{count} 章的故事最多 {max_endings} 個結局）")
+    return endings
+
+def iter_chapters(count: int, seed: int = 42, branching: int = 3, cycles: float = 0.05,
+                  conditions: float = 0.5, variables: int = 8, content_length: int = 60,
+                  endings: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """逐一產生章節
+
+    最後 endings 個章節（預設為 1%，最多為一半，見 resolve_endings）是結局；其餘章節的第一個選項一定前往下一章，
+    確保所有章節都能從第 1 章到達，其他選項以 cycles 的機率回到前面 50 章內的章節（形成循環），否則前往後面 100 章內的章節
+    """
+    endings = resolve_endings(count, endings)
+    rng = random.Random(seed)
+    names = variable_names(variables)
+    option_conditions = min(1.0, conditions * 0.2)
+
+    for chapter_id in range(1, count + 1):
+        options = []
+        if chapter_id <= count - endings:
+            for index in range(rng.randint(1, max(1, branching))):
+                if index == 0:
+                    next_id = chapter_id + 1
+                elif chapter_id > 1 and rng.random() < cycles:
+                    next_id = rng.randint(max(1, chapter_id - 50), chapter_id - 1)
+                else:
+                    next_id = rng.randint(chapter_id + 1, min(count, chapter_id + 100))
+                option: Dict[str, Any] = {"text": f"前往路線 {index + 1}", "next_id": next_id}
+                roll = rng.random()
+                if roll < 0.3:
+                    option["game_state"] = {rng.choice(names["flags"]): True}
+                elif roll < 0.5:
+                    option["game_state"] = {rng.choice(names["stats"]): rng.randint(-5, 5)}
+                if index > 0 and rng.random() < option_conditions:
+                    option["condition"] = rng.choice(names["flags"])
+                options.append(option)
+            # 結局前的最後 endings 個章節各多一個選項前往不同的結局，確保每個結局都能到達
+            if endings > 1 and chapter_id > count - 2 * endings:
+                options.append({"text": "走向結局", "next_id": chapter_id + endings})
+
+        yield {
+            "id": chapter_id,
+            "title": f"章節 {chapter_id}",
+            "content": make_content(rng, chapter_id, content_length, conditions, names),
+            "options": options
+        }
+
+def generate_chapters(count: int, seed: int = 42, **options) -> List[Dict[str, Any]]:
+    """產生指定章節數的故事（參數同 iter_chapters）"""
+    return list(iter_chapters(count, seed, **options))
+
+def story_info(story_id: str, count: int, seed: int) -> Dict[str, Any]:
+    return {
+        "story_id": story_id,
+        "title": f"合成故事（{count:,} 章）",
+        "description": f"story_generator.py 以 seed {seed} 產生的測試故事",
+        "author": "story_generator",
+        "version": "1.0"
+    }
+
+def open_output(path: str):
+    """開啟輸出檔案，副檔名為 .gz 時以 gzip 壓縮"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def write_json(f, info: Dict[str, Any], chapters: Iterator[Dict[str, Any]]) -> int:
+    """寫出匯出格式的 JSON（故事資訊與 chapters 陣列），逐章寫入"""
+    header = json.dumps(info, ensure_ascii=False, indent=2)[:-2]
+    f.write(header + ',\n  "chapters": [')
+    written = 0
+    for chapter in chapters:
+        f.write(("\n    " if written == 0 else ",\n    ") + json.dumps(chapter, ensure_ascii=False))
+        written += 1
+    f.write("\n  ]\n}\n")
+    return written
+
+def write_ndjson(f, info: Dict[str, Any], chapters: Iterator[Dict[str, Any]]) -> int:
+    """寫出 NDJSON：第一行為故事資訊，其餘每行一個章節"""
+    f.write(json.dumps(info, ensure_ascii=False) + "\n")
+    written = 0
+    for chapter in chapters:
+        f.write(json.dumps(chapter, ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="合成故事產生工具（可重現的大型測試故事）")
+    parser.add_argument("output", help="輸出檔案路徑（.json / .ndjson / .jsonl，可加上 .gz）")
+    parser.add_argument("-n", "--chapters", type=int, default=1000, help="章節數量（預設 1000）")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子（預設 42）")
+    parser.add_argument("--story-id", default=None, help="故事ID（預設 synthetic_<章節數>）")
+    parser.add_argument("--branching", type=int, default=3, help="每章最多的選項數（預設 3）")
+    parser.add_argument("--cycles", type=float, default=0.05, help="選項回到前面章節（形成循環）的機率（預設 0.05）")
+    parser.add_argument("--conditions", type=float, default=0.5, help="每章平均的條件內容區塊數（預設 0.5）")
+    parser.add_argument("--variables", type=int, default=8, help="遊戲狀態變數數量（預設 8）")
+    parser.add_argument("--content-length", type=int, default=60, help="每章內容的大約字元數（預設 60）")
+    parser.add_argument("--endings", type=int, default=None, help="結局章節數量（預設為章節數的 1%%，最多為章節數的一半）")
+    parser.add_argument("--format", choices=["json", "ndjson"], default=None, help="輸出格式，未指定時依副檔名判斷")
+
+    args = parser.parse_args()
+
+    if args.chapters < 1:
+        print("❌ 章節數量必須至少為 1")
+        sys.exit(1)
+    try:
+        resolve_endings(args.chapters, args.endings)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    base = args.output[:-3] if args.output.endswith(".gz") else args.output
+    output_format = args.format or ("ndjson" if base.endswith((".ndjson", ".jsonl")) else "json")
+    story_id = args.story_id or f"synthetic_{args.chapters}"
+    chapters = iter_chapters(
+        args.chapters, args.seed, branching=args.branching, cycles=args.cycles, conditions=args.conditions,
+        variables=args.variables, content_length=args.content_length, endings=args.endings
+    )
+
+    print(f"🎲 產生 {args.chapters:,} 章的故事（seed: {args.seed}，格式: {output_format}）")
+    started = time.perf_counter()
+    with open_output(args.output) as f:
+        writer = write_ndjson if output_format == "ndjson" else write_json
+        written = writer(f, story_info(story_id, args.chapters, args.seed), chapters)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ 已寫入 {args.output}：{written:,} 章，{os.path.getsize(args.output) / 1024 / 1024:.1f} MB，耗時 {elapsed:.1f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+故事匯入模組
+逐章接收故事資料、邊接收邊驗證，並以批次寫入資料庫；
+記憶體用量取決於批次大小與章節引用索引，而不是整個故事的內容
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import Base, StoryRegistry, engine, register_story
+from seed_data import chapter_row_digest, load_chapter_digests
+from story_analytics import option_targets
+from story_validator import StoryValidator
+
+# 每批寫入資料庫的章節數
+IMPORT_BATCH_SIZE = 500
+# 回應中最多列出的驗證錯誤數
+MAX_REPORTED_ERRORS = 50
+# 每次交給解析器的資料大小，過大的上傳區塊會分段解析，避免一次解析出大量章節
+IMPORT_FEED_SIZE = 256 * 1024
+
+STORY_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_]+$')
+
+class StoryImportError(Exception):
+    """匯入失敗（故事已存在、缺少故事資訊等），訊息可直接回傳給使用者"""
+
+def story_info_from_metadata(metadata: Dict[str, Any], story_id: Optional[str] = None) -> Dict[str, Any]:
+    """從故事檔案的非章節欄位取得故事資訊（支援 story_info 與匯出格式）"""
+    info = metadata.get("story_info") if isinstance(metadata.get("story_info"), dict) else metadata
+    return {
+        "story_id": story_id or info.get("story_id"),
+        "title": info.get("title") or "未命名故事",
+        "description": info.get("description", ""),
+        "author": info.get("author", "")
+    }
+
+class StoryImporter:
+    """串流匯入器：add_chapters 逐批接收章節，finish 完成引用檢查並提交交易
+
+    所有寫入都在同一個交易中完成，驗證失敗時整個匯入會回滾；
+    覆蓋既有故事時與 seed_data.py 相同，比對章節內容雜湊，只寫入新增與變更的章節並刪除已移除的章節
+    """
+
+    def __init__(self, db: Session, story_id: Optional[str] = None, overwrite: bool = False,
+                 batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.story_id_override = story_id
+        self.overwrite = overwrite
+        self.batch_size = batch_size
+        self.story_info: Optional[Dict[str, Any]] = None
+        self.table_name: Optional[str] = None
+        self.created = False
+        self.checker = StoryValidator()
+        self.chapter_count = 0
+        self.imported_chapters = 0
+        self.seen_ids = set()
+        # 只保留 (章節 ID, 選項編號, 目標章節) 供結尾的引用檢查
+        self.references: List[tuple] = []
+        self.batch: List[Dict[str, Any]] = []
+        self.errors: List[Dict[str, Any]] = []
+        self.error_count = 0
+        self.warning_count = 0
+        # 覆蓋既有故事時，資料庫中現有章節的內容雜湊（新故事為 None）
+        self.stored_digests: Optional[Dict[int, str]] = None
+        self.changes = {"added": 0, "changed": 0, "removed": 0}
+
+    def _collect_issues(self) -> int:
+        """取出驗證器累積的問題並計數，只保留前 MAX_REPORTED_ERRORS 個錯誤，回傳新增的錯誤數"""
+        new_errors = 0
+        for issue in self.checker.issues:
+            if issue.severity == "error":
+                new_errors += 1
+                if len(self.errors) < MAX_REPORTED_ERRORS:
+                    self.errors.append(issue.to_dict())
+            else:
+                self.warning_count += 1
+        self.checker.issues.clear()
+        self.error_count += new_errors
+        return new_errors
+
+    def _prepare_story(self, metadata: Dict[str, Any]):
+        """收到第一個章節時確定故事 ID，建立或清空故事資料表"""
+        self.story_info = story_info_from_metadata(metadata, self.story_id_override)
+        story_id = self.story_info["story_id"]
+        if not story_id:
+            raise StoryImportError("缺少 story_id：請在章節之前提供故事資訊，或以 story_id 參數指定")
+        if not STORY_ID_PATTERN.match(story_id):
+            raise StoryImportError("故事ID只能包含字母、數字和底線")
+
+        self.overwrite = self.overwrite or bool(metadata.get("overwrite"))
+        existing = self.db.query(StoryRegistry).filter(StoryRegistry.story_id == story_id).first()
+        if existing and not self.overwrite:
+            raise StoryImportError(f"故事 '{story_id}' 已存在，請設定 overwrite=true 覆蓋")
+
+        self.table_name = f"story_{story_id}"
+        if existing:
+            # 只保留現有章節的雜湊，寫入時跳過內容未變更的章節
+            self.stored_digests = load_chapter_digests(self.db, self.table_name)
+        else:
+            if not register_story(story_id, self.story_info["title"], self.story_info["description"],
+                                  self.story_info["author"]):
+                raise StoryImportError(f"註冊故事失敗: {story_id}")
+            self.created = True
+
+    def add_chapters(self, chapters: List[Dict[str, Any]], metadata: Dict[str, Any]):
+        """驗證並暫存一批章節，暫存數量達到批次大小時寫入資料庫"""
+        for chapter in chapters:
+            if self.table_name is None:
+                self._prepare_story(metadata)
+
+            index = self.chapter_count
+            self.chapter_count += 1
+            if not isinstance(chapter, dict):
+                self.checker.error("chapter_type", f"章節 {index + 1}: 章節必須是物件", chapter_index=index)
+                self._collect_issues()
+                continue
+
+            chapter_id = chapter.get('id')
+            duplicate_id = isinstance(chapter_id, int) and chapter_id in self.seen_ids
+            if isinstance(chapter_id, int):
+                self.seen_ids.add(chapter_id)
+
+            self.checker.check_chapter_structure(index, chapter, duplicate_id)
+            # 結構有錯誤時欄位型別不可信，略過條件與品質檢查（錯誤已足以讓匯入失敗）
+            if self._collect_issues():
+                continue
+            self.checker.check_chapter_conditions(chapter, set())
+            self.checker.check_chapter_quality(chapter)
+
+            options = chapter.get('options', [])
+            for j, option in enumerate(options):
+                self.references.extend((chapter_id, j + 1, target) for target in option_targets(option))
+
+            # 有錯誤的章節不寫入（整個匯入最後會回滾）
+            if not self._collect_issues():
+                self.batch.append({
+                    'id': chapter_id,
+                    'title': chapter['title'],
+                    'content': chapter['content'],
+                    'options': json.dumps(options, ensure_ascii=False)
+                })
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+
+    def flush(self):
+        """把暫存的章節寫入資料庫（覆蓋既有故事時只寫入新增與內容有變更的章節）"""
+        if self.batch and not self.error_count:
+            added, changed = self.batch, []
+            if self.stored_digests is not None:
+                added = [row for row in self.batch if row['id'] not in self.stored_digests]
+                changed = [
+                    row for row in self.batch
+                    if row['id'] in self.stored_digests and self.stored_digests[row['id']] != chapter_row_digest(row)
+                ]
+            if added:
+                self.db.execute(
+                    text(f"INSERT INTO {self.table_name} (id, title, content, options) VALUES (:id, :title, :content, :options)"),
+                    added
+                )
+            if changed:
+                self.db.execute(
+                    text(f"UPDATE {self.table_name} SET title = :title, content = :content, options = :options WHERE id = :id"),
+                    changed
+                )
+            self.changes["added"] += len(added)
+            self.changes["changed"] += len(changed)
+            self.imported_chapters += len(self.batch)
+        self.batch = []
+
+    def finish(self, metadata: Dict[str, Any]) -> bool:
+        """完成匯入：檢查章節引用，沒有錯誤時提交交易，否則回滾"""
+        if self.table_name is None:
+            raise StoryImportError("故事沒有章節")
+
+        for chapter_id, option_number, target in self.references:
+            # 非整數的目標已在結構檢查中回報
+            if isinstance(target, int) and target not in self.seen_ids:
+                self.checker.error("missing_reference", f"章節 {chapter_id}, 選項 {option_number}: 引用不存在的章節 {target}",
+                                   chapter_id=chapter_id, option=option_number, field='next_id')
+        if 1 not in self.seen_ids:
+            self.checker.error("missing_start_chapter", "缺少起始章節（ID = 1）")
+        self._collect_issues()
+
+        if self.error_count:
+            self.abort()
+            return False
+
+        self.flush()
+        if self.stored_digests is not None:
+            removed = [chapter_id for chapter_id in self.stored_digests if chapter_id not in self.seen_ids]
+            if removed:
+                self.db.execute(text(f"DELETE FROM {self.table_name} WHERE id = :id"),
+                                [{'id': chapter_id} for chapter_id in removed])
+            self.changes["removed"] = len(removed)
+        story = self.db.query(StoryRegistry).filter(StoryRegistry.story_id == self.story_info["story_id"]).first()
+        story.title = self.story_info["title"]
+        story.description = self.story_info["description"]
+        story.author = self.story_info["author"]
+        story.is_active = "true"
+        self.db.commit()
+        return True
+
+    def report(self, success: bool) -> Dict[str, Any]:
+        """匯入結果（ImportStoryResponse 的欄位）"""
+        return {
+            "success": success,
+            "message": "故事匯入成功" if success else "故事驗證失敗，沒有匯入任何章節",
+            "imported_chapters": self.imported_chapters,
+            "added_chapters": self.changes["added"],
+            "changed_chapters": self.changes["changed"],
+            "removed_chapters": self.changes["removed"],
+            "story_id": self.story_info["story_id"] if self.story_info else self.story_id_override,
+            "errors": self.errors,
+            "error_count": self.error_count,
+            "warning_count": self.warning_count
+        }
+
+    def abort(self):
+        """回滾交易；這次匯入新建立的故事會一併移除"""
+        self.db.rollback()
+        self.batch = []
+        self.imported_chapters = 0
+        self.changes = {"added": 0, "changed": 0, "removed": 0}
+        if self.created:
+            self.db.query(StoryRegistry).filter(StoryRegistry.story_id == self.story_info["story_id"]).delete()
+            self.db.commit()
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP TABLE IF EXISTS {self.table_name}"))
+            if self.table_name in Base.metadata.tables:
+                Base.metadata.remove(Base.metadata.tables[self.table_name])
+            self.created = False
@@ -0,0 +1,270 @@
+"""
+增量故事驗證模組
+以章節內容雜湊快取單章檢查結果，作者修改少數章節後只重新驗證變更的章節與其圖形鄰居；
+引用檢查與孤立章節由反向引用索引增量更新，條件可達性只在章節圖或條件改變時重新計算
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+from story_analytics import option_targets
+from story_validator import (StoryValidator, ValidationIssue, ValidationResult, collect_option_variables,
+                             compact_chapter, finish_statistics, new_statistics, validator_fingerprint)
+
+ChapterKey = Any
+
+# 重複使用同一個編碼器，省去每次 json.dumps 建立編碼器的成本
+_ENCODER = json.JSONEncoder(ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+def chapter_digest(chapter: Dict[str, Any]) -> str:
+    """章節內容的雜湊（欄位順序不影響結果）"""
+    return hashlib.sha1(_ENCODER.encode(chapter).encode('utf-8')).hexdigest()
+
+def chapter_key(index: int, chapter: Dict[str, Any], seen: Set[ChapterKey]) -> ChapterKey:
+    """章節在圖形索引中的鍵：有效且第一次出現的 ID，否則使用位置"""
+    chapter_id = chapter.get('id')
+    if isinstance(chapter_id, int) and not isinstance(chapter_id, bool) and chapter_id > 0 and chapter_id not in seen:
+        return chapter_id
+    return f"#{index}"
+
+class IncrementalValidator:
+    """增量驗證器：可在同一個行程中重複呼叫 validate，也可以 save / load 在多次執行之間保留狀態"""
+
+    def __init__(self, initial_state: Optional[Dict[str, Any]] = None):
+        self.initial_state = initial_state
+        self.fingerprint = validator_fingerprint(initial_state)
+        # 章節雜湊 -> 單章檢查結果
+        self.results: Dict[str, Dict[str, Any]] = {}
+        # 章節鍵 -> 章節雜湊（上一次驗證的章節順序）
+        self.slots: Dict[ChapterKey, str] = {}
+        # 章節鍵 -> 引用不存在章節的錯誤
+        self.reference_errors: Dict[ChapterKey, List[ValidationIssue]] = {}
+        # 目標章節 ID -> 引用它的章節鍵
+        self.predecessors: Dict[Any, Set[ChapterKey]] = {}
+        self.chapter_ids: Set[Any] = set()
+        self.graph_digest: Optional[str] = None
+        self.reachability_warnings: List[ValidationIssue] = []
+        self.rechecked_chapters = 0
+        self.reference_rechecked = 0
+        self.reachability_reused = False
+
+    def _check_chapter(self, index: int, chapter: Dict[str, Any]) -> Dict[str, Any]:
+        """執行單章檢查（結構、條件語法、內容品質），結果只取決於章節內容"""
+        scratch = StoryValidator()
+        game_state_vars = set()
+        scratch.check_chapter_structure(index, chapter, duplicate_id=False)
+        scratch.check_chapter_conditions(chapter, game_state_vars)
+        collect_option_variables(chapter, game_state_vars)
+        scratch.check_chapter_quality(chapter)
+
+        chapter_id = chapter.get('id')
+        options = chapter.get('options', [])
+        content = chapter.get('content', '')
+        targets = []
+        self_references = []
+        if isinstance(options, list):
+            for j, option in enumerate(options):
+                if not isinstance(option, dict):
+                    continue
+                targets.extend([j + 1, target] for target in option_targets(option))
+                if option.get('next_id') == chapter_id:
+                    self_references.append(j + 1)
+
+        return {
+            "issues": [issue.to_dict() for issue in scratch.issues],
+            "variables": sorted(game_state_vars),
+            "targets": targets,
+            "self_references": self_references,
+            "options": len(options),
+            "content_length": len(content),
+            "conditional": '[[IF' in content,
+            "graph": chapter_digest(compact_chapter(chapter))
+        }
+
+    def _link(self, key: ChapterKey, result: Dict[str, Any]):
+        """把章節的引用加入反向索引"""
+        for _, target in result["targets"]:
+            self.predecessors.setdefault(target, set()).add(key)
+
+    def _unlink(self, key: ChapterKey, result: Dict[str, Any]):
+        """從反向索引移除章節的引用"""
+        for _, target in result["targets"]:
+            referrers = self.predecessors.get(target)
+            if referrers is not None:
+                referrers.discard(key)
+                if not referrers:
+                    del self.predecessors[target]
+
+    def _reference_errors(self, key: ChapterKey, chapter_id: Any, result: Dict[str, Any]) -> List[ValidationIssue]:
+        """章節中引用不存在章節的選項"""
+        chapter_ref = f"章節 {chapter_id}" if chapter_id else "未知章節"
+        return [
+            ValidationIssue("error", "missing_reference", f"{chapter_ref}, 選項 {option_number}: 引用不存在的章節 {target}",
+                            chapter_id=chapter_id, option=option_number, field='next_id')
+            for option_number, target in result["targets"]
+            if target not in self.chapter_ids
+        ]
+
+    def validate(self, chapters: List[Dict[str, Any]], story_info: Optional[Dict[str, Any]] = None) -> ValidationResult:
+        """驗證故事並回傳結構化結果；只重新檢查自上次驗證後變更的章節"""
+        story_info = story_info or {}
+        self.rechecked_chapters = 0
+
+        # 1. 計算章節雜湊，只對新內容執行單章檢查
+        slots: Dict[ChapterKey, str] = {}
+        chapter_id_by_key: Dict[ChapterKey, Any] = {}
+        index_by_key: Dict[ChapterKey, int] = {}
+        seen: Set[ChapterKey] = set()
+        for index, chapter in enumerate(chapters):
+            key = chapter_key(index, chapter, seen)
+            seen.add(key)
+            digest = chapter_digest(chapter)
+            if isinstance(key, str):
+                # 沒有有效 ID 的章節在訊息中以位置表示，位置也是結果的一部分
+                digest = f"{digest}:{index}"
+            if digest not in self.results:
+                self.results[digest] = self._check_chapter(index, chapter)
+                self.rechecked_chapters += 1
+            slots[key] = digest
+            chapter_id_by_key[key] = chapter.get('id')
+            index_by_key[key] = index
+
+        # 2. 找出變更與刪除的章節，增量更新反向引用索引
+        changed = [key for key, digest in slots.items() if self.slots.get(key) != digest]
+        removed = [key for key in self.slots if key not in slots]
+        for key in removed + changed:
+            if key in self.slots:
+                self._unlink(key, self.results[self.slots[key]])
+            self.reference_errors.pop(key, None)
+        for key in changed:
+            self._link(key, self.results[slots[key]])
+
+        chapter_ids = {chapter.get('id') for chapter in chapters if 'id' in chapter}
+        affected = set(changed)
+        for chapter_id in chapter_ids ^ self.chapter_ids:
+            # 章節新增或刪除時，引用它的章節（圖形鄰居）需要重新檢查引用
+            affected.update(self.predecessors.get(chapter_id, ()))
+        self.chapter_ids = chapter_ids
+        for key in affected:
+            if key in slots:
+                self.reference_errors[key] = self._reference_errors(key, chapter_id_by_key[key], self.results[slots[key]])
+        self.reference_rechecked = len(affected)
+
+        old_digests = set(self.slots.values())
+        self.slots = slots
+        for digest in old_digests - set(slots.values()):
+            self.results.pop(digest, None)
+
+        # 3. 組合結果
+        scratch = StoryValidator(initial_state=self.initial_state)
+        scratch.story_info = story_info
+        scratch.validate_story_info()
+        issues = scratch.issues
+
+        if not chapters:
+            issues.append(ValidationIssue("error", "no_chapters", "故事沒有章節"))
+
+        id_counts = Counter(chapter_id_by_key.values())
+        stats = new_statistics(story_info)
+        game_state_vars: Set[str] = set()
+        ending_chapters = []
+        for key, digest in slots.items():
+            result = self.results[digest]
+            chapter_id = chapter_id_by_key[key]
+            for issue in result["issues"]:
+                if "chapter_index" in issue:
+                    # 快取的結果可能來自章節移動前的位置
+                    issue = {**issue, "chapter_index": index_by_key[key]}
+                issues.append(ValidationIssue(**issue))
+            if isinstance(chapter_id, int) and chapter_id > 0 and id_counts[chapter_id] > 1:
+                issues.append(ValidationIssue("error", "duplicate_id", f"章節 {chapter_id}: 重複的章節 ID",
+                                              chapter_id=chapter_id, chapter_index=index_by_key[key], field='id'))
+            issues.extend(self.reference_errors.get(key, ()))
+            issues.extend(
+                ValidationIssue("warning", "self_reference", f"章節 {chapter_id} 包含自我引用", chapter_id=chapter_id, option=option)
+                for option in result["self_references"]
+            )
+            game_state_vars.update(result["variables"])
+            if not result["options"]:
+                ending_chapters.append(chapter_id)
+
+            stats["total_chapters"] += 1
+            stats["total_options"] += result["options"]
+            stats["ending_chapters"] += 0 if result["options"] else 1
+            stats["conditional_chapters"] += 1 if result["conditional"] else 0
+            stats["longest_chapter"] = max(stats["longest_chapter"], result["content_length"])
+            stats["shortest_chapter"] = min(stats["shortest_chapter"], result["content_length"])
+
+        for chapter_id in chapter_ids - set(self.predecessors) - {1}:
+            issues.append(ValidationIssue("warning", "orphan_chapter", f"章節 {chapter_id} 沒有被任何選項引用（可能是孤立章節）",
+                                          chapter_id=chapter_id))
+        if 1 not in chapter_ids:
+            issues.append(ValidationIssue("error", "missing_start_chapter", "缺少起始章節（ID = 1）"))
+        if not ending_chapters:
+            issues.append(ValidationIssue("warning", "no_ending", "沒有找到結局章節（沒有選項的章節）"))
+
+        issues.extend(self._reachability_warnings(chapters, slots))
+
+        return ValidationResult(story_info, issues, finish_statistics(stats), game_state_vars)
+
+    def _reachability_warnings(self, chapters: List[Dict[str, Any]], slots: Dict[ChapterKey, str]) -> List[ValidationIssue]:
+        """條件可達性：章節圖與條件都沒有改變時沿用上次的結果"""
+        digest = hashlib.sha1()
+        for chapter_digest_value in slots.values():
+            digest.update(self.results[chapter_digest_value]["graph"].encode())
+        graph_digest = digest.hexdigest()
+
+        self.reachability_reused = graph_digest == self.graph_digest
+        if not self.reachability_reused:
+            scratch = StoryValidator(initial_state=self.initial_state)
+            scratch.chapters = [compact_chapter(chapter) for chapter in chapters]
+            scratch.chapter_ids = self.chapter_ids
+            scratch.validate_condition_reachability()
+            self.reachability_warnings = scratch.issues
+            self.graph_digest = graph_digest
+        return list(self.reachability_warnings)
+
+    def save(self, cache_path: str):
+        """把增量狀態寫入快取檔案"""
+        state = {
+            "fingerprint": self.fingerprint,
+            "results": self.results,
+            "slots": list(self.slots.items()),
+            "reference_errors": [[key, [issue.to_dict() for issue in issues]] for key, issues in self.reference_errors.items()],
+            "chapter_ids": list(self.chapter_ids),
+            "graph_digest": self.graph_digest,
+            "reachability_warnings": [issue.to_dict() for issue in self.reachability_warnings]
+        }
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+
+    def load(self, cache_path: str) -> bool:
+        """從快取檔案恢復增量狀態；驗證程式或初始狀態改變時忽略舊快取"""
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        if not isinstance(state, dict) or state.get("fingerprint") != self.fingerprint:
+            return False
+
+        self.results = state["results"]
+        self.slots = {key: digest for key, digest in state["slots"]}
+        self.reference_errors = {
+            key: [ValidationIssue(**issue) for issue in issues] for key, issues in state["reference_errors"]
+        }
+        self.chapter_ids = set(state["chapter_ids"])
+        self.graph_digest = state["graph_digest"]
+        self.reachability_warnings = [ValidationIssue(**issue) for issue in state["reachability_warnings"]]
+        self.predecessors = {}
+        for key, digest in self.slots.items():
+            self._link(key, self.results[digest])
+        return True
+
+def incremental_cache_path(file_path: str) -> str:
+    """故事檔案對應的增量驗證快取路徑（與故事檔案放在同一個目錄的隱藏檔案）"""
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.validation_cache.json")
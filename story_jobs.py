@@ -0,0 +1,435 @@
+"""
+背景工作模組
+匯入、匯出與路徑分析等長時間工作交給獨立的工作執行緒處理，不佔用 API 的請求執行緒；
+工作狀態與進度記錄在資料庫的 background_jobs 資料表，可查詢進度與取消
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import BackgroundJob, SessionLocal, StoryRegistry
+from story_analytics import StoryAnalysis
+from story_import import IMPORT_FEED_SIZE, StoryImporter
+from story_stream import StoryStreamParser
+
+# 工作執行緒數量
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# 上傳暫存檔與匯出結果的目錄
+JOB_OUTPUT_DIR = os.environ.get("JOB_OUTPUT_DIR", "job_outputs")
+# 匯出時每次從資料庫讀取的章節數
+EXPORT_BATCH_SIZE = 1000
+# 執行中的工作檢查資料庫中取消要求的最短間隔（秒），其他行程送出的取消要求經由資料庫傳達
+CANCEL_POLL_INTERVAL = 1.0
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    """工作已被取消"""
+
+def worker_id() -> str:
+    """目前行程的識別（主機名稱:PID），記錄在工作上表示由哪個行程執行"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def worker_alive(owner: Optional[str]) -> bool:
+    """執行工作的行程是否仍在執行；其他主機上的行程無法確認，一律視為仍在執行"""
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    if not pid.isdigit() or int(pid) == os.getpid():
+        # 與目前行程相同的 PID：是重新啟動前的上一個行程留下的
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobContext:
+    """傳給工作處理函數的執行環境：回報進度並檢查是否已被取消"""
+
+    def __init__(self, jobs: "JobQueue", job_id: str):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.progress = 0
+        self._last_poll = time.monotonic()
+
+    def report(self, progress: int, message: Optional[str] = None):
+        """回報進度（0 ~ 100）；工作已被要求取消時拋出 JobCancelled"""
+        self.progress = max(0, min(100, int(progress)))
+        self.jobs._live[self.job_id] = (self.progress, message)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """工作已被要求取消時拋出 JobCancelled（每 CANCEL_POLL_INTERVAL 秒檢查一次資料庫中的取消要求）"""
+        if self.job_id in self.jobs._cancel_requested:
+            raise JobCancelled()
+        now = time.monotonic()
+        if now - self._last_poll >= CANCEL_POLL_INTERVAL:
+            self._last_poll = now
+            if self.jobs._cancel_requested_in_db(self.job_id):
+                self.jobs._cancel_requested.add(self.job_id)
+                raise JobCancelled()
+
+class JobQueue:
+    """行程內的工作佇列：工作記錄保存在資料庫，由固定數量的工作執行緒依序執行
+
+    執行中工作的進度與同一行程送出的取消要求保存在記憶體中，不必在工作的交易進行中寫入資料庫
+    （SQLite 在匯入交易期間無法寫入其他資料列）；工作開始與結束時才寫入資料庫。
+    多個 worker 行程共用工作資料表時，工作記錄執行它的行程，其他行程的取消要求寫入 cancel_requested 欄位
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.handlers: Dict[str, Callable[..., Dict[str, Any]]] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # 執行中工作的 (進度, 說明) 與取消要求
+        self._live: Dict[str, tuple] = {}
+        self._cancel_requested: Set[str] = set()
+
+    def register(self, job_type: str):
+        """註冊工作處理函數的裝飾器；處理函數接收 JobContext 與工作參數，回傳結果字典"""
+        def decorator(func):
+            self.handlers[job_type] = func
+            return func
+        return decorator
+
+    def start(self):
+        """啟動工作執行緒（重複呼叫不會重複啟動），並接手上次執行留下的工作"""
+        with self._lock:
+            if self._threads:
+                return
+            self._recover()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"story-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作執行緒（正在執行的工作會先完成）"""
+        with self._lock:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def _recover(self):
+        """伺服器重新啟動時：等待中的工作重新排入佇列，執行到一半、且執行它的行程已經結束的工作標記為失敗
+
+        其他 worker 行程正在執行的工作不受影響
+        """
+        db = SessionLocal()
+        try:
+            for job in db.query(BackgroundJob).filter(BackgroundJob.status == "running").all():
+                if worker_alive(job.worker_id):
+                    continue
+                job.status = "failed"
+                job.error = "伺服器重新啟動，工作中斷"
+                job.finished_at = datetime.now()
+            db.commit()
+            queued = db.query(BackgroundJob).filter(BackgroundJob.status == "queued").order_by(BackgroundJob.created_at).all()
+            for job in queued:
+                self._queue.put(job.job_id)
+        finally:
+            db.close()
+
+    def submit(self, job_type: str, params: Optional[Dict[str, Any]] = None, story_id: Optional[str] = None) -> BackgroundJob:
+        """建立工作記錄並排入佇列，立即回傳工作記錄"""
+        if job_type not in self.handlers:
+            raise ValueError(f"未知的工作類型: {job_type}")
+
+        # 先啟動（並接手舊工作），避免新工作被重複排入佇列
+        self.start()
+        db = SessionLocal()
+        try:
+            job = BackgroundJob(
+                job_id=uuid.uuid4().hex,
+                job_type=job_type,
+                story_id=story_id,
+                status="queued",
+                progress=0,
+                message="等待執行",
+                params=params or {},
+                cancel_requested="false"
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+        finally:
+            db.close()
+
+        self._queue.put(job.job_id)
+        return job
+
+    def get(self, job_id: str) -> Optional[BackgroundJob]:
+        """取得工作記錄"""
+        db = SessionLocal()
+        try:
+            return self._with_live(db.get(BackgroundJob, job_id))
+        finally:
+            db.close()
+
+    def _with_live(self, job: Optional[BackgroundJob]) -> Optional[BackgroundJob]:
+        """以記憶體中的即時進度取代資料庫中的進度（只影響回傳的物件，不寫回資料庫）"""
+        live = self._live.get(job.job_id) if job is not None else None
+        if live is not None:
+            progress, message = live
+            job.progress = progress
+            if message is not None:
+                job.message = message
+        return job
+
+    def list(self, status: Optional[str] = None, story_id: Optional[str] = None, limit: int = 50) -> List[BackgroundJob]:
+        """列出最近的工作"""
+        db = SessionLocal()
+        try:
+            query = db.query(BackgroundJob)
+            if status:
+                query = query.filter(BackgroundJob.status == status)
+            if story_id:
+                query = query.filter(BackgroundJob.story_id == story_id)
+            return [self._with_live(job) for job in query.order_by(BackgroundJob.created_at.desc()).limit(limit).all()]
+        finally:
+            db.close()
+
+    def cancel(self, job_id: str) -> Optional[BackgroundJob]:
+        """取消工作：等待中的工作直接取消，執行中的工作在下一次回報進度時停止"""
+        db = SessionLocal()
+        try:
+            job = db.get(BackgroundJob, job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return job
+            if job.status == "running":
+                if job.worker_id == worker_id():
+                    # 這個行程執行中的工作只在記憶體中標記，工作的交易可能正持有資料庫的寫入鎖
+                    self._cancel_requested.add(job_id)
+                else:
+                    # 其他行程執行中的工作：寫入資料庫，由該行程的 check_cancelled 讀取
+                    try:
+                        db.query(BackgroundJob).filter(
+                            BackgroundJob.job_id == job_id,
+                            BackgroundJob.status == "running"
+                        ).update({"cancel_requested": "true"})
+                        db.commit()
+                    except OperationalError:
+                        # SQLite 在其他行程的匯入交易期間無法寫入
+                        db.rollback()
+                        job = self._with_live(db.get(BackgroundJob, job_id))
+                        job.message = "資料庫忙碌中，無法送出取消要求，請稍後再試"
+                        return job
+                    db.refresh(job)
+                job = self._with_live(job)
+                job.message = "正在取消"
+                return job
+            job.cancel_requested = "true"
+            job.status = "cancelled"
+            job.message = "工作已取消"
+            job.finished_at = datetime.now()
+            db.commit()
+            db.refresh(job)
+            return job
+        finally:
+            db.close()
+
+    def _cancel_requested_in_db(self, job_id: str) -> bool:
+        """資料庫中的工作是否已被要求取消（其他行程送出的取消要求）"""
+        db = SessionLocal()
+        try:
+            return db.query(BackgroundJob.cancel_requested).filter(BackgroundJob.job_id == job_id).scalar() == "true"
+        finally:
+            db.close()
+
+    def _work(self):
+        """工作執行緒：從佇列取出工作並執行"""
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        """執行一個工作並記錄結果"""
+        db = SessionLocal()
+        try:
+            # 以條件更新取得工作，確保同一個工作只會被一個執行緒執行
+            claimed = db.query(BackgroundJob).filter(
+                BackgroundJob.job_id == job_id,
+                BackgroundJob.status == "queued"
+            ).update({"status": "running", "message": "執行中", "started_at": datetime.now(), "worker_id": worker_id()})
+            db.commit()
+            job = db.get(BackgroundJob, job_id)
+            if job is None:
+                return
+            if not claimed:
+                if job.status == "cancelled":
+                    # 在等待中被取消的工作：清除上傳的暫存檔
+                    remove_file((job.params or {}).get("upload_path"))
+                return
+            job_type, params = job.job_type, dict(job.params or {})
+        finally:
+            db.close()
+
+        status, result, error, message = "succeeded", None, None, "工作完成"
+        try:
+            result = self.handlers[job_type](JobContext(self, job_id), **params)
+        except JobCancelled:
+            status, message = "cancelled", "工作已取消"
+        except Exception as e:
+            status, error, message = "failed", str(e), "工作失敗"
+
+        db = SessionLocal()
+        try:
+            job = db.get(BackgroundJob, job_id)
+            job.status = status
+            job.message = message
+            job.result = result
+            job.error = error
+            job.progress = 100 if status == "succeeded" else self._live.get(job_id, (0, None))[0]
+            if job_id in self._cancel_requested:
+                job.cancel_requested = "true"
+            job.finished_at = datetime.now()
+            db.commit()
+        finally:
+            db.close()
+            self._live.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+
+def remove_file(path: Optional[str]):
+    """刪除暫存檔（不存在時忽略）"""
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def job_output_path(name: str) -> str:
+    """工作暫存檔與結果檔的路徑"""
+    os.makedirs(JOB_OUTPUT_DIR, exist_ok=True)
+    return os.path.join(JOB_OUTPUT_DIR, name)
+
+def _parse_options(raw_options) -> List[Dict[str, Any]]:
+    """解析章節選項"""
+    if isinstance(raw_options, str):
+        return json.loads(raw_options) if raw_options else []
+    return raw_options if raw_options else []
+
+def _active_story(db, story_id: str) -> StoryRegistry:
+    """取得啟用中的故事，不存在時拋出例外"""
+    story = db.query(StoryRegistry).filter(
+        StoryRegistry.story_id == story_id,
+        StoryRegistry.is_active == "true"
+    ).first()
+    if not story:
+        raise ValueError(f"故事不存在: {story_id}")
+    return story
+
+job_queue = JobQueue()
+
+@job_queue.register("import_story")
+def run_import_job(context: JobContext, upload_path: str, story_id: Optional[str] = None,
+                   overwrite: bool = False, ndjson: bool = False, gzipped: bool = False) -> Dict[str, Any]:
+    """匯入上傳的故事暫存檔（與 POST /api/stories/import 相同的串流驗證與批次寫入）"""
+    total_bytes = max(1, os.path.getsize(upload_path))
+    parser = StoryStreamParser(ndjson=ndjson)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    db = SessionLocal()
+    importer = StoryImporter(db, story_id=story_id, overwrite=overwrite)
+    try:
+        with open(upload_path, 'rb') as f:
+            while True:
+                chunk = f.read(IMPORT_FEED_SIZE)
+                if not chunk:
+                    break
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                for start in range(0, len(chunk), IMPORT_FEED_SIZE):
+                    importer.add_chapters(parser.feed(chunk[start:start + IMPORT_FEED_SIZE]), parser.metadata)
+                # 保留最後 1% 給引用檢查與提交
+                context.report(f.tell() * 99 // total_bytes, f"已處理 {importer.chapter_count} 個章節")
+
+        chapters = parser.feed(decompressor.flush()) if decompressor is not None else []
+        chapters.extend(parser.close())
+        importer.add_chapters(chapters, parser.metadata)
+        context.check_cancelled()
+        success = importer.finish(parser.metadata)
+    except BaseException:
+        importer.abort()
+        raise
+    finally:
+        db.close()
+        remove_file(upload_path)
+    return importer.report(success)
+
+@job_queue.register("export_story")
+def run_export_job(context: JobContext, story_id: str) -> Dict[str, Any]:
+    """分批讀取章節並寫入 JSON 檔案（格式與 GET /api/stories/{story_id}/export 相同）"""
+    db = SessionLocal()
+    output_path = job_output_path(f"export_{context.job_id}.json")
+    try:
+        story = _active_story(db, story_id)
+        total = db.execute(text(f"SELECT COUNT(*) FROM {story.table_name}")).scalar() or 0
+        header = {
+            "story_id": story_id,
+            "title": story.title,
+            "description": story.description,
+            "author": story.author,
+            "version": story.version,
+            "exported_at": datetime.now().isoformat()
+        }
+
+        exported = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "chapters": [')
+            result = db.execute(text(f"SELECT id, title, content, options FROM {story.table_name} ORDER BY id"))
+            while True:
+                rows = result.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    chapter = {"id": row.id, "title": row.title, "content": row.content, "options": _parse_options(row.options)}
+                    f.write((",\n" if exported else "\n") + json.dumps(chapter, ensure_ascii=False))
+                    exported += 1
+                context.report(exported * 100 // max(1, total), f"已匯出 {exported} / {total} 個章節")
+            f.write("\n]}\n")
+    except BaseException:
+        remove_file(output_path)
+        raise
+    finally:
+        db.close()
+    return {"story_id": story_id, "chapters": exported, "file": output_path}
+
+@job_queue.register("analyze_story")
+def run_analysis_job(context: JobContext, story_id: str, start_id: int = 1) -> Dict[str, Any]:
+    """分析故事的遊玩路徑數、結局可達性與循環（與 GET /api/stories/{story_id}/analytics 相同的摘要）"""
+    db = SessionLocal()
+    try:
+        story = _active_story(db, story_id)
+        result = db.execute(text(f"SELECT id, options FROM {story.table_name} ORDER BY id"))
+        chapters = [{"id": row.id, "options": _parse_options(row.options)} for row in result]
+    finally:
+        db.close()
+    context.report(30, f"已讀取 {len(chapters)} 個章節，分析中")
+
+    summary = StoryAnalysis(chapters, start_id).summary()
+    summary["total_paths"] = str(summary["total_paths"])
+    summary["paths_per_ending"] = {
+        str(ending_id): str(count) for ending_id, count in summary["paths_per_ending"].items()
+    }
+    return {"story_id": story_id, **summary}
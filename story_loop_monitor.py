@@ -0,0 +1,117 @@
+"""
+事件迴圈延遲監控模組
+以定時的 asyncio.sleep 量測事件迴圈的延遲，延遲分佈與百分位數輸出到 /metrics；
+另一個監看執行緒在事件迴圈被阻塞時讀取迴圈執行緒的堆疊，記錄是哪個處理函數阻塞了事件迴圈
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from story_metrics import registry
+
+logger = logging.getLogger("story_engine.loop")
+
+# 量測間隔與視為阻塞的延遲門檻（秒）
+LOOP_MONITOR_INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+LOOP_BLOCK_THRESHOLD = float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+LOOP_MONITOR_ENABLED = os.environ.get("LOOP_MONITOR", "true").lower() == "true"
+# 計算百分位數時保留的最近量測次數
+LAG_WINDOW = 1200
+# 專案目錄：找出堆疊中屬於本專案的函數
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOOP_LAG = registry.histogram(
+    "story_event_loop_lag_seconds", "事件迴圈延遲（排程的喚醒時間與實際喚醒時間的差）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_BLOCKED = registry.counter("story_event_loop_blocked_total", "事件迴圈被阻塞超過門檻的次數", ("handler",))
+
+def blocking_handler(frame) -> str:
+    """從堆疊最內層往外找第一個本專案的函數（通常就是阻塞事件迴圈的處理函數）"""
+    innermost = None
+    while frame is not None:
+        code = frame.f_code
+        if innermost is None:
+            innermost = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        filename = os.path.abspath(code.co_filename)
+        if filename.startswith(PROJECT_DIR) and filename != os.path.abspath(__file__):
+            return f"{os.path.basename(filename)}:{code.co_name}"
+        frame = frame.f_back
+    return innermost or "unknown"
+
+class LoopLagMonitor:
+    """事件迴圈延遲監控：start() 需要在事件迴圈中呼叫（例如 startup 事件）"""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, block_threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.lags: Deque[float] = deque(maxlen=LAG_WINDOW)
+        self.loop_thread_id: Optional[int] = None
+        self._heartbeat = time.perf_counter()
+        self._reported_heartbeat: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _measure(self):
+        """定時睡眠，延遲 = 實際喚醒時間 - 預定喚醒時間"""
+        while True:
+            self._heartbeat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - self._heartbeat - self.interval)
+            self.lags.append(lag)
+            LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        """監看執行緒：心跳停止超過門檻時，讀取事件迴圈執行緒的堆疊（每次阻塞只記錄一次）"""
+        while not self._stop.wait(self.block_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.perf_counter() - heartbeat - self.interval
+            if blocked_for < self.block_threshold or heartbeat == self._reported_heartbeat:
+                continue
+            self._reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            handler = blocking_handler(frame)
+            LOOP_BLOCKED.inc(handler)
+            logger.warning("事件迴圈被阻塞超過 %.0f 毫秒，執行中的函數: %s", blocked_for * 1000, handler)
+
+    def percentiles(self):
+        """最近量測的延遲百分位數（秒）"""
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        return {str(q): lags[min(len(lags) - 1, int(q * len(lags)))] for q in (0.5, 0.95, 0.99, 1)}
+
+monitor = LoopLagMonitor()
+
+@registry.collector
+def collect_loop_lag():
+    samples = [("story_event_loop_lag_quantile_seconds", {"quantile": quantile}, value)
+               for quantile, value in monitor.percentiles().items()]
+    return [("story_event_loop_lag_quantile_seconds", "gauge", f"最近 {LAG_WINDOW} 次量測的事件迴圈延遲百分位數", samples)]
@@ -0,0 +1,366 @@
+"""
+效能指標模組
+收集 API 請求數、延遲分佈、進行中的請求數、資料庫查詢次數與耗時、快取命中率等指標，
+並以 Prometheus 文字格式輸出（GET /metrics）；每次記錄只需要一次無競爭的鎖與幾次加法
+"""
+
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter as StatementCounter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 延遲分佈的預設區間（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Prometheus 文字格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 同一個請求中相同的 SQL 執行超過這個次數時視為可能的 N+1 查詢
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+# 測試模式：端點的查詢次數超過宣告的上限時讓請求失敗（AssertionError），否則只記錄警告
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "false").lower() == "true"
+
+logger = logging.getLogger("story_engine.metrics")
+
+Sample = Tuple[str, Dict[str, str], float]
+
+def _escape(value: str) -> str:
+    """標籤值的跳脫字元"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """將標籤轉為 {name="value",...}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    """數值輸出格式（整數不輸出小數點）"""
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    """指標基底類別：名稱、說明與標籤名稱"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}")
+        return labels
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """只增不減的計數器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class Gauge(Metric):
+    """可增可減的數值（例如進行中的請求數）"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class Histogram(Metric):
+    """分佈統計：各區間的累計次數、總和與次數"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 標籤 -> [各區間次數..., 超出最大區間的次數, 總和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, *labels: str) -> int:
+        counts = self._values.get(self._key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+class MetricsRegistry:
+    """指標登錄表：保存所有指標與輸出時才計算的收集函數"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        # 輸出時呼叫的收集函數，回傳 (名稱, 類型, 說明, 樣本列表)
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """註冊收集函數的裝飾器"""
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        """以 Prometheus 文字格式輸出所有指標"""
+        families = [(metric.name, metric.kind, metric.documentation, list(metric.samples())) for metric in self.metrics]
+        for collect in self.collectors:
+            families.extend(collect())
+
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter("story_http_requests_total", "HTTP 請求數", ("method", "route", "status"))
+HTTP_DURATION = registry.histogram("story_http_request_duration_seconds", "HTTP 請求處理時間（秒）", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge("story_http_requests_in_flight", "正在處理中的 HTTP 請求數", ("method",))
+DB_QUERIES = registry.counter("story_db_queries_total", "資料庫查詢次數", ("operation",))
+DB_DURATION = registry.histogram("story_db_query_duration_seconds", "資料庫查詢時間（秒）", ("operation",))
+REQUEST_DB_QUERIES = registry.histogram(
+    "story_http_request_db_queries", "每個請求的資料庫查詢次數", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+REQUEST_DB_DURATION = registry.histogram("story_http_request_db_seconds", "每個請求的資料庫查詢總時間（秒）", ("route",))
+QUERY_BUDGET_EXCEEDED = registry.counter("story_query_budget_exceeded_total", "查詢次數超過端點宣告上限的請求數", ("route",))
+N_PLUS_ONE_SUSPECTED = registry.counter("story_n_plus_one_suspected_total", "重複執行相同查詢（可能的 N+1）的請求數", ("route",))
+CONDITION_RENDER = registry.histogram(
+    "story_condition_render_seconds", "處理章節條件內容的時間（秒）",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+)
+
+# 快取名稱 -> 回傳 functools.lru_cache 統計的函數
+_caches: Dict[str, Callable] = {}
+
+def register_cache(name: str, cached_function: Callable):
+    """登錄 lru_cache 函數，輸出時讀取 cache_info() 計算命中率（不增加呼叫成本）"""
+    _caches[name] = cached_function
+
+@registry.collector
+def collect_cache_metrics():
+    hits, misses, ratios, sizes = [], [], [], []
+    for name, cached_function in _caches.items():
+        info = cached_function.cache_info()
+        labels = {"cache": name}
+        total = info.hits + info.misses
+        hits.append(("story_cache_hits_total", labels, info.hits))
+        misses.append(("story_cache_misses_total", labels, info.misses))
+        ratios.append(("story_cache_hit_ratio", labels, info.hits / total if total else 0.0))
+        sizes.append(("story_cache_entries", labels, info.currsize))
+    return [
+        ("story_cache_hits_total", "counter", "快取命中次數", hits),
+        ("story_cache_misses_total", "counter", "快取未命中次數", misses),
+        ("story_cache_hit_ratio", "gauge", "快取命中率", ratios),
+        ("story_cache_entries", "gauge", "快取項目數", sizes)
+    ]
+
+class RequestQueries:
+    """單一請求的資料庫查詢統計"""
+
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: StatementCounter = StatementCounter()
+
+    def most_repeated(self) -> Tuple[Optional[str], int]:
+        """重複次數最多的 SQL 與次數"""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+_request_queries: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar("request_queries", default=None)
+
+def current_queries() -> Optional[RequestQueries]:
+    """目前請求的查詢統計（不在請求中時為 None）"""
+    return _request_queries.get()
+
+def query_budget(max_queries: int):
+    """宣告端點每個請求最多執行的查詢次數（放在 @app.get / @app.post 之下）"""
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+def query_operation(statement: str) -> str:
+    """SQL 語句的類型（select、insert、update、delete 或 other）"""
+    operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return operation if operation in ("select", "insert", "update", "delete") else "other"
+
+def instrument_engine(engine: Engine):
+    """在資料庫引擎上掛上查詢計時的事件"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        operation = query_operation(statement)
+        DB_QUERIES.inc(operation)
+        DB_DURATION.observe(elapsed, operation)
+
+        # 請求在執行緒中查詢資料庫時，ContextVar 會隨著複製的 context 帶入
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += elapsed
+            queries.statements[statement] += 1
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # 查詢失敗時不會觸發 after_cursor_execute，要移除開始時間
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+class MetricsMiddleware:
+    """ASGI 中介層：記錄每個請求的路由、狀態碼、處理時間、進行中的請求數與資料庫查詢次數
+
+    路由標籤使用路由樣板（例如 /api/stories/{story_id}），沒有對應路由的請求記為 unmatched，
+    避免標籤數量隨網址無限增加；以 query_budget 宣告上限的端點在送出回應前檢查查詢次數
+    """
+
+    def __init__(self, app, strict: bool = QUERY_BUDGET_STRICT):
+        self.app = app
+        self.strict = strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = [500]
+        queries = RequestQueries()
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                self.check_queries(scope, queries)
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            HTTP_IN_FLIGHT.dec(method)
+            route_path = self.route_path(scope)
+            HTTP_REQUESTS.inc(method, route_path, str(status[0]))
+            HTTP_DURATION.observe(elapsed, method, route_path)
+            REQUEST_DB_QUERIES.observe(queries.count, route_path)
+            REQUEST_DB_DURATION.observe(queries.seconds, route_path)
+
+    @staticmethod
+    def route_path(scope) -> str:
+        route = scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def check_queries(self, scope, queries: RequestQueries):
+        """檢查查詢次數上限與重複查詢；測試模式下超過上限時拋出 AssertionError"""
+        route_path = self.route_path(scope)
+        statement, repeats = queries.most_repeated()
+        if repeats > N_PLUS_ONE_THRESHOLD:
+            N_PLUS_ONE_SUSPECTED.inc(route_path)
+            logger.warning("可能的 N+1 查詢: %s %s 重複執行 %d 次: %s", scope["method"], route_path, repeats, statement)
+
+        budget = getattr(getattr(scope.get("route"), "endpoint", None), "query_budget", None)
+        if budget is not None and queries.count > budget:
+            QUERY_BUDGET_EXCEEDED.inc(route_path)
+            message = f"{scope['method']} {route_path} 執行了 {queries.count} 次查詢，超過上限 {budget} 次"
+            if self.strict:
+                raise AssertionError(message)
+            logger.warning(message)
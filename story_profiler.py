@@ -0,0 +1,110 @@
+"""
+取樣分析器模組
+在限定的時間內以固定間隔讀取所有執行緒的呼叫堆疊（sys._current_frames），
+輸出 flamegraph.pl / speedscope 可直接讀取的 collapsed stacks 格式；
+不需要修改被分析的程式，負擔只取決於取樣間隔
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# 單次分析最長的時間（秒）與最短的取樣間隔（秒）
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+
+# 閒置中的執行緒停在這些函數（事件迴圈等待 I/O、執行緒池等待工作、慢日誌的 QueueListener 等待記錄），預設不列入結果；
+# uvloop 的事件迴圈以 C 實作，等待 I/O 時最內層的 Python 堆疊是 asyncio.run 的 runners.py:run
+# （有回呼在執行時，回呼的堆疊會在它之上，不會被排除）
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("runners.py", "run"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "dequeue")
+}
+
+class ProfilerBusy(Exception):
+    """已經有一個分析正在進行"""
+
+def frame_label(frame) -> str:
+    """堆疊中一層的名稱：模組檔名:函數名稱"""
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class StackSampler:
+    """以背景執行緒定時取樣所有執行緒的呼叫堆疊"""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = max(MIN_INTERVAL, interval)
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own_id)
+
+    def sample(self, exclude: Optional[int] = None):
+        """取樣一次所有執行緒的堆疊"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+
+            labels: List[str] = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            labels.reverse()
+            self.stacks[";".join(labels)] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        """collapsed stacks 格式：每行「根;...;葉 次數」"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 20) -> Dict[str, object]:
+        """取樣摘要：各函數出現在堆疊頂端（自身時間）的次數"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "samples": self.samples,
+            "seconds": round(self.elapsed, 3),
+            "top_functions": leaves.most_common(top)
+        }
+
+_profile_lock = threading.Lock()
+
+def acquire_profiler():
+    """取得分析權限；同一時間只允許一個分析（避免多個取樣執行緒互相干擾）"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("已經有一個分析正在進行")
+
+def release_profiler():
+    _profile_lock.release()
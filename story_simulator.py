@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+故事模擬工具
+以蒙地卡羅方法大量模擬遊玩過程，統計結局分布、章節造訪頻率與遊戲狀態分布
+故事只載入一次，模擬批次透過多行程平行執行，協助作者平衡故事
+"""
+
+import json
+import argparse
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import dice
+from conditions import evaluate_option_condition
+from story_validator import StoryValidator
+
+# 每次遊玩最多前進的步數，避免在循環中無限遊玩
+DEFAULT_MAX_STEPS = 500
+# 每個批次的模擬次數，批次是平行分派與亂數串流的單位
+BATCH_SIZE = 10_000
+
+class CompiledOption(NamedTuple):
+    """預先整理好的選項，模擬時不需再解析"""
+    next_id: Optional[int]
+    numeric_deltas: Tuple[Tuple[str, float], ...]   # 數值變數：累加
+    assignments: Tuple[Tuple[str, Any], ...]        # 其他變數：直接設定
+    condition: Optional[str]
+    check: Optional[Dict[str, Any]]
+
+def compile_option(option: Dict[str, Any]) -> CompiledOption:
+    """整理單一選項"""
+    numeric_deltas = []
+    assignments = []
+    for key, value in (option.get('game_state') or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            numeric_deltas.append((key, value))
+        else:
+            assignments.append((key, value))
+
+    return CompiledOption(
+        next_id=option.get('next_id'),
+        numeric_deltas=tuple(numeric_deltas),
+        assignments=tuple(assignments),
+        condition=option.get('condition') or None,
+        check=option.get('check') if isinstance(option.get('check'), dict) else None
+    )
+
+def compile_story(chapters: List[Dict[str, Any]]) -> Dict[int, Tuple[CompiledOption, ...]]:
+    """將章節列表整理為以章節 ID 為鍵的圖"""
+    return {
+        chapter['id']: tuple(compile_option(option) for option in chapter.get('options') or [])
+        for chapter in chapters
+        if 'id' in chapter
+    }
+
+def apply_game_state(state: Dict[str, Any], option: CompiledOption):
+    """套用選項的遊戲狀態變更：數值累加，其餘直接設定"""
+    for key, value in option.numeric_deltas:
+        current = state.get(key, 0)
+        state[key] = (current if isinstance(current, (int, float)) else 0) + value
+    for key, value in option.assignments:
+        state[key] = value
+
+# 選擇策略：回傳要選擇的選項在 available 中的位置
+def choose_random(available: List[CompiledOption], state: Dict[str, Any], visited: set, rng) -> int:
+    """隨機選擇"""
+    return rng.randrange(len(available))
+
+def choose_first(available: List[CompiledOption], state: Dict[str, Any], visited: set, rng) -> int:
+    """總是選擇第一個可用選項"""
+    return 0
+
+def choose_explore(available: List[CompiledOption], state: Dict[str, Any], visited: set, rng) -> int:
+    """優先選擇通往尚未造訪章節的選項"""
+    unvisited = [i for i, option in enumerate(available)
+                 if option.next_id is not None and option.next_id not in visited]
+    if unvisited:
+        return unvisited[rng.randrange(len(unvisited))]
+    return rng.randrange(len(available))
+
+POLICIES: Dict[str, Callable] = {
+    "random": choose_random,
+    "first": choose_first,
+    "explore": choose_explore
+}
+
+def simulate_run(graph: Dict[int, Tuple[CompiledOption, ...]], start_id: int,
+                 initial_state: Dict[str, Any], policy: Callable, rng,
+                 max_steps: int = DEFAULT_MAX_STEPS) -> Tuple[str, List[int], Dict[str, Any]]:
+    """模擬一次遊玩，回傳結果、造訪過的章節與最終遊戲狀態"""
+    state = dict(initial_state)
+    chapter_id = start_id
+    path = [chapter_id]
+    visited = {chapter_id}
+
+    for _ in range(max_steps):
+        options = graph.get(chapter_id)
+        if options is None:
+            return f"missing:{chapter_id}", path, state
+        if not options:
+            return f"ending:{chapter_id}", path, state
+
+        available = [option for option in options
+                     if option.condition is None or evaluate_option_condition(option.condition, state)]
+        if not available:
+            return f"dead_end:{chapter_id}", path, state
+
+        option = available[policy(available, state, visited, rng)]
+        apply_game_state(state, option)
+
+        if option.check is not None:
+            chapter_id = dice.resolve_check(option.check, state, rng).next_id
+        else:
+            chapter_id = option.next_id
+
+        path.append(chapter_id)
+        visited.add(chapter_id)
+
+    return f"max_steps:{chapter_id}", path, state
+
+def _empty_stats() -> Dict[str, Any]:
+    """建立空的統計資料"""
+    return {
+        "runs": 0,
+        "steps": 0,
+        "outcomes": Counter(),
+        "chapter_runs": Counter(),
+        "chapter_visits": Counter(),
+        "state_histograms": defaultdict(Counter)
+    }
+
+def _merge_stats(target: Dict[str, Any], source: Dict[str, Any]):
+    """合併批次統計資料"""
+    target["runs"] += source["runs"]
+    target["steps"] += source["steps"]
+    target["outcomes"].update(source["outcomes"])
+    target["chapter_runs"].update(source["chapter_runs"])
+    target["chapter_visits"].update(source["chapter_visits"])
+    for key, histogram in source["state_histograms"].items():
+        target["state_histograms"][key].update(histogram)
+
+def _histogram_key(value: Any) -> Any:
+    """將遊戲狀態值轉為直方圖的鍵（布林值與不可雜湊的值轉為 JSON 字串，避免 True 與 1 合併）"""
+    if isinstance(value, (bool, list, dict)) or value is None:
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+def run_batch(graph: Dict[int, Tuple[CompiledOption, ...]], batch_index: int, runs: int, seed: int,
+              policy_name: str, initial_state: Dict[str, Any], max_steps: int, start_id: int) -> Dict[str, Any]:
+    """執行一個批次的模擬，只回傳彙總後的統計資料"""
+    rng = random.Random(dice.derive_stream_key(seed, f"batch-{batch_index}"))
+    policy = POLICIES[policy_name]
+    stats = _empty_stats()
+
+    for _ in range(runs):
+        outcome, path, state = simulate_run(graph, start_id, initial_state, policy, rng, max_steps)
+        stats["runs"] += 1
+        stats["steps"] += len(path) - 1
+        stats["outcomes"][outcome] += 1
+        stats["chapter_runs"].update(set(path))
+        stats["chapter_visits"].update(path)
+        state_histograms = stats["state_histograms"]
+        for key, value in state.items():
+            state_histograms[key][_histogram_key(value)] += 1
+
+    return stats
+
+# 工作行程只在初始化時接收一次故事圖，之後的批次只傳遞參數
+_worker_graph: Optional[Dict[int, Tuple[CompiledOption, ...]]] = None
+
+def _init_worker(graph: Dict[int, Tuple[CompiledOption, ...]]):
+    """初始化工作行程"""
+    global _worker_graph
+    _worker_graph = graph
+
+def _run_worker_batch(args: Tuple) -> Dict[str, Any]:
+    """在工作行程中執行一個批次"""
+    return run_batch(_worker_graph, *args)
+
+def simulate(chapters: List[Dict[str, Any]], runs: int, policy: str = "random",
+             initial_state: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+             jobs: int = 1, max_steps: int = DEFAULT_MAX_STEPS, start_id: int = 1) -> Dict[str, Any]:
+    """執行蒙地卡羅模擬並產生報告"""
+    if policy not in POLICIES:
+        raise ValueError(f"未知的選擇策略: {policy}（可用: {', '.join(POLICIES)}）")
+
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 63)
+
+    graph = compile_story(chapters)
+    initial_state = dict(initial_state or {})
+
+    batches = []
+    for batch_index, offset in enumerate(range(0, runs, BATCH_SIZE)):
+        batch_runs = min(BATCH_SIZE, runs - offset)
+        batches.append((batch_index, batch_runs, seed, policy, initial_state, max_steps, start_id))
+
+    stats = _empty_stats()
+    started = time.perf_counter()
+
+    if jobs <= 1 or len(batches) == 1:
+        for batch in batches:
+            _merge_stats(stats, run_batch(graph, *batch))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(graph,)) as executor:
+            for batch_stats in executor.map(_run_worker_batch, batches):
+                _merge_stats(stats, batch_stats)
+
+    elapsed = time.perf_counter() - started
+    return build_report(stats, seed, policy, elapsed)
+
+def build_report(stats: Dict[str, Any], seed: int, policy: str, elapsed: float) -> Dict[str, Any]:
+    """將統計資料整理為可輸出成 JSON 的報告"""
+    runs = stats["runs"] or 1
+
+    return {
+        "runs": stats["runs"],
+        "seed": seed,
+        "policy": policy,
+        "elapsed_seconds": round(elapsed, 3),
+        "avg_steps": stats["steps"] / runs,
+        "outcomes": {
+            outcome: {"count": count, "ratio": count / runs}
+            for outcome, count in stats["outcomes"].most_common()
+        },
+        "chapter_visits": {
+            str(chapter_id): {
+                "runs": stats["chapter_runs"][chapter_id],
+                "ratio": stats["chapter_runs"][chapter_id] / runs,
+                "visits": stats["chapter_visits"][chapter_id]
+            }
+            for chapter_id in sorted(stats["chapter_runs"], key=lambda c: (str(type(c)), c))
+        },
+        "state_histograms": {
+            key: {str(value): count for value, count in histogram.most_common()}
+            for key, histogram in sorted(stats["state_histograms"].items())
+        }
+    }
+
+def print_report(report: Dict[str, Any], chapters: List[Dict[str, Any]], verbose: bool = False):
+    """顯示模擬報告摘要"""
+    titles = {chapter.get('id'): chapter.get('title', '') for chapter in chapters}
+
+    print("\n" + "=" * 70)
+    print("📊 模擬報告")
+    print("=" * 70)
+    print(f"🎲 模擬次數: {report['runs']}（策略: {report['policy']}，seed: {report['seed']}）")
+    print(f"⏱️ 耗時: {report['elapsed_seconds']} 秒")
+    print(f"👣 平均步數: {report['avg_steps']:.1f}")
+
+    print("\n🏁 結局分布:")
+    for outcome, data in report["outcomes"].items():
+        kind, _, chapter_id = outcome.partition(":")
+        title = titles.get(int(chapter_id), "") if chapter_id.lstrip("-").isdigit() else ""
+        print(f"   • {kind} 第 {chapter_id} 章 {title}: {data['count']} ({data['ratio']:.2%})")
+
+    unvisited = [chapter_id for chapter_id in titles if str(chapter_id) not in report["chapter_visits"]]
+    if unvisited:
+        print(f"\n⚠️ 從未造訪的章節: {unvisited}")
+
+    if verbose:
+        print("\n📚 章節造訪頻率:")
+        for chapter_id, data in report["chapter_visits"].items():
+            print(f"   • 第 {chapter_id} 章: {data['ratio']:.2%} 的遊玩（共 {data['visits']} 次）")
+
+        print("\n🎮 最終遊戲狀態分布:")
+        for key, histogram in report["state_histograms"].items():
+            top = ", ".join(f"{value}: {count}" for value, count in list(histogram.items())[:5])
+            print(f"   • {key}: {top}")
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="故事蒙地卡羅模擬工具")
+    parser.add_argument("file", help="要模擬的故事檔案路徑")
+    parser.add_argument("-n", "--runs", type=int, default=10000, help="模擬次數（預設 10000）")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random", help="選擇策略（預設 random）")
+    parser.add_argument("--jobs", type=int, default=1, help="平行工作行程數（預設 1）")
+    parser.add_argument("--seed", type=int, help="亂數種子，指定後結果可重現")
+    parser.add_argument("--initial-state", default="{}", help="初始遊戲狀態 JSON，例如 '{\"health\": 100}'")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS, help=f"每次遊玩最多步數（預設 {DEFAULT_MAX_STEPS}）")
+    parser.add_argument("--start", type=int, default=1, help="起始章節 ID（預設 1）")
+    parser.add_argument("--output", help="將完整報告輸出為 JSON 檔案")
+    parser.add_argument("-v", "--verbose", action="store_true", help="顯示章節造訪頻率與狀態分布")
+
+    args = parser.parse_args()
+
+    print("🔧 Story Simulator v1.0")
+    print("=" * 50)
+
+    try:
+        initial_state = json.loads(args.initial_state)
+    except json.JSONDecodeError as e:
+        print(f"❌ 初始遊戲狀態 JSON 格式錯誤: {e}")
+        sys.exit(1)
+
+    validator = StoryValidator()
+    if not validator.load_story(args.file):
+        print("\n❌ 載入失敗:")
+        for error in validator.errors:
+            print(f"   • {error}")
+        sys.exit(1)
+    print(f"✅ 成功載入故事: {validator.story_info.get('title', '未命名')}")
+    print(f"📚 章節數量: {len(validator.chapters)}")
+
+    report = simulate(
+        validator.chapters,
+        runs=args.runs,
+        policy=args.policy,
+        initial_state=initial_state,
+        seed=args.seed,
+        jobs=args.jobs,
+        max_steps=args.max_steps,
+        start_id=args.start
+    )
+
+    print_report(report, validator.chapters, args.verbose)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 完整報告已儲存至: {args.output}")
+
+if __name__ == "__main__":
+    main()
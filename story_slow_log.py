@@ -0,0 +1,224 @@
+"""
+慢查詢與慢請求日誌模組
+超過門檻的 SQL 查詢記錄語句、參數、耗時（可選擇附上 EXPLAIN 執行計畫），
+超過門檻的請求記錄路由、狀態碼、耗時與這個請求執行過的查詢，兩者以 request_id 關聯；
+日誌以 QueueHandler 放入佇列，格式化、EXPLAIN 與寫檔都在 QueueListener 的執行緒中進行，不增加請求延遲
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 慢查詢與慢請求的門檻（秒），設為 0 時記錄全部
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_MS", "100")) / 1000
+SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_MS", "500")) / 1000
+# 是否為慢的 SELECT 查詢附上 EXPLAIN 執行計畫（在日誌執行緒中以另一個連線執行）
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+SLOW_LOG_ENABLED = os.environ.get("SLOW_LOG", "true").lower() == "true"
+# 日誌檔案（JSON Lines），未設定時輸出到 stderr
+SLOW_LOG_FILE = os.environ.get("SLOW_LOG_FILE")
+
+# 每個請求保留的查詢數、參數與 SQL 在日誌中的最大長度
+MAX_REQUEST_QUERIES = 50
+MAX_PARAM_LENGTH = 200
+MAX_STATEMENT_LENGTH = 2000
+
+query_logger = logging.getLogger("story_engine.slow_query")
+request_logger = logging.getLogger("story_engine.slow_request")
+# 慢日誌只寫入 SlowLog 的佇列，未啟動前的記錄直接丟棄（不經過根 logger 在請求的執行緒中輸出）
+for _logger in (query_logger, request_logger):
+    _logger.addHandler(logging.NullHandler())
+    _logger.propagate = False
+
+class RequestLog:
+    """單一請求執行過的查詢（SQL 與耗時）"""
+
+    __slots__ = ("request_id", "queries", "dropped")
+
+    def __init__(self):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.queries: List[Tuple[str, float]] = []
+        self.dropped = 0
+
+    def add(self, statement: str, seconds: float):
+        if len(self.queries) < MAX_REQUEST_QUERIES:
+            self.queries.append((statement, seconds))
+        else:
+            self.dropped += 1
+
+_request_log: contextvars.ContextVar[Optional[RequestLog]] = contextvars.ContextVar("slow_request_log", default=None)
+
+def truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + f"...（共 {len(text)} 字元）"
+
+def format_parameters(parameters, executemany: bool):
+    """查詢參數轉為可寫入 JSON 的形式；executemany 只記錄筆數"""
+    if executemany:
+        return {"executemany": len(parameters)}
+    if isinstance(parameters, dict):
+        return {key: truncate(repr(value), MAX_PARAM_LENGTH) for key, value in parameters.items()}
+    return [truncate(repr(value), MAX_PARAM_LENGTH) for value in parameters or ()]
+
+def explain_statement(dialect_name: str, statement: str) -> Optional[str]:
+    """對應資料庫的 EXPLAIN 語句；只分析 SELECT（EXPLAIN 不會執行查詢）"""
+    if statement.lstrip()[:6].lower() != "select":
+        return None
+    if dialect_name == "sqlite":
+        return "EXPLAIN QUERY PLAN " + statement
+    if dialect_name in ("postgresql", "mysql"):
+        return "EXPLAIN " + statement
+    return None
+
+def instrument_engine(engine: Engine, threshold: float = SLOW_QUERY_THRESHOLD, explain: bool = SLOW_QUERY_EXPLAIN):
+    """在資料庫引擎上掛上慢查詢記錄的事件"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_log_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["slow_log_started"].pop()
+        if conn.get_execution_options().get("slow_log") is False:
+            return
+        request_log = _request_log.get()
+        if request_log is not None:
+            request_log.add(statement, elapsed)
+        if elapsed < threshold:
+            return
+
+        # 只放入原始資料，格式化與 EXPLAIN 留給日誌執行緒
+        entry = {
+            "request_id": request_log.request_id if request_log is not None else None,
+            "duration_ms": round(elapsed * 1000, 3),
+            "statement": statement,
+            "parameters": format_parameters(parameters, executemany)
+        }
+        if explain and not executemany:
+            entry["explain"] = (engine, explain_statement(engine.dialect.name, statement), parameters)
+        query_logger.warning("slow query", extra={"slow_log": entry})
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("slow_log_started"):
+            connection.info["slow_log_started"].pop()
+
+class SlowRequestMiddleware:
+    """ASGI 中介層：記錄每個請求執行過的查詢，處理時間超過門檻時寫入慢請求日誌"""
+
+    def __init__(self, app, threshold: float = SLOW_REQUEST_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_log = RequestLog()
+        token = _request_log.set(request_log)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_log.reset(token)
+            if elapsed >= self.threshold:
+                route = getattr(scope.get("route"), "path", None)
+                request_logger.warning("slow request", extra={"slow_log": {
+                    "request_id": request_log.request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status[0],
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "query_count": len(request_log.queries) + request_log.dropped,
+                    "query_ms": round(sum(seconds for _, seconds in request_log.queries) * 1000, 3),
+                    "queries": request_log.queries
+                }})
+
+class DeferredQueueHandler(QueueHandler):
+    """不在呼叫端格式化記錄的 QueueHandler（預設的 prepare 會在請求的執行緒中格式化訊息）"""
+
+    def prepare(self, record):
+        return record
+
+class SlowLogFormatter(logging.Formatter):
+    """以 JSON Lines 輸出慢查詢與慢請求；慢查詢的 EXPLAIN 在這裡（日誌執行緒中）執行"""
+
+    def format(self, record) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "type": record.name.rsplit(".", 1)[-1],
+            **getattr(record, "slow_log", {})
+        }
+        if "statement" in entry:
+            entry["statement"] = truncate(entry["statement"], MAX_STATEMENT_LENGTH)
+        if "queries" in entry:
+            entry["queries"] = [
+                {"statement": truncate(statement, MAX_STATEMENT_LENGTH), "duration_ms": round(seconds * 1000, 3)}
+                for statement, seconds in entry["queries"]
+            ]
+        if "explain" in entry:
+            entry["plan"] = self.explain(*entry.pop("explain"))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def explain(engine: Engine, statement: Optional[str], parameters) -> Optional[List[str]]:
+        if statement is None:
+            return None
+        try:
+            with engine.connect().execution_options(slow_log=False) as conn:
+                return [str(row[-1]) for row in conn.exec_driver_sql(statement, parameters)]
+        except Exception as e:
+            return [f"EXPLAIN 失敗: {e}"]
+
+class SlowLog:
+    """管理慢日誌的佇列與背景寫入執行緒（在伺服器啟動時 start，關閉時 stop 以寫完剩餘的記錄）"""
+
+    def __init__(self, path: Optional[str] = SLOW_LOG_FILE):
+        self.path = path
+        self._queue_handler: Optional[QueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        target = logging.FileHandler(self.path, encoding="utf-8") if self.path else logging.StreamHandler()
+        target.setFormatter(SlowLogFormatter())
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._queue_handler = DeferredQueueHandler(log_queue)
+        self._listener = QueueListener(log_queue, target)
+        for logger in (query_logger, request_logger):
+            logger.addHandler(self._queue_handler)
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is None:
+            return
+        for logger in (query_logger, request_logger):
+            logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        self._queue_handler = None
+
+slow_log = SlowLog()
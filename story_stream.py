@@ -0,0 +1,294 @@
+"""
+串流故事載入模組
+逐章解析故事 JSON / NDJSON，不需要一次把整個檔案與整棵 JSON 樹放進記憶體
+支援所有故事檔案格式（章節陣列、story_info、匯出格式、單章節）以及 NDJSON，
+可用於讀取檔案（StoryStream），也可用於逐塊接收的上傳資料（StoryStreamParser.feed）
+"""
+
+import codecs
+import gzip
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+# 每次從檔案讀取的字元數
+READ_CHUNK_SIZE = 1 << 20
+# 單一尚未解析完成的值最多可以佔用的緩衝區大小，避免格式錯誤時無限累積
+MAX_PENDING_CHARS = 64 << 20
+# 視為 NDJSON（每行一個 JSON 物件）的副檔名
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+class StoryStreamError(ValueError):
+    """故事串流格式錯誤"""
+
+class StoryStreamParser:
+    """推送式增量解析器：每次 feed 一塊資料，回傳這塊資料中已完整解析的章節
+
+    JSON 格式只會把 chapters 陣列以外的欄位（故事資訊）留在 metadata 中；
+    NDJSON 格式中有 id 的行是章節，其餘的行（例如 {"story_id": ..., "title": ...}）是故事資訊
+    """
+
+    def __init__(self, ndjson: bool = False):
+        self.ndjson = ndjson
+        self.metadata: Dict[str, Any] = {}
+        self.chapter_count = 0
+        self.has_chapters_key = False
+        self.root_is_list = False
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        # 逗號規則：值之後必須是逗號或結尾，逗號之後必須是值
+        self._expect_separator = False
+        self._after_comma = False
+        self._bytes_decoder = None
+        self._closed = False
+        self._line_number = 0
+
+    @property
+    def format(self) -> str:
+        """偵測到的檔案格式：ndjson、list、story_info、export、single_chapter 或 unknown"""
+        if self.ndjson:
+            return "ndjson"
+        if self.root_is_list:
+            return "list"
+        if self.has_chapters_key:
+            if "story_info" in self.metadata:
+                return "story_info"
+            if "story_id" in self.metadata:
+                return "export"
+            return "unknown"
+        if "id" in self.metadata and "title" in self.metadata:
+            return "single_chapter"
+        return "unknown"
+
+    def feed(self, data: Union[str, bytes]) -> List[Dict[str, Any]]:
+        """加入一塊資料，回傳其中已完整解析的章節"""
+        if self._closed:
+            raise StoryStreamError("解析器已關閉")
+        if isinstance(data, bytes):
+            if self._bytes_decoder is None:
+                self._bytes_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+            data = self._bytes_decoder.decode(data)
+
+        self._buffer = self._buffer[self._pos:] + data if self._pos else self._buffer + data
+        self._pos = 0
+        chapters = self._parse_lines(final=False) if self.ndjson else self._parse_json(final=False)
+
+        if len(self._buffer) - self._pos > MAX_PENDING_CHARS:
+            raise StoryStreamError(f"單一 JSON 值超過 {MAX_PENDING_CHARS} 個字元，或檔案格式錯誤")
+        return chapters
+
+    def close(self) -> List[Dict[str, Any]]:
+        """資料結束，回傳剩餘的章節；資料不完整時拋出 StoryStreamError"""
+        chapters = []
+        if self._bytes_decoder is not None:
+            chapters = self.feed(self._bytes_decoder.decode(b'', final=True))
+        self._closed = True
+
+        if self.ndjson:
+            chapters.extend(self._parse_lines(final=True))
+            return chapters
+
+        chapters.extend(self._parse_json(final=True))
+        if self._state == "start":
+            raise StoryStreamError("檔案是空的")
+        if self._state != "end":
+            raise StoryStreamError("JSON 資料不完整")
+
+        # 單章節格式：整個物件就是一個章節
+        if self.format == "single_chapter":
+            self.chapter_count += 1
+            chapters.append(self.metadata)
+        return chapters
+
+    def _emit(self, chapter: Any, chapters: List[Dict[str, Any]]):
+        """輸出一個章節"""
+        if not isinstance(chapter, dict):
+            raise StoryStreamError(f"第 {self.chapter_count + 1} 個章節必須是物件")
+        self.chapter_count += 1
+        chapters.append(chapter)
+
+    def _parse_lines(self, final: bool) -> List[Dict[str, Any]]:
+        """解析 NDJSON：每一行是一個章節或故事資訊"""
+        chapters = []
+        buffer = self._buffer
+        while True:
+            end = buffer.find('\n', self._pos)
+            if end == -1:
+                if not final:
+                    break
+                end = len(buffer)
+            line = buffer[self._pos:end].strip()
+            self._pos = min(end + 1, len(buffer))
+            self._line_number += 1
+            if line:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise StoryStreamError(f"NDJSON 第 {self._line_number} 行: {e}") from e
+                if isinstance(record, dict) and "id" not in record:
+                    self.metadata.update(record)
+                else:
+                    self._emit(record, chapters)
+            if end >= len(buffer):
+                break
+        return chapters
+
+    def _skip_whitespace(self) -> Optional[str]:
+        """略過空白，回傳下一個字元（資料不足時回傳 None）"""
+        self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+        return self._buffer[self._pos] if self._pos < len(self._buffer) else None
+
+    def _decode_value(self, final: bool, require_terminator: bool) -> Any:
+        """解析目前位置的 JSON 值，資料不足時拋出 _Incomplete"""
+        try:
+            value, end = _DECODER.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise StoryStreamError(str(e)) from e
+            raise _Incomplete() from e
+
+        # 數字等值在資料被切斷時也能解析成功（例如 "1." 或 "1e" 解析為 1），
+        # 必須看到後面的分隔字元（逗號或結尾括號）才算完整
+        if require_terminator and not final:
+            following = _WHITESPACE.match(self._buffer, end).end()
+            if following >= len(self._buffer) or self._buffer[following] not in ',}]':
+                raise _Incomplete()
+        self._pos = end
+        return value
+
+    def _parse_json(self, final: bool) -> List[Dict[str, Any]]:
+        """解析 JSON：找到 chapters 陣列後逐一解析章節"""
+        chapters = []
+        while True:
+            checkpoint = self._pos
+            try:
+                if not self._step(chapters, final):
+                    break
+            except _Incomplete:
+                self._pos = checkpoint
+                break
+        return chapters
+
+    def _step(self, chapters: List[Dict[str, Any]], final: bool) -> bool:
+        """前進一個語法單位，資料不足時回傳 False 或拋出 _Incomplete"""
+        char = self._skip_whitespace()
+        if char is None:
+            return False
+
+        if self._state == "start":
+            if char == '[':
+                self.root_is_list = True
+                self._state = "chapters"
+            elif char == '{':
+                self._state = "key"
+            else:
+                raise StoryStreamError("故事檔案必須是 JSON 物件或陣列")
+            self._pos += 1
+            return True
+
+        if self._state == "end":
+            raise StoryStreamError(f"位置 {self._pos} 有多餘的資料")
+
+        closing = ']' if self._state == "chapters" else '}'
+        if char == ',':
+            if not self._expect_separator:
+                raise StoryStreamError(f"位置 {self._pos} 有非預期的逗號")
+            self._expect_separator, self._after_comma = False, True
+            self._pos += 1
+            return True
+        if char == closing:
+            if self._after_comma:
+                raise StoryStreamError(f"位置 {self._pos} 的逗號後缺少值")
+            self._pos += 1
+            if self._state == "chapters" and not self.root_is_list:
+                # chapters 陣列結束，回到根物件繼續讀取其他欄位
+                self._state = "key"
+                self._expect_separator = True
+            else:
+                self._state = "end"
+            return True
+        if self._expect_separator:
+            raise StoryStreamError(f"位置 {self._pos} 缺少逗號")
+
+        if self._state == "chapters":
+            self._emit(self._decode_value(final, require_terminator=False), chapters)
+            self._expect_separator, self._after_comma = True, False
+            return True
+
+        if self._state == "key":
+            if char != '"':
+                raise StoryStreamError(f"位置 {self._pos} 應為欄位名稱")
+
+            key = self._decode_value(final, require_terminator=False)
+            if self._skip_whitespace() != ':':
+                if self._pos >= len(self._buffer) and not final:
+                    raise _Incomplete()
+                raise StoryStreamError(f"欄位 '{key}' 後應為冒號")
+            self._pos += 1
+            char = self._skip_whitespace()
+            if char is None:
+                raise _Incomplete()
+
+            if key == "chapters" and char == '[':
+                self.has_chapters_key = True
+                self._state = "chapters"
+                self._pos += 1
+                self._expect_separator = self._after_comma = False
+            else:
+                self.metadata[key] = self._decode_value(final, require_terminator=True)
+                self._expect_separator, self._after_comma = True, False
+            return True
+
+        raise StoryStreamError(f"位置 {self._pos} 有非預期的 '{char}'")
+
+class _Incomplete(Exception):
+    """資料不足，需要更多輸入"""
+
+def is_ndjson_path(file_path: str) -> bool:
+    """依副檔名判斷是否為 NDJSON（可加上 .gz）"""
+    name = file_path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.endswith(NDJSON_SUFFIXES)
+
+def open_story_file(file_path: str):
+    """以文字模式開啟故事檔案（.gz 會自動解壓縮）"""
+    if file_path.lower().endswith('.gz'):
+        return gzip.open(file_path, 'rt', encoding='utf-8')
+    return open(file_path, 'r', encoding='utf-8')
+
+class StoryStream:
+    """以串流方式逐章讀取故事檔案；可重複迭代，每次迭代都會重新讀取檔案"""
+
+    def __init__(self, file_path: str, chunk_size: int = READ_CHUNK_SIZE):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.ndjson = is_ndjson_path(file_path)
+        self.metadata: Dict[str, Any] = {}
+        self.format: Optional[str] = None
+        self.chapter_count: Optional[int] = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        parser = StoryStreamParser(ndjson=self.ndjson)
+        with open_story_file(self.file_path) as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield from parser.feed(chunk)
+        yield from parser.close()
+
+        # 完整讀取一次後才知道檔案格式、故事資訊與章節數量
+        self.metadata = parser.metadata
+        self.format = parser.format
+        self.chapter_count = parser.chapter_count
+
+    def __len__(self) -> int:
+        if self.chapter_count is None:
+            for _ in self:
+                pass
+        return self.chapter_count
@@ -0,0 +1,108 @@
+"""
+請求階段計時模組
+記錄單一請求中各階段（故事查詢、章節查詢、選項解析、條件內容處理、序列化）的耗時與資料庫查詢次數，
+以 Server-Timing 與 X-DB-Query-Count 標頭回傳並寫入 debug 日誌；未啟用時每個階段只多一次 ContextVar 讀取
+"""
+
+import contextvars
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+from story_metrics import current_queries
+
+logger = logging.getLogger("story_engine.timing")
+
+# 設為 true 時所有請求都回傳 Server-Timing；否則只有帶 X-Server-Timing: 1 標頭的請求
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING", "false").lower() == "true"
+REQUEST_HEADER = b"x-server-timing"
+
+class RequestTimings:
+    """單一請求的階段耗時"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        # 最後一個階段結束的時間，用來推算處理函數回傳後的序列化時間
+        self.last_phase_end: Optional[float] = None
+
+    def record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+        self.last_phase_end = time.perf_counter()
+
+    def header_value(self, response_started: float) -> str:
+        """Server-Timing 標頭內容（毫秒）"""
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases]
+        if self.last_phase_end is not None:
+            entries.append(f"serialize;dur={(response_started - self.last_phase_end) * 1000:.3f}")
+        entries.append(f"total;dur={(response_started - self.started) * 1000:.3f}")
+        return ", ".join(entries)
+
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+def current() -> Optional[RequestTimings]:
+    """目前請求的計時記錄（未啟用時為 None）"""
+    return _current.get()
+
+def record(name: str, seconds: float):
+    """記錄一個階段的耗時（未啟用計時時不做任何事）"""
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, seconds)
+
+class phase:
+    """以 with 區塊計時一個階段：with phase("chapter_query"): ..."""
+
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = _current.get()
+
+    def __enter__(self):
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.record(self.name, time.perf_counter() - self.started)
+
+class ServerTimingMiddleware:
+    """ASGI 中介層：為啟用計時的請求建立計時記錄，並在回應中加入 Server-Timing 標頭"""
+
+    def __init__(self, app, enabled: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.enabled or self._requested(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                value = timings.header_value(time.perf_counter())
+                headers = list(message.get("headers", []))
+                queries = current_queries()
+                if queries is not None:
+                    value += f', db;desc="{queries.count} queries";dur={queries.seconds * 1000:.3f}'
+                    headers.append((b"x-db-query-count", str(queries.count).encode("latin-1")))
+                headers.append((b"server-timing", value.encode("latin-1")))
+                message["headers"] = headers
+                logger.debug("%s %s %s %s", scope["method"], scope["path"], message["status"], value)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        """請求是否以 X-Server-Timing: 1 標頭要求計時"""
+        return any(name == REQUEST_HEADER and value in (b"1", b"true") for name, value in scope["headers"])
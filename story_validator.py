@@ -3,233 +3,410 @@
 故事檔案驗證工具
 檢查故事檔案的完整性、邏輯和格式
 支援新的多資料表架構和故事檔案格式
+
+程式庫用法（不輸出任何訊息，回傳結構化的問題清單）：
+    result = validate_story_file("story.json")
+    for issue in result.errors:
+        print(issue.code, issue.chapter_id, issue.message)
 """
 
 import json
 import argparse
+import hashlib
+import os
 import re
 import sys
-from typing import List, Dict, Set, Any, Optional
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Set, Any, NamedTuple, Optional, Tuple
 from datetime import datetime
 
+from conditions import CONDITION_PATTERN
+from dice import check_errors
+from story_analytics import StoryAnalysis, option_targets, print_analysis
+from story_dataflow import ConditionReachability
+from story_stream import StoryStream, StoryStreamError
+
+# 目錄模式會驗證的故事檔案副檔名（可加上 .gz）
+STORY_FILE_SUFFIXES = ('.json', '.ndjson', '.jsonl')
+# 目錄模式的預設快取檔名（放在被驗證的目錄中）
+DEFAULT_CACHE_FILE = '.story_validator_cache.json'
+# 驗證結果取決於這些模組，任何一個改變時快取就失效
+VALIDATOR_MODULES = ('story_validator.py', 'conditions.py', 'dice.py', 'story_analytics.py',
+                     'story_dataflow.py', 'story_stream.py', 'story_incremental.py')
+
+class ValidationIssue(NamedTuple):
+    """驗證問題：嚴重程度、問題代碼、訊息與位置"""
+    severity: str  # "error" 或 "warning"
+    code: str
+    message: str
+    chapter_id: Optional[Any] = None
+    chapter_index: Optional[int] = None  # 章節在檔案中的位置（從 0 開始）
+    option: Optional[int] = None  # 選項編號（從 1 開始）
+    field: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為 JSON 相容的字典（省略沒有的位置欄位）"""
+        return {key: value for key, value in self._asdict().items() if value is not None}
+
+class ValidationResult:
+    """驗證結果"""
+    
+    def __init__(self, story_info: Dict[str, Any], issues: List[ValidationIssue], statistics: Dict[str, Any],
+                 game_state_vars: Set[str], loaded: bool = True, notes: Optional[List[str]] = None):
+        self.story_info = story_info
+        self.issues = issues
+        self.statistics = statistics
+        self.game_state_vars = game_state_vars
+        self.loaded = loaded
+        self.notes = notes or []
+    
+    @property
+    def errors(self) -> List[ValidationIssue]:
+        return [issue for issue in self.issues if issue.severity == "error"]
+    
+    @property
+    def warnings(self) -> List[ValidationIssue]:
+        return [issue for issue in self.issues if issue.severity == "warning"]
+    
+    @property
+    def valid(self) -> bool:
+        return self.loaded and not any(issue.severity == "error" for issue in self.issues)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為 JSON 相容的字典"""
+        errors = self.errors
+        return {
+            "valid": self.valid,
+            "loaded": self.loaded,
+            "story_info": self.story_info,
+            "error_count": len(errors),
+            "warning_count": len(self.issues) - len(errors),
+            "issues": [issue.to_dict() for issue in self.issues],
+            "statistics": self.statistics,
+            "game_state_vars": sorted(self.game_state_vars)
+        }
+
+def collect_option_variables(chapter: Dict[str, Any], game_state_vars: Set[str]):
+    """收集章節選項中的遊戲狀態變數"""
+    if 'options' in chapter:
+        for option in chapter['options']:
+            if 'game_state' in option and isinstance(option['game_state'], dict):
+                game_state_vars.update(option['game_state'].keys())
+
+def compact_chapter(chapter: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留整體檢查需要的欄位（ID、不含文字的選項、條件標記），供串流驗證使用"""
+    compact = {}
+    if 'id' in chapter:
+        compact['id'] = chapter['id']
+    
+    options = chapter.get('options')
+    if isinstance(options, list):
+        compact['options'] = [
+            {key: value for key, value in option.items() if key != 'text'} if isinstance(option, dict) else option
+            for option in options
+        ]
+    elif 'options' in chapter:
+        compact['options'] = options
+    
+    content = chapter.get('content')
+    if isinstance(content, str) and '[[IF' in content:
+        compact['content'] = ''.join(
+            f"[[IF {condition}]][[ENDIF]]" for condition, _ in CONDITION_PATTERN.findall(content)
+        )
+    return compact
+
+def new_statistics(story_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """建立空的統計資訊"""
+    return {
+        "story_info": story_info or {},
+        "total_chapters": 0,
+        "total_options": 0,
+        "ending_chapters": 0,
+        "conditional_chapters": 0,
+        "avg_options_per_chapter": 0,
+        "longest_chapter": 0,
+        "shortest_chapter": float('inf')
+    }
+
+def add_chapter_statistics(stats: Dict[str, Any], chapter: Dict[str, Any]):
+    """將單一章節加入統計資訊"""
+    options = chapter.get('options', [])
+    content = chapter.get('content', '')
+    content_length = len(content)
+    
+    stats["total_chapters"] += 1
+    stats["total_options"] += len(options)
+    if not options:
+        stats["ending_chapters"] += 1
+    if '[[IF' in content:
+        stats["conditional_chapters"] += 1
+    stats["longest_chapter"] = max(stats["longest_chapter"], content_length)
+    stats["shortest_chapter"] = min(stats["shortest_chapter"], content_length)
+
+def finish_statistics(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """計算平均值等衍生統計"""
+    if stats["total_chapters"] > 0:
+        stats["avg_options_per_chapter"] = stats["total_options"] / stats["total_chapters"]
+    
+    if stats["shortest_chapter"] == float('inf'):
+        stats["shortest_chapter"] = 0
+    
+    return stats
+
 class StoryValidator:
     """故事驗證器"""
     
-    def __init__(self, verbose: bool = False):
-        self.errors = []
-        self.warnings = []
-        self.story_data = None
+    def __init__(self, verbose: bool = False, initial_state: Optional[Dict[str, Any]] = None):
+        self.issues: List[ValidationIssue] = []
+        self.notes: List[str] = []
         self.story_info = {}
         self.chapters = []
         self.chapter_ids = set()
         self.verbose = verbose
-        
+        self.initial_state = initial_state
+        self.statistics = finish_statistics(new_statistics())
+        self.game_state_vars: Set[str] = set()
+        self.loaded = False
+    
+    @property
+    def errors(self) -> List[str]:
+        """所有錯誤訊息"""
+        return [issue.message for issue in self.issues if issue.severity == "error"]
+    
+    @property
+    def warnings(self) -> List[str]:
+        """所有警告訊息"""
+        return [issue.message for issue in self.issues if issue.severity == "warning"]
+    
+    def error(self, code: str, message: str, **location):
+        """記錄錯誤"""
+        self.issues.append(ValidationIssue("error", code, message, **location))
+    
+    def warning(self, code: str, message: str, **location):
+        """記錄警告"""
+        self.issues.append(ValidationIssue("warning", code, message, **location))
+    
     def log(self, message: str):
-        """記錄詳細訊息"""
-        if self.verbose:
-            print(f"🔍 {message}")
+        """記錄詳細訊息（由 CLI 在 -v 時顯示）"""
+        self.notes.append(message)
+    
+    def result(self) -> ValidationResult:
+        """目前的驗證結果"""
+        return ValidationResult(self.story_info, list(self.issues), self.statistics, self.game_state_vars,
+                                loaded=self.loaded, notes=list(self.notes))
     
     def load_story(self, file_path: str) -> bool:
-        """載入故事檔案"""
+        """載入故事檔案（逐章串流解析，支援 JSON、NDJSON 與 .gz 壓縮檔）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.story_data = json.load(f)
+            stream = StoryStream(file_path)
+            self.chapters = list(stream)
             
-            # 檢查檔案格式
-            if isinstance(self.story_data, list):
-                # 舊格式：直接是章節陣列
-                self.log("偵測到舊格式故事檔案")
-                self.chapters = self.story_data
-                self.story_info = {
-                    "story_id": "unknown",
-                    "title": "未命名故事",
-                    "description": "",
-                    "author": "",
-                    "version": "1.0"
-                }
-                self.warnings.append("使用舊格式，建議升級為新格式")
-                
-            elif isinstance(self.story_data, dict):
-                # 檢查不同的格式
-                if "story_info" in self.story_data and "chapters" in self.story_data:
-                    # 格式1：包含 story_info 和 chapters
-                    self.log("偵測到新格式故事檔案（story_info 結構）")
-                    self.story_info = self.story_data["story_info"]
-                    self.chapters = self.story_data["chapters"]
-                elif "story_id" in self.story_data and "chapters" in self.story_data:
-                    # 格式2：seed_data.py 匯出格式（直接包含故事資訊）
-                    self.log("偵測到匯出格式故事檔案")
-                    self.story_info = {
-                        "story_id": self.story_data.get("story_id", "unknown"),
-                        "title": self.story_data.get("title", "未命名故事"),
-                        "description": self.story_data.get("description", ""),
-                        "author": self.story_data.get("author", ""),
-                        "version": self.story_data.get("version", "1.0")
-                    }
-                    self.chapters = self.story_data["chapters"]
-                elif "id" in self.story_data and "title" in self.story_data:
-                    # 格式3：單一章節格式
-                    self.log("偵測到單章節格式")
-                    self.chapters = [self.story_data]
-                    self.story_info = {
-                        "story_id": "unknown",
-                        "title": "未命名故事",
-                        "description": "",
-                        "author": "",
-                        "version": "1.0"
-                    }
-                else:
-                    self.errors.append("無法識別的故事檔案格式")
-                    self.errors.append("支援的格式：")
-                    self.errors.append("  1. 章節陣列格式：[{章節1}, {章節2}, ...]")
-                    self.errors.append("  2. story_info 格式：{\"story_info\": {...}, \"chapters\": [...]}")
-                    self.errors.append("  3. 匯出格式：{\"story_id\": \"...\", \"title\": \"...\", \"chapters\": [...]}")
-                    self.errors.append("  4. 單章節格式：{\"id\": 1, \"title\": \"...\", ...}")
-                    return False
-            else:
-                self.errors.append("故事檔案格式錯誤")
+            if not self.apply_story_format(stream.format, stream.metadata):
                 return False
             
             # 收集所有章節 ID
             self.chapter_ids = {chapter.get('id') for chapter in self.chapters if 'id' in chapter}
-            
-            print(f"✅ 成功載入故事: {self.story_info.get('title', '未命名')}")
-            print(f"📚 章節數量: {len(self.chapters)}")
+            self.loaded = True
             return True
             
         except FileNotFoundError:
-            self.errors.append(f"找不到檔案: {file_path}")
+            self.error("file_not_found", f"找不到檔案: {file_path}")
             return False
-        except json.JSONDecodeError as e:
-            self.errors.append(f"JSON 格式錯誤: {e}")
+        except StoryStreamError as e:
+            self.error("invalid_json", f"JSON 格式錯誤: {e}")
             return False
         except Exception as e:
-            self.errors.append(f"載入檔案時發生錯誤: {e}")
+            self.error("load_failed", f"載入檔案時發生錯誤: {e}")
             return False
     
+    def apply_story_format(self, story_format: str, metadata: Dict[str, Any]) -> bool:
+        """依偵測到的檔案格式設定故事資訊"""
+        default_info = {
+            "story_id": "unknown",
+            "title": "未命名故事",
+            "description": "",
+            "author": "",
+            "version": "1.0"
+        }
+        
+        if story_format == "list":
+            # 舊格式：直接是章節陣列
+            self.log("偵測到舊格式故事檔案")
+            self.story_info = default_info
+            self.warning("legacy_format", "使用舊格式，建議升級為新格式")
+        elif story_format == "story_info":
+            # 格式1：包含 story_info 和 chapters
+            self.log("偵測到新格式故事檔案（story_info 結構）")
+            self.story_info = metadata["story_info"]
+        elif story_format in ("export", "ndjson"):
+            # 格式2：seed_data.py 匯出格式（直接包含故事資訊）；NDJSON 的故事資訊行也是相同欄位
+            self.log("偵測到 NDJSON 故事檔案" if story_format == "ndjson" else "偵測到匯出格式故事檔案")
+            if "story_info" in metadata:
+                self.story_info = metadata["story_info"]
+            else:
+                self.story_info = {
+                    "story_id": metadata.get("story_id", "unknown"),
+                    "title": metadata.get("title", "未命名故事"),
+                    "description": metadata.get("description", ""),
+                    "author": metadata.get("author", ""),
+                    "version": metadata.get("version", "1.0")
+                }
+        elif story_format == "single_chapter":
+            # 格式3：單一章節格式
+            self.log("偵測到單章節格式")
+            self.story_info = default_info
+        else:
+            self.error("unknown_format", "\n     ".join([
+                "無法識別的故事檔案格式，支援的格式：",
+                "1. 章節陣列格式：[{章節1}, {章節2}, ...]",
+                "2. story_info 格式：{\"story_info\": {...}, \"chapters\": [...]}",
+                "3. 匯出格式：{\"story_id\": \"...\", \"title\": \"...\", \"chapters\": [...]}",
+                "4. 單章節格式：{\"id\": 1, \"title\": \"...\", ...}",
+                "5. NDJSON 格式（.ndjson / .jsonl）：每行一個章節，可加一行故事資訊"
+            ]))
+            return False
+        
+        return True
+    
     def validate_story_info(self):
         """驗證故事資訊"""
-        print("📖 檢查故事資訊...")
-        
         # 必要欄位
         required_fields = ['story_id', 'title']
         for field in required_fields:
             if field not in self.story_info:
-                self.errors.append(f"故事資訊缺少必要欄位: {field}")
+                self.error("story_info_missing_field", f"故事資訊缺少必要欄位: {field}", field=field)
             elif not self.story_info[field]:
-                self.errors.append(f"故事資訊欄位 '{field}' 不能為空")
+                self.error("story_info_empty_field", f"故事資訊欄位 '{field}' 不能為空", field=field)
         
         # 推薦欄位
         recommended_fields = ['description', 'author', 'version']
         for field in recommended_fields:
             if field not in self.story_info or not self.story_info[field]:
-                self.warnings.append(f"建議添加故事資訊欄位: {field}")
+                self.warning("story_info_recommended_field", f"建議添加故事資訊欄位: {field}", field=field)
         
         # 驗證 story_id 格式
         if 'story_id' in self.story_info:
             story_id = self.story_info['story_id']
             if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*$', story_id):
-                self.errors.append("story_id 必須以字母開頭，只能包含字母、數字和底線")
+                self.error("invalid_story_id", "story_id 必須以字母開頭，只能包含字母、數字和底線", field='story_id')
             elif len(story_id) > 50:
-                self.errors.append("story_id 長度不能超過 50 個字元")
+                self.error("story_id_too_long", "story_id 長度不能超過 50 個字元", field='story_id')
         
         # 檢查標題長度
         if 'title' in self.story_info:
             title = self.story_info['title']
             if len(title) > 255:
-                self.errors.append("故事標題長度不能超過 255 個字元")
+                self.error("story_title_too_long", "故事標題長度不能超過 255 個字元", field='title')
             elif len(title) < 3:
-                self.warnings.append("故事標題過短，建議至少 3 個字元")
+                self.warning("story_title_too_short", "故事標題過短，建議至少 3 個字元", field='title')
     
     def validate_structure(self):
         """驗證基本結構"""
-        print("🔍 檢查基本結構...")
-        
         if not self.chapters:
-            self.errors.append("故事沒有章節")
+            self.error("no_chapters", "故事沒有章節")
             return
         
-        required_fields = ['id', 'title', 'content', 'options']
+        # 預先統計每個 ID 出現的次數，避免每個章節都重新掃描整個列表
+        id_counts = Counter(
+            chapter['id'] for chapter in self.chapters
+            if isinstance(chapter.get('id'), int)
+        )
         
         for i, chapter in enumerate(self.chapters):
-            chapter_ref = f"章節 {i+1}"
-            
-            # 檢查必要欄位
-            for field in required_fields:
-                if field not in chapter:
-                    self.errors.append(f"{chapter_ref}: 缺少必要欄位 '{field}'")
-                elif field != 'options' and not chapter[field]:  # options 可以是空陣列
-                    self.warnings.append(f"{chapter_ref}: 欄位 '{field}' 是空的")
-            
-            # 檢查 ID 類型和唯一性
-            if 'id' in chapter:
-                chapter_id = chapter['id']
-                if not isinstance(chapter_id, int):
-                    self.errors.append(f"{chapter_ref}: ID 必須是整數")
-                elif chapter_id <= 0:
-                    self.errors.append(f"{chapter_ref}: ID 必須是正整數")
-                else:
-                    chapter_ref = f"章節 {chapter_id}"
-                    # 檢查重複 ID
-                    id_count = sum(1 for c in self.chapters if c.get('id') == chapter_id)
-                    if id_count > 1:
-                        self.errors.append(f"{chapter_ref}: 重複的章節 ID")
-            
-            # 檢查標題和內容
-            if 'title' in chapter:
-                if not isinstance(chapter['title'], str):
-                    self.errors.append(f"{chapter_ref}: 標題必須是字串")
-                elif len(chapter['title']) > 255:
-                    self.errors.append(f"{chapter_ref}: 標題長度不能超過 255 個字元")
-                elif len(chapter['title']) < 3:
-                    self.warnings.append(f"{chapter_ref}: 標題過短")
-            
-            if 'content' in chapter:
-                if not isinstance(chapter['content'], str):
-                    self.errors.append(f"{chapter_ref}: 內容必須是字串")
-                elif len(chapter['content']) < 10:
-                    self.warnings.append(f"{chapter_ref}: 內容過短")
-                elif len(chapter['content']) > 10000:
-                    self.warnings.append(f"{chapter_ref}: 內容過長，可能影響閱讀體驗")
-            
-            # 檢查選項格式
-            if 'options' in chapter:
-                options = chapter['options']
-                if not isinstance(options, list):
-                    self.errors.append(f"{chapter_ref}: 選項必須是陣列")
-                else:
-                    if len(options) > 10:
-                        self.warnings.append(f"{chapter_ref}: 選項過多 ({len(options)} 個)，可能影響遊戲體驗")
+            self.check_chapter_structure(i, chapter, isinstance(chapter.get('id'), int) and id_counts[chapter['id']] > 1)
+    
+    def check_chapter_structure(self, index: int, chapter: Dict[str, Any], duplicate_id: bool):
+        """驗證單一章節的基本結構"""
+        required_fields = ['id', 'title', 'content', 'options']
+        
+        chapter_ref = f"章節 {index+1}"
+        location = {"chapter_index": index}
+        chapter_id = chapter.get('id')
+        if isinstance(chapter_id, int) and chapter_id > 0:
+            location["chapter_id"] = chapter_id
+        
+        # 檢查必要欄位
+        for field in required_fields:
+            if field not in chapter:
+                self.error("missing_field", f"{chapter_ref}: 缺少必要欄位 '{field}'", field=field, **location)
+            elif field != 'options' and not chapter[field]:  # options 可以是空陣列
+                self.warning("empty_field", f"{chapter_ref}: 欄位 '{field}' 是空的", field=field, **location)
+        
+        # 檢查 ID 類型和唯一性
+        if 'id' in chapter:
+            if not isinstance(chapter_id, int):
+                self.error("invalid_id_type", f"{chapter_ref}: ID 必須是整數", field='id', **location)
+            elif chapter_id <= 0:
+                self.error("non_positive_id", f"{chapter_ref}: ID 必須是正整數", field='id', **location)
+            else:
+                chapter_ref = f"章節 {chapter_id}"
+                # 檢查重複 ID
+                if duplicate_id:
+                    self.error("duplicate_id", f"{chapter_ref}: 重複的章節 ID", field='id', **location)
+        
+        # 檢查標題和內容
+        if 'title' in chapter:
+            if not isinstance(chapter['title'], str):
+                self.error("title_type", f"{chapter_ref}: 標題必須是字串", field='title', **location)
+            elif len(chapter['title']) > 255:
+                self.error("title_too_long", f"{chapter_ref}: 標題長度不能超過 255 個字元", field='title', **location)
+            elif len(chapter['title']) < 3:
+                self.warning("title_too_short", f"{chapter_ref}: 標題過短", field='title', **location)
+        
+        if 'content' in chapter:
+            if not isinstance(chapter['content'], str):
+                self.error("content_type", f"{chapter_ref}: 內容必須是字串", field='content', **location)
+            elif len(chapter['content']) < 10:
+                self.warning("content_too_short", f"{chapter_ref}: 內容過短", field='content', **location)
+            elif len(chapter['content']) > 10000:
+                self.warning("content_too_long", f"{chapter_ref}: 內容過長，可能影響閱讀體驗", field='content', **location)
+        
+        # 檢查選項格式
+        if 'options' in chapter:
+            options = chapter['options']
+            if not isinstance(options, list):
+                self.error("options_type", f"{chapter_ref}: 選項必須是陣列", field='options', **location)
+            else:
+                if len(options) > 10:
+                    self.warning("too_many_options", f"{chapter_ref}: 選項過多 ({len(options)} 個)，可能影響遊戲體驗", field='options', **location)
+                
+                for j, option in enumerate(options):
+                    option_ref = f"{chapter_ref}, 選項 {j+1}"
+                    option_location = {**location, "option": j + 1}
                     
-                    for j, option in enumerate(options):
-                        option_ref = f"{chapter_ref}, 選項 {j+1}"
-                        
-                        if not isinstance(option, dict):
-                            self.errors.append(f"{option_ref}: 選項必須是物件")
-                            continue
-                        
-                        # 檢查必要欄位
-                        if 'text' not in option:
-                            self.errors.append(f"{option_ref}: 缺少 'text' 欄位")
-                        elif not isinstance(option['text'], str):
-                            self.errors.append(f"{option_ref}: 'text' 必須是字串")
-                        elif not option['text'].strip():
-                            self.errors.append(f"{option_ref}: 選項文字不能為空")
-                        
-                        if 'next_id' not in option:
-                            self.errors.append(f"{option_ref}: 缺少 'next_id' 欄位")
-                        elif not isinstance(option['next_id'], int):
-                            self.errors.append(f"{option_ref}: 'next_id' 必須是整數")
-                        
-                        # 檢查遊戲狀態變更
-                        if 'game_state' in option:
-                            if not isinstance(option['game_state'], dict):
-                                self.errors.append(f"{option_ref}: 'game_state' 必須是物件")
+                    if not isinstance(option, dict):
+                        self.error("option_type", f"{option_ref}: 選項必須是物件", **option_location)
+                        continue
+                    
+                    # 檢查必要欄位
+                    if 'text' not in option:
+                        self.error("option_missing_field", f"{option_ref}: 缺少 'text' 欄位", field='text', **option_location)
+                    elif not isinstance(option['text'], str):
+                        self.error("option_text_type", f"{option_ref}: 'text' 必須是字串", field='text', **option_location)
+                    elif not option['text'].strip():
+                        self.error("option_text_empty", f"{option_ref}: 選項文字不能為空", field='text', **option_location)
+                    
+                    # 宣告技能檢定的選項由 check 決定下一章節，可以省略 next_id
+                    if 'check' in option:
+                        for message in check_errors(option['check']):
+                            self.error("invalid_check", f"{option_ref}: {message}", field='check', **option_location)
+                    
+                    if 'next_id' not in option:
+                        if 'check' not in option:
+                            self.error("option_missing_field", f"{option_ref}: 缺少 'next_id' 欄位", field='next_id', **option_location)
+                    elif not isinstance(option['next_id'], int):
+                        self.error("next_id_type", f"{option_ref}: 'next_id' 必須是整數", field='next_id', **option_location)
+                    
+                    # 檢查遊戲狀態變更
+                    if 'game_state' in option:
+                        if not isinstance(option['game_state'], dict):
+                            self.error("game_state_type", f"{option_ref}: 'game_state' 必須是物件", field='game_state', **option_location)
     
     def validate_references(self):
         """驗證章節引用"""
-        print("🔗 檢查章節引用...")
-        
         referenced_ids = set()
         
         for chapter in self.chapters:
@@ -238,27 +415,25 @@ class StoryValidator:
             
             if 'options' in chapter:
                 for j, option in enumerate(chapter['options']):
-                    if 'next_id' in option:
-                        next_id = option['next_id']
+                    for next_id in option_targets(option):
                         referenced_ids.add(next_id)
                         
                         if next_id not in self.chapter_ids:
-                            self.errors.append(f"{chapter_ref}, 選項 {j+1}: 引用不存在的章節 {next_id}")
+                            self.error("missing_reference", f"{chapter_ref}, 選項 {j+1}: 引用不存在的章節 {next_id}",
+                                       chapter_id=chapter_id, option=j + 1, field='next_id')
         
         # 檢查孤立章節（除了起始章節）
         start_chapter_id = 1
         unreferenced_ids = self.chapter_ids - referenced_ids - {start_chapter_id}
         
         for chapter_id in unreferenced_ids:
-            self.warnings.append(f"章節 {chapter_id} 沒有被任何選項引用（可能是孤立章節）")
+            self.warning("orphan_chapter", f"章節 {chapter_id} 沒有被任何選項引用（可能是孤立章節）", chapter_id=chapter_id)
     
     def validate_logic_structure(self):
         """驗證邏輯結構"""
-        print("🧠 檢查邏輯結構...")
-        
         # 檢查起始章節
         if 1 not in self.chapter_ids:
-            self.errors.append("缺少起始章節（ID = 1）")
+            self.error("missing_start_chapter", "缺少起始章節（ID = 1）")
         
         # 識別結局章節
         ending_chapters = []
@@ -267,7 +442,7 @@ class StoryValidator:
                 ending_chapters.append(chapter.get('id'))
         
         if not ending_chapters:
-            self.warnings.append("沒有找到結局章節（沒有選項的章節）")
+            self.warning("no_ending", "沒有找到結局章節（沒有選項的章節）")
         else:
             self.log(f"找到 {len(ending_chapters)} 個結局章節: {ending_chapters}")
         
@@ -275,222 +450,471 @@ class StoryValidator:
         for chapter in self.chapters:
             chapter_id = chapter.get('id')
             if 'options' in chapter:
-                for option in chapter['options']:
+                for j, option in enumerate(chapter['options']):
                     if option.get('next_id') == chapter_id:
-                        self.warnings.append(f"章節 {chapter_id} 包含自我引用")
+                        self.warning("self_reference", f"章節 {chapter_id} 包含自我引用", chapter_id=chapter_id, option=j + 1)
     
     def validate_conditional_content(self):
         """驗證條件內容"""
-        print("⚙️ 檢查條件內容...")
-        
-        condition_pattern = r'\[\[IF\s+([^\]]+)\]\](.*?)\[\[ENDIF\]\]'
         game_state_vars = set()
         
         for chapter in self.chapters:
-            chapter_id = chapter.get('id')
-            chapter_ref = f"章節 {chapter_id}" if chapter_id else "未知章節"
-            content = chapter.get('content', '')
-            
-            # 檢查條件內容語法
-            matches = re.findall(condition_pattern, content, re.DOTALL)
-            
-            for condition, conditional_content in matches:
-                condition = condition.strip()
-                
-                # 檢查布林條件
-                if condition.startswith('NOT '):
-                    var_name = condition[4:].strip()
-                    if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', var_name):
-                        game_state_vars.add(var_name)
-                    else:
-                        self.errors.append(f"{chapter_ref}: 無效的變數名稱 '{var_name}'")
-                
-                # 檢查數值比較條件
-                elif any(op in condition for op in ['>=', '<=', '>', '<', '==', '!=']):
-                    for op in ['>=', '<=', '>', '<', '==', '!=']:
-                        if op in condition:
-                            parts = condition.split(op, 1)
-                            if len(parts) == 2:
-                                var_name = parts[0].strip()
-                                value = parts[1].strip()
-                                
-                                if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', var_name):
-                                    game_state_vars.add(var_name)
-                                else:
-                                    self.errors.append(f"{chapter_ref}: 無效的變數名稱 '{var_name}'")
-                                
-                                # 檢查數值格式
-                                try:
-                                    float(value)
-                                except ValueError:
-                                    if not value.startswith('"') or not value.endswith('"'):
-                                        self.warnings.append(f"{chapter_ref}: 條件值 '{value}' 可能需要引號")
-                            break
-                
-                # 簡單布林條件
-                elif re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', condition):
-                    game_state_vars.add(condition)
-                else:
-                    self.errors.append(f"{chapter_ref}: 無效的條件語法 '{condition}'")
-            
-            # 檢查未閉合的條件標記
-            if '[[IF' in content and content.count('[[IF') != content.count('[[ENDIF]]'):
-                self.errors.append(f"{chapter_ref}: 條件標記未正確閉合")
+            self.check_chapter_conditions(chapter, game_state_vars)
         
         # 收集選項中的遊戲狀態變數
         for chapter in self.chapters:
-            if 'options' in chapter:
-                for option in chapter['options']:
-                    if 'game_state' in option and isinstance(option['game_state'], dict):
-                        game_state_vars.update(option['game_state'].keys())
+            collect_option_variables(chapter, game_state_vars)
         
         self.log(f"找到 {len(game_state_vars)} 個遊戲狀態變數: {sorted(game_state_vars)}")
         
         return game_state_vars
     
-    def validate_content_quality(self):
-        """驗證內容品質"""
-        print("📝 檢查內容品質...")
+    def check_chapter_conditions(self, chapter: Dict[str, Any], game_state_vars: Set[str]):
+        """驗證單一章節的條件內容語法，並收集其中的遊戲狀態變數"""
+        chapter_id = chapter.get('id')
+        chapter_ref = f"章節 {chapter_id}" if chapter_id else "未知章節"
+        content = chapter.get('content', '')
         
-        total_options = 0
+        # 檢查條件內容語法
+        matches = CONDITION_PATTERN.findall(content)
         
-        for chapter in self.chapters:
-            chapter_id = chapter.get('id')
-            chapter_ref = f"章節 {chapter_id}" if chapter_id else "未知章節"
+        for condition, conditional_content in matches:
+            condition = condition.strip()
             
-            # 檢查標題品質
-            title = chapter.get('title', '')
-            if title:
-                if title.isupper():
-                    self.warnings.append(f"{chapter_ref}: 標題全部大寫，建議使用適當的大小寫")
-                if title.endswith('...') or title.endswith('。'):
-                    self.warnings.append(f"{chapter_ref}: 標題不應以省略號或句號結尾")
-            
-            # 檢查內容品質
-            content = chapter.get('content', '')
-            if content:
-                if len(content.split()) < 5:
-                    self.warnings.append(f"{chapter_ref}: 內容過短，可能影響故事體驗")
-                
-                # 檢查重複的標點符號
-                if '!!' in content or '??' in content or '..' in content:
-                    self.warnings.append(f"{chapter_ref}: 包含重複的標點符號")
-            
-            # 檢查選項品質
-            options = chapter.get('options', [])
-            total_options += len(options)
+            # 檢查布林條件
+            if condition.startswith('NOT '):
+                var_name = condition[4:].strip()
+                if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', var_name):
+                    game_state_vars.add(var_name)
+                else:
+                    self.error("invalid_variable_name", f"{chapter_ref}: 無效的變數名稱 '{var_name}'", chapter_id=chapter_id, field='content')
             
-            if len(options) == 1:
-                self.warnings.append(f"{chapter_ref}: 只有一個選項，可能不需要選擇")
+            # 檢查數值比較條件
+            elif any(op in condition for op in ['>=', '<=', '>', '<', '==', '!=']):
+                for op in ['>=', '<=', '>', '<', '==', '!=']:
+                    if op in condition:
+                        parts = condition.split(op, 1)
+                        if len(parts) == 2:
+                            var_name = parts[0].strip()
+                            value = parts[1].strip()
+                            
+                            if re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', var_name):
+                                game_state_vars.add(var_name)
+                            else:
+                                self.error("invalid_variable_name", f"{chapter_ref}: 無效的變數名稱 '{var_name}'", chapter_id=chapter_id, field='content')
+                            
+                            # 檢查數值格式
+                            try:
+                                float(value)
+                            except ValueError:
+                                if not value.startswith('"') or not value.endswith('"'):
+                                    self.warning("condition_value_unquoted", f"{chapter_ref}: 條件值 '{value}' 可能需要引號",
+                                                 chapter_id=chapter_id, field='content')
+                        break
             
-            for option in options:
-                option_text = option.get('text', '')
-                if option_text:
-                    if len(option_text) > 100:
-                        self.warnings.append(f"{chapter_ref}: 選項文字過長")
-                    if option_text.startswith('選擇') and len([o for o in options if o.get('text', '').startswith('選擇')]) > 1:
-                        self.warnings.append(f"{chapter_ref}: 多個選項都以'選擇'開頭，建議多樣化")
+            # 簡單布林條件
+            elif re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', condition):
+                game_state_vars.add(condition)
+            else:
+                self.error("invalid_condition_syntax", f"{chapter_ref}: 無效的條件語法 '{condition}'", chapter_id=chapter_id, field='content')
         
-        self.log(f"總選項數: {total_options}")
+        # 檢查未閉合的條件標記
+        if '[[IF' in content and content.count('[[IF') != content.count('[[ENDIF]]'):
+            self.error("unclosed_condition", f"{chapter_ref}: 條件標記未正確閉合", chapter_id=chapter_id, field='content')
     
-    def generate_statistics(self) -> Dict[str, Any]:
-        """生成統計資訊"""
-        stats = {
-            "story_info": self.story_info,
-            "total_chapters": len(self.chapters),
-            "total_options": sum(len(chapter.get('options', [])) for chapter in self.chapters),
-            "ending_chapters": len([c for c in self.chapters if not c.get('options')]),
-            "conditional_chapters": len([c for c in self.chapters if '[[IF' in c.get('content', '')]),
-            "avg_options_per_chapter": 0,
-            "longest_chapter": 0,
-            "shortest_chapter": float('inf')
-        }
+    def validate_condition_reachability(self):
+        """驗證條件可達性（找出永遠不會顯示的內容與永遠無法選擇的選項）"""
+        if 1 not in self.chapter_ids:
+            return
+        
+        analysis = ConditionReachability(self.chapters, initial_state=self.initial_state)
         
-        if stats["total_chapters"] > 0:
-            stats["avg_options_per_chapter"] = stats["total_options"] / stats["total_chapters"]
+        for chapter_id in analysis.unreachable_chapters():
+            self.warning("unreachable_chapter", f"章節 {chapter_id}: 受選項條件限制，沒有任何遊玩路徑能到達", chapter_id=chapter_id)
+        
+        for item in analysis.unreachable_options():
+            self.warning("unsatisfiable_option", f"章節 {item['chapter_id']}, 選項 {item['option']}: 條件 '{item['condition']}' 永遠不會成立，選項無法選擇",
+                         chapter_id=item['chapter_id'], option=item['option'], field='condition')
+        
+        for item in analysis.dead_content():
+            self.warning("dead_content", f"章節 {item['chapter_id']}: 條件內容 [[IF {item['condition']}]] 永遠不會顯示",
+                         chapter_id=item['chapter_id'], field='content')
+        
+        self.log(f"條件可達性分析: 到達 {sum(1 for state in analysis.states if state is not None)} 個章節，處理 {analysis.iterations} 次")
+    
+    def validate_content_quality(self):
+        """驗證內容品質"""
+        total_options = 0
         
         for chapter in self.chapters:
-            content_length = len(chapter.get('content', ''))
-            stats["longest_chapter"] = max(stats["longest_chapter"], content_length)
-            stats["shortest_chapter"] = min(stats["shortest_chapter"], content_length)
+            total_options += self.check_chapter_quality(chapter)
+        
+        self.log(f"總選項數: {total_options}")
+    
+    def check_chapter_quality(self, chapter: Dict[str, Any]) -> int:
+        """驗證單一章節的內容品質，回傳選項數量"""
+        chapter_id = chapter.get('id')
+        chapter_ref = f"章節 {chapter_id}" if chapter_id else "未知章節"
+        
+        # 檢查標題品質
+        title = chapter.get('title', '')
+        if title:
+            if title.isupper():
+                self.warning("title_all_caps", f"{chapter_ref}: 標題全部大寫，建議使用適當的大小寫", chapter_id=chapter_id, field='title')
+            if title.endswith('...') or title.endswith('。'):
+                self.warning("title_trailing_punctuation", f"{chapter_ref}: 標題不應以省略號或句號結尾", chapter_id=chapter_id, field='title')
+        
+        # 檢查內容品質
+        content = chapter.get('content', '')
+        if content:
+            if len(content.split()) < 5:
+                self.warning("content_few_words", f"{chapter_ref}: 內容過短，可能影響故事體驗", chapter_id=chapter_id, field='content')
+            
+            # 檢查重複的標點符號
+            if '!!' in content or '??' in content or '..' in content:
+                self.warning("repeated_punctuation", f"{chapter_ref}: 包含重複的標點符號", chapter_id=chapter_id, field='content')
+        
+        # 檢查選項品質
+        options = chapter.get('options', [])
         
-        if stats["shortest_chapter"] == float('inf'):
-            stats["shortest_chapter"] = 0
+        if len(options) == 1:
+            self.warning("single_option", f"{chapter_ref}: 只有一個選項，可能不需要選擇", chapter_id=chapter_id, field='options')
         
-        return stats
+        choice_prefixed = sum(1 for o in options if o.get('text', '').startswith('選擇'))
+        
+        for option in options:
+            option_text = option.get('text', '')
+            if option_text:
+                if len(option_text) > 100:
+                    self.warning("option_text_too_long", f"{chapter_ref}: 選項文字過長", chapter_id=chapter_id, field='options')
+                if option_text.startswith('選擇') and choice_prefixed > 1:
+                    self.warning("repetitive_option_prefix", f"{chapter_ref}: 多個選項都以'選擇'開頭，建議多樣化", chapter_id=chapter_id, field='options')
+        
+        return len(options)
+    
+    def generate_statistics(self) -> Dict[str, Any]:
+        """生成統計資訊"""
+        stats = new_statistics(self.story_info)
+        for chapter in self.chapters:
+            add_chapter_statistics(stats, chapter)
+        return finish_statistics(stats)
     
     def validate_all(self) -> bool:
-        """執行所有驗證"""
-        print("🚀 開始故事檔案驗證")
-        print("=" * 70)
-        
-        # 執行各項驗證
+        """執行所有驗證，回傳是否沒有錯誤"""
         self.validate_story_info()
         self.validate_structure()
         self.validate_references()
         self.validate_logic_structure()
-        game_state_vars = self.validate_conditional_content()
+        self.game_state_vars = self.validate_conditional_content()
+        self.validate_condition_reachability()
         self.validate_content_quality()
         
         # 生成統計資訊
-        stats = self.generate_statistics()
+        self.statistics = self.generate_statistics()
         
-        # 顯示結果
-        print("\n" + "=" * 70)
-        print("📊 驗證報告")
-        print("=" * 70)
+        return not self.errors
+    
+    def validate_stream(self, file_path: str) -> bool:
+        """以串流方式驗證故事檔案：逐章執行單章檢查，記憶體中只保留章節 ID、選項與條件標記等精簡索引"""
+        stream = StoryStream(file_path)
+        stats = new_statistics()
+        game_state_vars = set()
+        seen_ids = set()
+        total_options = 0
+        compact_chapters = []
         
-        print(f"📖 故事: {stats['story_info'].get('title', '未命名')}")
-        print(f"🆔 ID: {stats['story_info'].get('story_id', '未知')}")
-        print(f"👤 作者: {stats['story_info'].get('author', '未知')}")
-        print(f"📝 版本: {stats['story_info'].get('version', '未知')}")
-        print(f"📚 總章節數: {stats['total_chapters']}")
-        print(f"🏁 結局章節數: {stats['ending_chapters']}")
-        print(f"🔀 總選項數: {stats['total_options']}")
-        print(f"📊 平均選項數: {stats['avg_options_per_chapter']:.1f}")
-        print(f"⚙️ 包含條件內容的章節: {stats['conditional_chapters']}")
-        print(f"📏 最長章節: {stats['longest_chapter']} 字元")
-        print(f"📏 最短章節: {stats['shortest_chapter']} 字元")
-        
-        if game_state_vars:
-            print(f"🎮 遊戲狀態變數: {len(game_state_vars)} 個")
-            if self.verbose:
-                print(f"   變數列表: {', '.join(sorted(game_state_vars))}")
-        
-        print("\n" + "=" * 70)
-        
-        # 顯示錯誤和警告
-        if self.errors:
-            print(f"❌ 發現 {len(self.errors)} 個錯誤:")
-            for error in self.errors:
-                print(f"   • {error}")
-        else:
-            print("✅ 沒有發現錯誤")
+        try:
+            for index, chapter in enumerate(stream):
+                chapter_id = chapter.get('id')
+                # 串流時還不知道後面的章節，重複的 ID 在第二次出現時回報
+                duplicate_id = isinstance(chapter_id, int) and chapter_id in seen_ids
+                if isinstance(chapter_id, int):
+                    seen_ids.add(chapter_id)
+                
+                self.check_chapter_structure(index, chapter, duplicate_id)
+                self.check_chapter_conditions(chapter, game_state_vars)
+                collect_option_variables(chapter, game_state_vars)
+                total_options += self.check_chapter_quality(chapter)
+                add_chapter_statistics(stats, chapter)
+                compact_chapters.append(compact_chapter(chapter))
+        except FileNotFoundError:
+            self.error("file_not_found", f"找不到檔案: {file_path}")
+            return False
+        except StoryStreamError as e:
+            self.error("invalid_json", f"JSON 格式錯誤: {e}")
+            return False
         
-        if self.warnings:
-            print(f"\n⚠️ 發現 {len(self.warnings)} 個警告:")
-            for warning in self.warnings:
-                print(f"   • {warning}")
-        else:
-            print("✅ 沒有發現警告")
+        if not self.apply_story_format(stream.format, stream.metadata):
+            return False
         
-        print("\n" + "=" * 70)
+        self.loaded = True
+        self.chapters = compact_chapters
+        self.chapter_ids = {chapter.get('id') for chapter in self.chapters if 'id' in chapter}
         
-        if not self.errors and not self.warnings:
-            print("🎉 故事檔案完美無缺！")
-            return True
-        elif not self.errors:
-            print("✅ 故事檔案基本正確，但有一些建議改進的地方")
-            return True
+        if not self.chapters:
+            self.error("no_chapters", "故事沒有章節")
+        
+        # 需要整體圖形的檢查只使用精簡索引
+        self.validate_story_info()
+        self.validate_references()
+        self.validate_logic_structure()
+        self.validate_condition_reachability()
+        
+        self.log(f"找到 {len(game_state_vars)} 個遊戲狀態變數: {sorted(game_state_vars)}")
+        self.log(f"總選項數: {total_options}")
+        
+        stats["story_info"] = self.story_info
+        self.statistics = finish_statistics(stats)
+        self.game_state_vars = game_state_vars
+        return not self.errors
+
+def validate_story(chapters: List[Dict[str, Any]], story_info: Optional[Dict[str, Any]] = None,
+                   initial_state: Optional[Dict[str, Any]] = None) -> ValidationResult:
+    """驗證已載入的故事（程式庫入口，不輸出任何訊息）"""
+    validator = StoryValidator(initial_state=initial_state)
+    validator.story_info = story_info or {}
+    validator.chapters = chapters
+    validator.chapter_ids = {chapter.get('id') for chapter in chapters if 'id' in chapter}
+    validator.loaded = True
+    validator.validate_all()
+    return validator.result()
+
+def validate_story_file(file_path: str, stream: bool = False,
+                        initial_state: Optional[Dict[str, Any]] = None) -> ValidationResult:
+    """驗證故事檔案（程式庫入口，不輸出任何訊息）；stream=True 時逐章驗證並只保留精簡索引"""
+    validator = StoryValidator(initial_state=initial_state)
+    if stream:
+        validator.validate_stream(file_path)
+    elif validator.load_story(file_path):
+        validator.validate_all()
+    return validator.result()
+
+def print_issues(title: str, issues: List[ValidationIssue]):
+    """顯示問題清單"""
+    print(title)
+    for issue in issues:
+        print(f"   • {issue.message}")
+
+def render_report(result: ValidationResult, verbose: bool = False) -> bool:
+    """顯示驗證報告，回傳是否通過"""
+    stats = result.statistics
+    errors = result.errors
+    warnings = result.warnings
+    
+    if verbose:
+        for note in result.notes:
+            print(f"🔍 {note}")
+    
+    # 顯示結果
+    print("\n" + "=" * 70)
+    print("📊 驗證報告")
+    print("=" * 70)
+    
+    print(f"📖 故事: {stats['story_info'].get('title', '未命名')}")
+    print(f"🆔 ID: {stats['story_info'].get('story_id', '未知')}")
+    print(f"👤 作者: {stats['story_info'].get('author', '未知')}")
+    print(f"📝 版本: {stats['story_info'].get('version', '未知')}")
+    print(f"📚 總章節數: {stats['total_chapters']}")
+    print(f"🏁 結局章節數: {stats['ending_chapters']}")
+    print(f"🔀 總選項數: {stats['total_options']}")
+    print(f"📊 平均選項數: {stats['avg_options_per_chapter']:.1f}")
+    print(f"⚙️ 包含條件內容的章節: {stats['conditional_chapters']}")
+    print(f"📏 最長章節: {stats['longest_chapter']} 字元")
+    print(f"📏 最短章節: {stats['shortest_chapter']} 字元")
+    
+    if result.game_state_vars:
+        print(f"🎮 遊戲狀態變數: {len(result.game_state_vars)} 個")
+        if verbose:
+            print(f"   變數列表: {', '.join(sorted(result.game_state_vars))}")
+    
+    print("\n" + "=" * 70)
+    
+    # 顯示錯誤和警告
+    if errors:
+        print_issues(f"❌ 發現 {len(errors)} 個錯誤:", errors)
+    else:
+        print("✅ 沒有發現錯誤")
+    
+    if warnings:
+        print_issues(f"\n⚠️ 發現 {len(warnings)} 個警告:", warnings)
+    else:
+        print("✅ 沒有發現警告")
+    
+    print("\n" + "=" * 70)
+    
+    if not errors and not warnings:
+        print("🎉 故事檔案完美無缺！")
+        return True
+    elif not errors:
+        print("✅ 故事檔案基本正確，但有一些建議改進的地方")
+        return True
+    else:
+        print("❌ 故事檔案存在問題，需要修正")
+        return False
+
+def find_story_files(directory: str) -> List[str]:
+    """遞迴找出目錄中的故事檔案（略過隱藏檔案與目錄）"""
+    files = []
+    for path in sorted(Path(directory).rglob('*')):
+        relative = path.relative_to(directory)
+        if any(part.startswith('.') for part in relative.parts) or not path.is_file():
+            continue
+        name = path.name.lower()
+        if name.endswith('.gz'):
+            name = name[:-3]
+        if name.endswith(STORY_FILE_SUFFIXES):
+            files.append(str(path))
+    return files
+
+def file_digest(file_path: str) -> str:
+    """計算檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def validator_fingerprint(initial_state: Optional[Dict[str, Any]] = None, stream: bool = False) -> str:
+    """驗證程式碼與選項的指紋，用來判斷快取是否仍然有效"""
+    digest = hashlib.sha256()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in VALIDATOR_MODULES:
+        module_path = os.path.join(base_dir, module)
+        if os.path.exists(module_path):
+            digest.update(file_digest(module_path).encode())
+    digest.update(json.dumps({"initial_state": initial_state, "stream": stream}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def validate_file(file_path: str, initial_state: Optional[Dict[str, Any]] = None,
+                  stream: bool = False) -> Dict[str, Any]:
+    """驗證單一檔案並回傳 JSON 相容的結果摘要"""
+    started = time.perf_counter()
+    try:
+        result = validate_story_file(file_path, stream=stream, initial_state=initial_state)
+    except Exception as e:
+        # 單一檔案的非預期錯誤不應中斷整批驗證
+        crashed = ValidationIssue("error", "validation_crashed", f"驗證時發生錯誤: {e}")
+        result = ValidationResult({}, [crashed], finish_statistics(new_statistics()), set(), loaded=False)
+    
+    errors = result.errors
+    return {
+        "file": file_path,
+        "valid": result.valid,
+        "story_id": result.story_info.get('story_id'),
+        "chapters": result.statistics["total_chapters"],
+        "error_count": len(errors),
+        "warning_count": len(result.issues) - len(errors),
+        "issues": [issue.to_dict() for issue in result.issues],
+        "seconds": round(time.perf_counter() - started, 4)
+    }
+
+def _validate_file_worker(args: Tuple[str, Optional[Dict[str, Any]], bool]) -> Dict[str, Any]:
+    """工作行程入口"""
+    return validate_file(*args)
+
+def load_validation_cache(cache_path: str, fingerprint: str) -> Dict[str, Any]:
+    """載入快取；指紋不同或檔案損壞時回傳空快取"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("fingerprint") != fingerprint:
+        return {}
+    return cache.get("files", {})
+
+def save_validation_cache(cache_path: str, fingerprint: str, entries: Dict[str, Any]):
+    """寫入快取（先寫暫存檔再取代，避免中斷時留下損壞的快取）"""
+    temp_path = f"{cache_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"fingerprint": fingerprint, "files": entries}, f, ensure_ascii=False)
+    os.replace(temp_path, cache_path)
+
+def validate_directory(directory: str, jobs: int = 1, cache_path: Optional[str] = None,
+                       initial_state: Optional[Dict[str, Any]] = None, stream: bool = False) -> Dict[str, Any]:
+    """以行程池平行驗證目錄中的所有故事檔案，內容未變更的檔案直接使用快取結果"""
+    started = time.perf_counter()
+    files = find_story_files(directory)
+    fingerprint = validator_fingerprint(initial_state, stream)
+    cached_entries = load_validation_cache(cache_path, fingerprint) if cache_path else {}
+    
+    results = {}
+    digests = {}
+    pending = []
+    for file_path in files:
+        relative = os.path.relpath(file_path, directory)
+        digests[relative] = file_digest(file_path)
+        entry = cached_entries.get(relative)
+        if entry and entry.get("hash") == digests[relative]:
+            results[relative] = {**entry["result"], "file": file_path, "cached": True}
         else:
-            print("❌ 故事檔案存在問題，需要修正")
-            return False
+            pending.append(file_path)
+    
+    worker_args = [(file_path, initial_state, stream) for file_path in pending]
+    if jobs <= 1 or len(pending) <= 1:
+        fresh_results = [_validate_file_worker(args) for args in worker_args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            fresh_results = list(executor.map(_validate_file_worker, worker_args))
+    
+    for result in fresh_results:
+        results[os.path.relpath(result["file"], directory)] = {**result, "cached": False}
+    
+    if cache_path:
+        # 只保留目前仍存在的檔案
+        entries = {
+            relative: {"hash": digests[relative], "result": {k: v for k, v in result.items() if k != "cached"}}
+            for relative, result in results.items()
+        }
+        save_validation_cache(cache_path, fingerprint, entries)
+    
+    file_results = [results[relative] for relative in sorted(results)]
+    return {
+        "directory": directory,
+        "generated_at": datetime.now().isoformat(),
+        "jobs": jobs,
+        "total_files": len(file_results),
+        "valid_files": sum(1 for result in file_results if result["valid"]),
+        "invalid_files": sum(1 for result in file_results if not result["valid"]),
+        "cached_files": sum(1 for result in file_results if result["cached"]),
+        "total_errors": sum(result["error_count"] for result in file_results),
+        "total_warnings": sum(result["warning_count"] for result in file_results),
+        "seconds": round(time.perf_counter() - started, 4),
+        "files": file_results
+    }
+
+def print_directory_report(report: Dict[str, Any], verbose: bool = False):
+    """顯示目錄驗證結果"""
+    for result in report["files"]:
+        status = "✅" if result["valid"] else "❌"
+        cached = "（快取）" if result["cached"] else ""
+        print(f"{status} {result['file']}{cached}: {result['error_count']} 個錯誤，{result['warning_count']} 個警告")
+        for issue in result["issues"]:
+            if issue["severity"] == "error" and (not result["valid"] or verbose):
+                print(f"   • {issue['message']}")
+            elif issue["severity"] == "warning" and verbose:
+                print(f"   ⚠️ {issue['message']}")
+    
+    print("\n" + "=" * 70)
+    print(f"📁 檔案數: {report['total_files']}（通過 {report['valid_files']}，失敗 {report['invalid_files']}，"
+          f"快取 {report['cached_files']}）")
+    print(f"❌ 錯誤: {report['total_errors']}　⚠️ 警告: {report['total_warnings']}")
+    print(f"⏱️ 耗時: {report['seconds']:.2f} 秒（{report['jobs']} 個行程）")
 
 def main():
     """主函數"""
     parser = argparse.ArgumentParser(description="故事檔案驗證工具")
-    parser.add_argument("file", help="要驗證的故事檔案路徑")
+    parser.add_argument("file", help="要驗證的故事檔案路徑，或包含多個故事檔案的目錄")
     parser.add_argument("-v", "--verbose", action="store_true", help="顯示詳細資訊")
+    parser.add_argument("--analyze", action="store_true", help="分析遊玩路徑數與各章節可到達的結局")
+    parser.add_argument("--stream", action="store_true", help="串流模式：逐章驗證，只在記憶體中保留精簡索引（適合超大型故事檔案）")
+    parser.add_argument("--initial-state", help="條件可達性分析使用的初始遊戲狀態（JSON 字串）；未指定時數值屬性視為任意值，其他變數視為未設定")
+    parser.add_argument("--start", type=int, default=1, help="路徑分析的起始章節 ID（預設: 1）")
+    parser.add_argument("--incremental", action="store_true", help="增量模式：快取每個章節的驗證結果，只重新驗證上次執行後變更的章節")
+    parser.add_argument("--jobs", type=int, default=1, help="目錄模式的平行工作行程數（預設 1）")
+    parser.add_argument("--report", help="目錄模式：將彙整結果輸出為 JSON 檔案")
+    parser.add_argument("--cache", help=f"目錄模式的快取檔案路徑（預設為目錄中的 {DEFAULT_CACHE_FILE}）")
+    parser.add_argument("--no-cache", action="store_true", help="目錄模式：不使用快取，重新驗證所有檔案")
     
     args = parser.parse_args()
     
@@ -498,17 +922,67 @@ def main():
     print("支援新的多資料表架構和故事檔案格式")
     print("=" * 50)
     
-    validator = StoryValidator(verbose=args.verbose)
+    initial_state = None
+    if args.initial_state:
+        try:
+            initial_state = json.loads(args.initial_state)
+        except json.JSONDecodeError as e:
+            print(f"❌ 初始遊戲狀態 JSON 格式錯誤: {e}")
+            sys.exit(1)
+    
+    if os.path.isdir(args.file):
+        # 目錄模式：平行驗證所有故事檔案並彙整結果
+        cache_path = None if args.no_cache else (args.cache or os.path.join(args.file, DEFAULT_CACHE_FILE))
+        report = validate_directory(args.file, jobs=args.jobs, cache_path=cache_path,
+                                    initial_state=initial_state, stream=args.stream)
+        print_directory_report(report, verbose=args.verbose)
+        
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"📄 完整報告已儲存至: {args.report}")
+        sys.exit(0 if report["invalid_files"] == 0 else 1)
+    
+    validator = StoryValidator(verbose=args.verbose, initial_state=initial_state)
+    result = None
+    
+    if args.stream:
+        # 串流模式在單次讀取中完成載入與驗證
+        print("🚀 開始故事檔案驗證（串流模式）")
+        print("=" * 70)
+        validator.validate_stream(args.file)
+    elif validator.load_story(args.file):
+        print(f"✅ 成功載入故事: {validator.story_info.get('title', '未命名')}")
+        print(f"📚 章節數量: {len(validator.chapters)}")
+        print("🚀 開始故事檔案驗證")
+        print("=" * 70)
+        
+        if args.incremental:
+            # story_incremental 建立在本模組之上，只在需要時載入以避免循環匯入
+            from story_incremental import IncrementalValidator, incremental_cache_path
+            
+            cache_path = incremental_cache_path(args.file)
+            incremental = IncrementalValidator(initial_state=initial_state)
+            incremental.load(cache_path)
+            result = incremental.validate(validator.chapters, validator.story_info)
+            incremental.save(cache_path)
+            print(f"♻️ 重新檢查 {incremental.rechecked_chapters} / {len(validator.chapters)} 個章節"
+                  f"{'，沿用條件可達性結果' if incremental.reachability_reused else ''}")
+        else:
+            validator.validate_all()
+    
+    if result is None:
+        result = validator.result()
     
-    # 載入故事檔案
-    if not validator.load_story(args.file):
-        print("\n❌ 載入失敗:")
-        for error in validator.errors:
-            print(f"   • {error}")
+    if not result.loaded:
+        print_issues("\n❌ 載入失敗:", result.errors)
         sys.exit(1)
     
-    # 執行驗證
-    success = validator.validate_all()
+    # 顯示結果
+    success = render_report(result, verbose=args.verbose)
+    
+    if args.analyze:
+        print_analysis(StoryAnalysis(validator.chapters, args.start), verbose=args.verbose)
     
     if success:
         print("\n🎯 建議下一步:")
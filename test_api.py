@@ -6,6 +6,7 @@ Story Engine API 測試工具
 """
 
 import requests
+import gzip
 import json
 import time
 import sys
@@ -214,6 +215,232 @@ class StoryEngineAPITester:
             self.log_test_result("取得故事章節", False, f"錯誤: {e}")
             return False
     
+    def test_story_analytics(self) -> bool:
+        """測試故事路徑分析"""
+        try:
+            stories_response = self.session.get(f"{self.base_url}/api/stories")
+            if stories_response.status_code != 200:
+                self.log_test_result("故事路徑分析", False, "無法獲取故事列表")
+                return False
+            
+            stories = stories_response.json().get("stories", [])
+            if not stories:
+                self.log_test_result("故事路徑分析", True, "沒有可用的故事")
+                return True
+            
+            test_story_id = stories[0]["story_id"]
+            response = self.session.get(
+                f"{self.base_url}/api/stories/{test_story_id}/analytics",
+                params={"chapter_id": 1}
+            )
+            
+            if response.status_code != 200:
+                self.log_test_result("故事路徑分析", False, f"HTTP {response.status_code}")
+                return False
+            
+            data = response.json()
+            chapter = data.get("chapter") or {}
+            # 起始章節可到達的結局應與整體結果一致
+            if chapter.get("reachable_endings") != data["reachable_endings"]:
+                self.log_test_result("故事路徑分析", False, "起始章節的結局與整體結果不一致")
+                return False
+            if chapter.get("paths_to_ending") != data["total_paths"]:
+                self.log_test_result("故事路徑分析", False, "起始章節的路徑數與整體結果不一致")
+                return False
+            
+            missing_response = self.session.get(f"{self.base_url}/api/stories/nonexistent_story/analytics")
+            if missing_response.status_code != 404:
+                self.log_test_result("故事路徑分析", False, f"不存在的故事應回傳 404，實際 {missing_response.status_code}")
+                return False
+            
+            details = f"{data['total_paths']} 條路徑，{len(data['reachable_endings'])}/{data['total_endings']} 個結局可到達"
+            self.log_test_result("故事路徑分析", True, details)
+            return True
+            
+        except Exception as e:
+            self.log_test_result("故事路徑分析", False, f"錯誤: {e}")
+            return False
+    
+    def test_story_import(self) -> bool:
+        """測試串流匯入故事（以 gzip 壓縮的 NDJSON 重新匯入既有故事）"""
+        try:
+            stories_response = self.session.get(f"{self.base_url}/api/stories")
+            if stories_response.status_code != 200:
+                self.log_test_result("串流匯入故事", False, "無法獲取故事列表")
+                return False
+            
+            stories = stories_response.json().get("stories", [])
+            if not stories:
+                self.log_test_result("串流匯入故事", True, "沒有可用的故事")
+                return True
+            
+            export_response = self.session.get(f"{self.base_url}/api/stories/{stories[0]['story_id']}/export")
+            if export_response.status_code != 200:
+                self.log_test_result("串流匯入故事", False, f"匯出失敗 HTTP {export_response.status_code}")
+                return False
+            
+            exported = export_response.json()
+            lines = [json.dumps({"title": exported["title"], "author": exported.get("author")}, ensure_ascii=False)]
+            lines.extend(json.dumps(chapter, ensure_ascii=False) for chapter in exported["chapters"])
+            response = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                params={"story_id": "api_test_import", "overwrite": "true"},
+                data=gzip.compress("\n".join(lines).encode("utf-8")),
+                headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+            )
+            if response.status_code != 200:
+                self.log_test_result("串流匯入故事", False, f"HTTP {response.status_code}")
+                return False
+            
+            data = response.json()
+            if not data.get("success") or data.get("imported_chapters") != len(exported["chapters"]):
+                self.log_test_result("串流匯入故事", False, f"匯入結果不正確: {data.get('message')}")
+                return False
+
+            # 重新匯入相同內容不應寫入任何章節；修改一個章節後只更新該章節
+            repeat_data = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                params={"story_id": "api_test_import", "overwrite": "true"},
+                data="\n".join(lines).encode("utf-8"),
+                headers={"Content-Type": "application/x-ndjson"}
+            ).json()
+            if (repeat_data.get("added_chapters"), repeat_data.get("changed_chapters"), repeat_data.get("removed_chapters")) != (0, 0, 0):
+                self.log_test_result("串流匯入故事", False, f"重新匯入相同內容不應有差異: {repeat_data}")
+                return False
+            
+            modified = dict(exported["chapters"][0], content=exported["chapters"][0]["content"] + "（已修訂）")
+            modified_lines = [lines[0], json.dumps(modified, ensure_ascii=False)] + lines[2:]
+            modified_data = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                params={"story_id": "api_test_import", "overwrite": "true"},
+                data="\n".join(modified_lines).encode("utf-8"),
+                headers={"Content-Type": "application/x-ndjson"}
+            ).json()
+            if not modified_data.get("success") or (modified_data.get("added_chapters"), modified_data.get("changed_chapters"), modified_data.get("removed_chapters")) != (0, 1, 0):
+                self.log_test_result("串流匯入故事", False, f"修改一個章節後應只更新該章節: {modified_data}")
+                return False
+            
+            # 驗證失敗（缺少起始章節）時不應寫入任何章節
+            invalid_story = {"story_id": "api_test_import", "title": "無效的故事", "overwrite": True,
+                             "chapters": [chapter for chapter in exported["chapters"] if chapter["id"] != 1]}
+            invalid_response = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                data=json.dumps(invalid_story, ensure_ascii=False).encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+            invalid_data = invalid_response.json()
+            if invalid_data.get("success") or not any(error["code"] == "missing_start_chapter" for error in invalid_data.get("errors", [])):
+                self.log_test_result("串流匯入故事", False, "缺少起始章節的故事應該匯入失敗")
+                return False
+            
+            # 欄位型別錯誤的章節應回傳驗證錯誤，而不是伺服器錯誤
+            mistyped_story = {"story_id": "api_test_import", "title": "型別錯誤的故事", "overwrite": True, "chapters": [
+                {"id": 1, "title": 5, "content": 123, "options": ["oops"]},
+                {"id": 2, "title": "第二章", "content": "這是第二章的內容。", "options": {"text": "前進"}},
+                {"id": 3, "title": "第三章", "content": "這是第三章的內容。", "options": [{"text": "回到開頭", "next_id": [1]}]}
+            ]}
+            mistyped_response = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                data=json.dumps(mistyped_story, ensure_ascii=False).encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+            if mistyped_response.status_code != 200:
+                self.log_test_result("串流匯入故事", False, f"型別錯誤的章節回傳 HTTP {mistyped_response.status_code}")
+                return False
+            
+            mistyped_data = mistyped_response.json()
+            mistyped_codes = {error["code"] for error in mistyped_data.get("errors", [])}
+            if mistyped_data.get("success") or not {"title_type", "content_type", "option_type", "options_type", "next_id_type"} <= mistyped_codes:
+                self.log_test_result("串流匯入故事", False, f"型別錯誤的章節應回報驗證錯誤: {sorted(mistyped_codes)}")
+                return False
+            
+            chapters_response = self.session.get(f"{self.base_url}/api/stories/api_test_import/chapters")
+            if chapters_response.json().get("total") != len(exported["chapters"]):
+                self.log_test_result("串流匯入故事", False, "驗證失敗後原有章節應保持不變")
+                return False
+            
+            details = f"匯入 {data['imported_chapters']} 個章節，{data['warning_count']} 個警告"
+            self.log_test_result("串流匯入故事", True, details)
+            return True
+            
+        except Exception as e:
+            self.log_test_result("串流匯入故事", False, f"錯誤: {e}")
+            return False
+    
+    def test_stream_chunk_boundaries(self) -> bool:
+        """測試串流解析器在任意位置切斷資料時結果都相同（數字被切成 "1." 或 "1e" 時不能提早結束）"""
+        try:
+            from story_stream import StoryStreamParser
+            
+            document = json.dumps({
+                "story_id": "chunk_test", "rating": 1.25, "weight": 3e2,
+                "chapters": [{"id": 1, "title": "開始", "content": "分段解析測試。", "options": []}],
+                "version": 1.5, "count": -12
+            })
+            expected = json.loads(document)
+            for offset in range(1, len(document)):
+                parser = StoryStreamParser()
+                chapters = parser.feed(document[:offset]) + parser.feed(document[offset:]) + parser.close()
+                metadata = {key: value for key, value in expected.items() if key != "chapters"}
+                if chapters != expected["chapters"] or parser.metadata != metadata:
+                    self.log_test_result("串流解析切斷位置", False, f"在位置 {offset} 切斷時結果不同: {parser.metadata}")
+                    return False
+            
+            self.log_test_result("串流解析切斷位置", True, f"{len(document) - 1} 個切斷位置的結果都相同")
+            return True
+            
+        except Exception as e:
+            self.log_test_result("串流解析切斷位置", False, f"錯誤: {e}")
+            return False
+    
+    def test_background_jobs(self) -> bool:
+        """測試背景工作（建立匯出與路徑分析工作、輪詢進度、下載匯出結果）"""
+        try:
+            stories_response = self.session.get(f"{self.base_url}/api/stories")
+            stories = stories_response.json().get("stories", []) if stories_response.status_code == 200 else []
+            if not stories:
+                self.log_test_result("背景工作", True, "沒有可用的故事")
+                return True
+            
+            story_id = stories[0]["story_id"]
+            results = {}
+            for job_type in ("export_story", "analyze_story"):
+                response = self.session.post(f"{self.base_url}/api/jobs", json={"job_type": job_type, "story_id": story_id})
+                if response.status_code != 202:
+                    self.log_test_result("背景工作", False, f"建立 {job_type} 工作失敗 HTTP {response.status_code}")
+                    return False
+                
+                job = response.json()
+                for _ in range(100):
+                    if job["status"] in ("succeeded", "failed", "cancelled"):
+                        break
+                    time.sleep(0.1)
+                    job = self.session.get(f"{self.base_url}/api/jobs/{job['job_id']}").json()
+                
+                if job["status"] != "succeeded":
+                    self.log_test_result("背景工作", False, f"{job_type} 工作未完成: {job['status']} {job.get('error')}")
+                    return False
+                results[job_type] = job
+            
+            download = self.session.get(f"{self.base_url}/api/jobs/{results['export_story']['job_id']}/download")
+            if download.status_code != 200 or len(download.json()["chapters"]) != results["export_story"]["result"]["chapters"]:
+                self.log_test_result("背景工作", False, "下載的匯出檔案與工作結果不符")
+                return False
+            
+            # 已完成的工作不能再取消
+            cancelled = self.session.post(f"{self.base_url}/api/jobs/{results['analyze_story']['job_id']}/cancel").json()
+            if cancelled["status"] != "succeeded":
+                self.log_test_result("背景工作", False, "已完成的工作不應被取消")
+                return False
+            
+            details = f"匯出 {results['export_story']['result']['chapters']} 個章節，路徑數 {results['analyze_story']['result']['total_paths']}"
+            self.log_test_result("背景工作", True, details)
+            return True
+            
+        except Exception as e:
+            self.log_test_result("背景工作", False, f"錯誤: {e}")
+            return False
+    
     def test_story_engine_basic(self) -> bool:
         """測試基本故事引擎功能"""
         try:
@@ -492,6 +719,173 @@ class StoryEngineAPITester:
             self.log_test_result("擲骰測試", False, f"錯誤: {e}")
             return False
     
+    def test_bulk_dice_rolling(self) -> bool:
+        """測試批次擲骰功能"""
+        try:
+            # 測試直方圖模式
+            histogram_payload = {
+                "dice_count": 2,
+                "dice_sides": 6,
+                "modifier": 1,
+                "rolls": 10000
+            }
+            
+            response = self.session.post(f"{self.base_url}/api/roll_dice/bulk", json=histogram_payload)
+            
+            if response.status_code == 200:
+                data = response.json()
+                histogram = {int(total): count for total, count in (data.get("histogram") or {}).items()}
+                
+                if (sum(histogram.values()) == 10000 and
+                    min(histogram) >= 3 and max(histogram) <= 13 and
+                    3 <= data["mean"] <= 13):
+                    self.log_test_result("批次擲骰直方圖", True, f"2d6+1 x 10000，平均 {data['mean']:.2f}")
+                else:
+                    self.log_test_result("批次擲骰直方圖", False, f"直方圖不合理: {histogram}")
+                    return False
+            else:
+                self.log_test_result("批次擲骰直方圖", False, f"HTTP {response.status_code}")
+                return False
+            
+            # 測試逐次結果模式
+            results_payload = {
+                "dice_count": 1,
+                "dice_sides": 20,
+                "rolls": 100,
+                "output": "results"
+            }
+            
+            response = self.session.post(f"{self.base_url}/api/roll_dice/bulk", json=results_payload)
+            
+            if response.status_code == 200:
+                totals = response.json().get("totals") or []
+                if len(totals) == 100 and all(1 <= t <= 20 for t in totals):
+                    self.log_test_result("批次擲骰結果", True, f"1d20 x 100，最大 {max(totals)}")
+                else:
+                    self.log_test_result("批次擲骰結果", False, f"結果不合理: {totals[:10]}")
+                    return False
+            else:
+                self.log_test_result("批次擲骰結果", False, f"HTTP {response.status_code}")
+                return False
+            
+            return True
+            
+        except Exception as e:
+            self.log_test_result("批次擲骰測試", False, f"錯誤: {e}")
+            return False
+    
+    def test_dice_expression(self) -> bool:
+        """測試擲骰表達式功能"""
+        try:
+            payload = {"expression": "2d20kh1+1d4+3"}
+            response = self.session.post(f"{self.base_url}/api/roll_dice/expression", json=payload)
+            
+            if response.status_code == 200:
+                data = response.json()
+                terms = data.get("terms", [])
+                
+                if (len(terms) == 2 and len(terms[0]["kept"]) == 1 and
+                    terms[0]["kept"][0] == max(terms[0]["rolls"]) and
+                    data["total"] == sum(t["subtotal"] for t in terms) + 3):
+                    self.log_test_result("擲骰表達式測試", True, data["description"])
+                else:
+                    self.log_test_result("擲骰表達式測試", False, f"結果不合理: {data}")
+                    return False
+            else:
+                self.log_test_result("擲骰表達式測試", False, f"HTTP {response.status_code}")
+                return False
+            
+            # 測試無效表達式
+            response = self.session.post(f"{self.base_url}/api/roll_dice/expression", json={"expression": "2d"})
+            
+            if response.status_code == 400:
+                self.log_test_result("無效擲骰表達式錯誤處理", True, "正確回傳 400")
+                return True
+            else:
+                self.log_test_result("無效擲骰表達式錯誤處理", False, f"預期 400，實際 {response.status_code}")
+                return False
+            
+        except Exception as e:
+            self.log_test_result("擲骰表達式測試", False, f"錯誤: {e}")
+            return False
+    
+    def test_seeded_dice(self) -> bool:
+        """測試指定亂數種子的可重現擲骰"""
+        try:
+            payload = {"dice_count": 5, "dice_sides": 20, "seed": 20240726, "stream": "session-1:roll-1"}
+            
+            first = self.session.post(f"{self.base_url}/api/roll_dice", json=payload)
+            second = self.session.post(f"{self.base_url}/api/roll_dice", json=payload)
+            
+            if first.status_code != 200 or second.status_code != 200:
+                self.log_test_result("可重現擲骰測試", False, f"HTTP {first.status_code}/{second.status_code}")
+                return False
+            
+            if first.json()["results"] == second.json()["results"]:
+                self.log_test_result("可重現擲骰測試", True, f"相同 seed 與 stream 結果一致: {first.json()['results']}")
+                return True
+            else:
+                self.log_test_result("可重現擲骰測試", False, "相同 seed 與 stream 結果不一致")
+                return False
+            
+        except Exception as e:
+            self.log_test_result("可重現擲骰測試", False, f"錯誤: {e}")
+            return False
+    
+    def test_skill_check(self) -> bool:
+        """測試技能檢定端點（擲骰後直接回傳成功或失敗分支的章節）"""
+        try:
+            story = {"story_id": "api_test_skill_check", "title": "技能檢定測試", "overwrite": True, "chapters": [
+                {"id": 1, "title": "懸崖邊", "content": "你來到懸崖邊，對面有一條繩索。", "options": [
+                    {"text": "抓住繩索盪過去", "check": {"dice": "2d6", "stat": "agility", "difficulty": 9, "success_id": 2, "failure_id": 3}},
+                    {"text": "沿著山路繞過去", "next_id": 2}
+                ]},
+                {"id": 2, "title": "對岸", "content": "你安全抵達了懸崖的另一邊。", "options": []},
+                {"id": 3, "title": "谷底", "content": "你失手跌落，摔進了谷底。", "options": []}
+            ]}
+            import_response = self.session.post(
+                f"{self.base_url}/api/stories/import",
+                data=json.dumps(story, ensure_ascii=False).encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+            if import_response.status_code != 200 or not import_response.json().get("success"):
+                self.log_test_result("技能檢定", False, f"匯入測試故事失敗: {import_response.text[:200]}")
+                return False
+            
+            url = f"{self.base_url}/api/story_engine/api_test_skill_check/1/check"
+            payload = {"game_state": {"agility": 2}, "seed": 20240726, "stream": "session-1:check-1"}
+            first = self.session.post(f"{url}/0", json=payload)
+            second = self.session.post(f"{url}/0", json=payload)
+            if first.status_code != 200 or second.status_code != 200:
+                self.log_test_result("技能檢定", False, f"HTTP {first.status_code}/{second.status_code}")
+                return False
+            
+            data = first.json()
+            expected_id = 2 if data["success"] else 3
+            if data["success"] != (data["total"] >= 9) or data["stat_modifier"] != 2:
+                self.log_test_result("技能檢定", False, f"檢定結果不正確: {data['description']}")
+                return False
+            if data["next_chapter_id"] != expected_id or data["chapter"]["chapter_id"] != expected_id:
+                self.log_test_result("技能檢定", False, f"應前往章節 {expected_id}，實際為 {data['next_chapter_id']}")
+                return False
+            if second.json()["total"] != data["total"] or second.json()["next_chapter_id"] != data["next_chapter_id"]:
+                self.log_test_result("技能檢定", False, "相同 seed 與 stream 的檢定結果不一致")
+                return False
+            
+            # 沒有宣告技能檢定的選項回傳 400，不存在的選項回傳 404
+            no_check = self.session.post(f"{url}/1", json={})
+            out_of_range = self.session.post(f"{url}/5", json={})
+            if no_check.status_code != 400 or out_of_range.status_code != 404:
+                self.log_test_result("技能檢定", False, f"錯誤狀態碼不正確: {no_check.status_code}/{out_of_range.status_code}")
+                return False
+            
+            self.log_test_result("技能檢定", True, f"{data['description']}，前往章節 {expected_id}")
+            return True
+            
+        except Exception as e:
+            self.log_test_result("技能檢定", False, f"錯誤: {e}")
+            return False
+    
     def test_error_handling(self) -> bool:
         """測試錯誤處理"""
         try:
@@ -608,6 +1002,149 @@ class StoryEngineAPITester:
             self.log_test_result("效能測試", False, f"錯誤: {e}")
             return False
     
+    def test_server_timing(self) -> bool:
+        """測試 Server-Timing 標頭（請求帶 X-Server-Timing: 1 時回傳各階段耗時）"""
+        try:
+            stories_response = self.session.get(f"{self.base_url}/api/stories")
+            stories = stories_response.json().get("stories", []) if stories_response.status_code == 200 else []
+            if not stories:
+                self.log_test_result("階段計時標頭", True, "沒有可用的故事")
+                return True
+            
+            response = self.session.post(
+                f"{self.base_url}/api/story_engine/{stories[0]['story_id']}/1",
+                json={"game_state": {}},
+                headers={"X-Server-Timing": "1"}
+            )
+            server_timing = response.headers.get("Server-Timing", "")
+            phases = [entry.split(";")[0].strip() for entry in server_timing.split(",") if entry]
+            expected = ["registry", "chapter_query", "render", "options_decode", "response_model", "serialize", "total"]
+            missing = [name for name in expected if name not in phases]
+            if response.status_code != 200 or missing:
+                self.log_test_result("階段計時標頭", False, f"缺少階段: {missing}")
+                return False
+            
+            self.log_test_result("階段計時標頭", True, server_timing)
+            return True
+            
+        except Exception as e:
+            self.log_test_result("階段計時標頭", False, f"錯誤: {e}")
+            return False
+    
+    def test_query_count(self) -> bool:
+        """測試章節請求的資料庫查詢次數（故事查詢與章節查詢各一次，沒有 N+1 查詢）"""
+        try:
+            stories_response = self.session.get(f"{self.base_url}/api/stories")
+            stories = stories_response.json().get("stories", []) if stories_response.status_code == 200 else []
+            if not stories:
+                self.log_test_result("查詢次數上限", True, "沒有可用的故事")
+                return True
+            
+            story_id = stories[0]["story_id"]
+            endpoints = [
+                ("POST", f"/api/story_engine/{story_id}/1", 2),
+                ("GET", f"/api/stories/{story_id}/chapters", 2),
+                ("GET", "/api/stories", 1)
+            ]
+            counts = []
+            for method, path, budget in endpoints:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}",
+                    json={"game_state": {}} if method == "POST" else None,
+                    headers={"X-Server-Timing": "1"}
+                )
+                count = response.headers.get("X-DB-Query-Count")
+                if response.status_code != 200 or count is None or int(count) > budget:
+                    self.log_test_result("查詢次數上限", False, f"{method} {path} 執行了 {count} 次查詢（上限 {budget}）")
+                    return False
+                counts.append(f"{path}: {count}")
+            
+            self.log_test_result("查詢次數上限", True, ", ".join(counts))
+            return True
+            
+        except Exception as e:
+            self.log_test_result("查詢次數上限", False, f"錯誤: {e}")
+            return False
+    
+    def test_admin_profile(self) -> bool:
+        """測試取樣分析端點（沒有管理者權杖時必須拒絕；設定 ADMIN_TOKEN 環境變數時執行一次短時間取樣）"""
+        try:
+            response = self.session.post(f"{self.base_url}/api/admin/profile", params={"seconds": 0.1})
+            if response.status_code not in (403, 404):
+                self.log_test_result("取樣分析端點", False, f"沒有權杖的請求應被拒絕，實際 HTTP {response.status_code}")
+                return False
+            
+            admin_token = os.environ.get("ADMIN_TOKEN")
+            if not admin_token:
+                self.log_test_result("取樣分析端點", True, "未設定 ADMIN_TOKEN，只驗證權限檢查")
+                return True
+            
+            response = self.session.post(
+                f"{self.base_url}/api/admin/profile",
+                params={"seconds": 0.5, "interval_ms": 2, "include_idle": "true"},
+                headers={"X-Admin-Token": admin_token}
+            )
+            samples = int(response.headers.get("X-Profile-Samples", 0))
+            if response.status_code != 200 or not samples:
+                self.log_test_result("取樣分析端點", False, f"HTTP {response.status_code}，取樣 {samples} 次")
+                return False
+            
+            self.log_test_result("取樣分析端點", True, f"取樣 {samples} 次，{len(response.text.splitlines())} 個不同的堆疊")
+            return True
+            
+        except Exception as e:
+            self.log_test_result("取樣分析端點", False, f"錯誤: {e}")
+            return False
+    
+    def test_metrics(self) -> bool:
+        """測試效能指標端點（在其他測試之後執行，確認請求與查詢都有被記錄）"""
+        try:
+            response = self.session.get(f"{self.base_url}/metrics")
+            if response.status_code != 200:
+                self.log_test_result("效能指標", False, f"HTTP {response.status_code}")
+                return False
+            
+            metrics = response.text
+            expected = [
+                'story_http_requests_total{method="POST",route="/api/story_engine/{story_id}/{chapter_id}",status="200"}',
+                'story_http_request_duration_seconds_bucket{method="POST",route="/api/story_engine/{story_id}/{chapter_id}",le="+Inf"}',
+                'story_db_queries_total{operation="select"}',
+                'story_condition_render_seconds_count',
+                'story_cache_hit_ratio{cache="parse_condition"}'
+            ]
+            missing = [name for name in expected if name not in metrics]
+            if missing:
+                self.log_test_result("效能指標", False, f"缺少指標: {missing}")
+                return False
+            
+            self.log_test_result("效能指標", True, f"共 {metrics.count(chr(10))} 行指標")
+            return True
+            
+        except Exception as e:
+            self.log_test_result("效能指標", False, f"錯誤: {e}")
+            return False
+    
+    def test_loop_lag(self) -> bool:
+        """測試事件迴圈延遲指標"""
+        try:
+            response = self.session.get(f"{self.base_url}/metrics")
+            if response.status_code != 200:
+                self.log_test_result("事件迴圈延遲", False, f"HTTP {response.status_code}")
+                return False
+            
+            quantiles = [line for line in response.text.splitlines()
+                         if line.startswith("story_event_loop_lag_quantile_seconds{")]
+            if "story_event_loop_lag_seconds_count" not in response.text or not quantiles:
+                self.log_test_result("事件迴圈延遲", False, "缺少事件迴圈延遲指標（LOOP_MONITOR 是否停用？）")
+                return False
+            
+            self.log_test_result("事件迴圈延遲", True, quantiles[-1])
+            return True
+            
+        except Exception as e:
+            self.log_test_result("事件迴圈延遲", False, f"錯誤: {e}")
+            return False
+    
     def run_all_tests(self) -> bool:
         """執行所有測試"""
         logger.info("🚀 開始 Story Engine API 測試")
@@ -620,12 +1157,25 @@ class StoryEngineAPITester:
             ("列出故事功能", self.test_list_stories),
             ("取得故事資訊", self.test_get_story_info),
             ("取得故事章節", self.test_get_story_chapters),
+            ("故事路徑分析", self.test_story_analytics),
+            ("串流匯入故事", self.test_story_import),
+            ("串流解析切斷位置", self.test_stream_chunk_boundaries),
+            ("背景工作", self.test_background_jobs),
             ("故事引擎基本功能", self.test_story_engine_basic),
             ("條件內容處理", self.test_conditional_content),
             ("數值比較條件", self.test_numeric_conditions),
             ("擲骰功能", self.test_dice_rolling),
+            ("批次擲骰功能", self.test_bulk_dice_rolling),
+            ("擲骰表達式", self.test_dice_expression),
+            ("可重現擲骰", self.test_seeded_dice),
+            ("技能檢定", self.test_skill_check),
             ("錯誤處理", self.test_error_handling),
-            ("API 效能", self.test_performance)
+            ("API 效能", self.test_performance),
+            ("階段計時標頭", self.test_server_timing),
+            ("查詢次數上限", self.test_query_count),
+            ("取樣分析端點", self.test_admin_profile),
+            ("效能指標", self.test_metrics),
+            ("事件迴圈延遲", self.test_loop_lag)
         ]
         
         passed = 0
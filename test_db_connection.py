@@ -8,9 +8,16 @@
 import os
 import sys
 import json
-from sqlalchemy import create_engine, text, inspect
+import time
+import random
+import argparse
+import statistics
+import tempfile
+from typing import Dict, List
+from sqlalchemy import create_engine, event, text, inspect
 from sqlalchemy.orm import sessionmaker
-from models import Base, StoryRegistry, create_story_table_in_db, get_story_table
+from models import Base, StoryRegistry, create_story_table, create_story_table_in_db, get_story_table
+from story_generator import iter_chapters
 import logging
 
 # 設定日誌
@@ -428,8 +435,247 @@ class DatabaseTester:
             logger.error(f"⚠️ 有 {failed} 個測試失敗，請檢查資料庫設定。")
             return False
 
+# 效能測試矩陣：SQLite 的 journal_mode 與 synchronous 組合
+SQLITE_JOURNAL_MODES = ["DELETE", "WAL"]
+SQLITE_SYNCHRONOUS = ["FULL", "NORMAL", "OFF"]
+BENCHMARK_OPERATIONS = ["bulk_insert", "commit_writes", "registry_lookup", "point_read", "json_read", "full_scan"]
+
+def sqlite_engine(path: str, journal_mode: str, synchronous: str):
+    """建立指定 journal_mode 與 synchronous 設定的 SQLite 引擎"""
+    engine = create_engine(f"sqlite:///{path}")
+    
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+    
+    return engine
+
+class DatabaseBenchmark:
+    """資料庫效能測試矩陣：在不同的資料庫設定與故事大小下計時主要的存取模式"""
+    
+    def __init__(self, sizes: List[int], iterations: int = 2000, commits: int = 200, runs: int = 5, seed: int = 42):
+        self.sizes = sizes
+        self.iterations = iterations
+        self.commits = commits
+        self.runs = runs
+        self.seed = seed
+        # 故事大小 -> 資料庫設定 -> 存取模式 -> 每秒次數的中位數與範圍
+        self.results: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {}
+        self.failures: List[str] = []
+    
+    def run_variant(self, name: str, engine, size: int) -> Dict[str, float]:
+        """在一個資料庫設定上建立指定大小的故事並計時每一種存取模式（每秒次數）"""
+        story_id = f"db_benchmark_{size}"
+        table_name = f"story_{story_id}"
+        # 重複呼叫 create_story_table 會在同一個 Table 上重複加入索引，已存在時直接使用
+        table = Base.metadata.tables[table_name] if table_name in Base.metadata.tables else create_story_table(story_id)
+        StoryRegistry.__table__.create(bind=engine, checkfirst=True)
+        table.drop(bind=engine, checkfirst=True)
+        table.create(bind=engine)
+        Session = sessionmaker(bind=engine)
+        rng = random.Random(self.seed)
+        timings: Dict[str, float] = {}
+        
+        session = Session()
+        try:
+            session.query(StoryRegistry).filter_by(story_id=story_id).delete()
+            session.add(StoryRegistry(story_id=story_id, table_name=table_name, title="效能測試故事"))
+            session.commit()
+            
+            # 批次寫入：整個故事在一個交易中以 executemany 寫入
+            rows = [
+                {"id": chapter["id"], "title": chapter["title"], "content": chapter["content"],
+                 "options": json.dumps(chapter["options"], ensure_ascii=False)}
+                for chapter in iter_chapters(size, self.seed, content_length=300)
+            ]
+            insert_sql = text(f"INSERT INTO {table_name} (id, title, content, options) VALUES (:id, :title, :content, :options)")
+            started = time.perf_counter()
+            session.execute(insert_sql, rows)
+            session.commit()
+            timings["bulk_insert"] = size / (time.perf_counter() - started)
+            
+            # 逐筆提交：每次更新一個章節並提交（反映 synchronous 與 journal_mode 的差異）
+            update_sql = text(f"UPDATE {table_name} SET title = :title WHERE id = :id")
+            started = time.perf_counter()
+            for index in range(self.commits):
+                session.execute(update_sql, {"title": f"章節 {index}", "id": rng.randint(1, size)})
+                session.commit()
+            timings["commit_writes"] = self.commits / (time.perf_counter() - started)
+            
+            # 故事查詢：與章節請求相同的 ORM 查詢
+            started = time.perf_counter()
+            for _ in range(self.iterations):
+                session.query(StoryRegistry).filter(
+                    StoryRegistry.story_id == story_id,
+                    StoryRegistry.is_active == "true"
+                ).first()
+            timings["registry_lookup"] = self.iterations / (time.perf_counter() - started)
+            session.commit()
+            
+            # 單一章節讀取
+            select_sql = text(f"SELECT * FROM {table_name} WHERE id = :chapter_id")
+            started = time.perf_counter()
+            for _ in range(self.iterations):
+                session.execute(select_sql, {"chapter_id": rng.randint(1, size)}).fetchone()
+            timings["point_read"] = self.iterations / (time.perf_counter() - started)
+            
+            # JSON 欄位讀取：只讀取選項並解析
+            options_sql = text(f"SELECT options FROM {table_name} WHERE id = :chapter_id")
+            started = time.perf_counter()
+            for _ in range(self.iterations):
+                options = session.execute(options_sql, {"chapter_id": rng.randint(1, size)}).scalar()
+                if isinstance(options, str):
+                    json.loads(options)
+            timings["json_read"] = self.iterations / (time.perf_counter() - started)
+            
+            # 全故事掃描（驗證、分析與匯出的存取模式），以每秒章節數表示
+            started = time.perf_counter()
+            scanned = len(session.execute(text(f"SELECT id, title, content, options FROM {table_name}")).fetchall())
+            timings["full_scan"] = scanned / (time.perf_counter() - started)
+            session.commit()
+        finally:
+            session.query(StoryRegistry).filter_by(story_id=story_id).delete()
+            session.commit()
+            session.close()
+            table.drop(bind=engine, checkfirst=True)
+        
+        return timings
+    
+    def run(self, urls: List[str], sqlite_variants: bool = True) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        """執行效能測試矩陣：每種故事大小 × 每個資料庫設定，各執行 runs 次
+
+        每一輪依序執行所有設定，機器負載的短暫變化會分散到各個設定，而不是集中在某一個
+        """
+        with tempfile.TemporaryDirectory(prefix="story_db_benchmark_") as temp_dir:
+            for size in self.sizes:
+                logger.info(f"\n📚 故事大小: {size:,} 章（每個設定執行 {self.runs} 次）")
+                
+                variants = []
+                if sqlite_variants:
+                    for journal_mode in SQLITE_JOURNAL_MODES:
+                        for synchronous in SQLITE_SYNCHRONOUS:
+                            name = f"sqlite journal={journal_mode} sync={synchronous}"
+                            path = os.path.join(temp_dir, f"{journal_mode}_{synchronous}_{size}.db")
+                            variants.append((name, lambda path=path, j=journal_mode, s=synchronous: sqlite_engine(path, j, s)))
+                for url in urls:
+                    variants.append((mask_url(url), lambda url=url: create_engine(url, pool_pre_ping=True)))
+                
+                samples: Dict[str, Dict[str, List[float]]] = {name: {operation: [] for operation in BENCHMARK_OPERATIONS} for name, _ in variants}
+                failed = set()
+                for _ in range(self.runs):
+                    for name, make_engine in variants:
+                        if name in failed:
+                            continue
+                        engine = make_engine()
+                        try:
+                            for operation, rate in self.run_variant(name, engine, size).items():
+                                samples[name][operation].append(rate)
+                        except Exception as e:
+                            logger.error(f"❌ {name} 效能測試失敗: {e}")
+                            self.failures.append(f"{size}: {name}")
+                            failed.add(name)
+                        finally:
+                            engine.dispose()
+                
+                size_results = self.results.setdefault(str(size), {})
+                for name, operations in samples.items():
+                    if name in failed:
+                        continue
+                    size_results[name] = {operation: summarize_rates(rates) for operation, rates in operations.items()}
+                    logger.info(f"   • {name:<32} " + "  ".join(
+                        f"{operation} {stats['median']:>10,.0f}/s ±{spread(stats):.0%}"
+                        for operation, stats in size_results[name].items()
+                    ))
+        
+        return self.results
+    
+    def best_variants(self) -> Dict[str, Dict[str, Dict[str, object]]]:
+        """每種故事大小下，各存取模式最快的資料庫設定
+
+        只有最快設定的最小值仍高於其他所有設定的最大值（差距大於測量的範圍）才列為 winner，
+        否則 winner 為 None，tied 列出範圍與最快設定重疊的所有設定
+        """
+        best = {}
+        for size, variants in self.results.items():
+            best[size] = {}
+            for operation in BENCHMARK_OPERATIONS:
+                if not variants:
+                    continue
+                ranked = sorted(variants, key=lambda name: variants[name][operation]["median"], reverse=True)
+                fastest = variants[ranked[0]][operation]
+                tied = [name for name in ranked if variants[name][operation]["max"] >= fastest["min"]]
+                best[size][operation] = {"winner": ranked[0] if len(tied) == 1 else None, "tied": tied}
+        return best
+
+def summarize_rates(rates: List[float]) -> Dict[str, float]:
+    """多次執行的每秒次數：中位數與範圍"""
+    return {"median": statistics.median(rates), "min": min(rates), "max": max(rates), "runs": len(rates)}
+
+def spread(stats: Dict[str, float]) -> float:
+    """範圍相對於中位數的一半（顯示為 ±）"""
+    return (stats["max"] - stats["min"]) / 2 / stats["median"] if stats["median"] else 0.0
+
+def mask_url(url: str) -> str:
+    """隱藏連線 URL 中的帳號密碼"""
+    if "@" not in url:
+        return url
+    scheme, rest = url.split("://", 1)
+    return f"{scheme}://***@{rest.split('@', 1)[1]}"
+
+def run_benchmark(args) -> bool:
+    """執行資料庫效能測試矩陣並輸出結果"""
+    sizes = [int(size) for size in args.sizes.split(",")]
+    urls = list(args.url or [])
+    database_url = get_database_url()
+    # 設定的資料庫不是 SQLite 時一併測試（SQLite 已由各種設定組合涵蓋）
+    if database_url and not database_url.startswith("sqlite") and database_url not in urls:
+        urls.append(database_url)
+    
+    benchmark = DatabaseBenchmark(sizes, iterations=args.iterations, commits=args.commits, runs=args.runs)
+    logger.info("🚀 開始資料庫效能測試矩陣")
+    logger.info(f"📊 故事大小: {sizes}，每項讀取 {args.iterations} 次，逐筆提交 {args.commits} 次，每個設定執行 {args.runs} 次")
+    results = benchmark.run(urls, sqlite_variants=not args.no_sqlite)
+    
+    logger.info("\n🏆 各存取模式最快的設定（差距小於測量範圍時不判定）:")
+    best = benchmark.best_variants()
+    for size, operations in best.items():
+        for operation, ranking in operations.items():
+            if ranking["winner"]:
+                logger.info(f"   • {size:>8} 章 {operation:<16} {ranking['winner']}")
+            elif len(ranking["tied"]) == len(results[size]):
+                logger.info(f"   • {size:>8} 章 {operation:<16} 無明顯差異（所有設定的範圍重疊）")
+            else:
+                logger.info(f"   • {size:>8} 章 {operation:<16} 無明顯差異（{len(ranking['tied'])} 個設定的範圍重疊: {', '.join(ranking['tied'])}）")
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"sizes": sizes, "results": results, "best": best}, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 結果已寫入 {args.output}")
+    
+    return not benchmark.failures
+
 def main():
     """主函數"""
+    parser = argparse.ArgumentParser(description="資料庫連線測試與效能測試矩陣")
+    parser.add_argument("--benchmark", action="store_true", help="執行效能測試矩陣（SQLite 設定組合與設定的資料庫）")
+    parser.add_argument("--sizes", default="1000,10000", help="故事大小（章節數），以逗號分隔（預設 1000,10000）")
+    parser.add_argument("--iterations", type=int, default=2000, help="每項讀取測試的次數（預設 2000）")
+    parser.add_argument("--commits", type=int, default=200, help="逐筆提交測試的次數（預設 200）")
+    parser.add_argument("--runs", type=int, default=5, help="每個設定執行的次數，結果取中位數（預設 5）")
+    parser.add_argument("--url", action="append", help="額外測試的資料庫連線 URL（可重複指定）")
+    parser.add_argument("--no-sqlite", action="store_true", help="不測試 SQLite 設定組合")
+    parser.add_argument("-o", "--output", help="將效能測試結果寫入 JSON 檔案")
+    
+    args = parser.parse_args()
+    
+    if args.benchmark:
+        print("⏱️ Story Engine Database Benchmark")
+        print("=" * 60)
+        sys.exit(0 if run_benchmark(args) else 1)
+    
     print("🔧 Story Engine Database Connection Tester v2.0")
     print("支援多表資料庫架構和動態表創建")
     print("=" * 60)